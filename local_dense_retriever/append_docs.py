@@ -0,0 +1,92 @@
+"""
+Append new documents to a dense index + corpus store without a rebuild, and merge them later.
+
+New docs get the next doc ids and go into a Flat delta index that retrieval_server.py searches
+alongside the main one (--delta_index_path). Existing ids never change.
+
+Append through a running server (no restart, results visible immediately):
+    python append_docs.py --docs_path new_pages.jsonl --server_url http://127.0.0.1:8000
+
+Append offline (the server picks the docs up on its next start):
+    python append_docs.py --docs_path new_pages.jsonl --index_path e5_Flat.index --corpus_path wiki-18.store \
+        --delta_index_path e5_Flat.delta.index --retriever_model intfloat/e5-base-v2
+
+Fold the delta into a new main index (then serve --index_path merged.index without the old delta):
+    python append_docs.py --merge --index_path e5_Flat.index --delta_index_path e5_Flat.delta.index \
+        --output_index_path merged.index
+"""
+
+import argparse
+import json
+import os
+
+import faiss
+import requests
+from tqdm import tqdm
+
+from faiss_index import flat_index_vectors
+
+
+def read_docs(docs_path: str) -> list[dict]:
+    with open(docs_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def merge_delta(index_path: str, delta_index_path: str, output_index_path: str):
+    index = faiss.read_index(index_path)
+    delta = faiss.read_index(delta_index_path)
+    # delta row i is doc id index.ntotal + i, so adding in order keeps every id stable
+    index.add(flat_index_vectors(delta))
+    faiss.write_index(index, output_index_path + ".tmp")
+    os.replace(output_index_path + ".tmp", output_index_path)
+    os.remove(delta_index_path)
+    print(f"Merged {delta.ntotal} delta vectors into {output_index_path} ({index.ntotal} total)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append documents to a dense index and corpus store.")
+    parser.add_argument("--docs_path", type=str, default=None, help="JSONL of new docs with a 'contents' field.")
+    parser.add_argument("--server_url", type=str, default=None, help="Append through a running server.")
+    parser.add_argument("--batch_size", type=int, default=256, help="Docs per /append request.")
+    parser.add_argument("--index_path", type=str, default=None, help="Main index.")
+    parser.add_argument("--corpus_path", type=str, default=None, help="Corpus store directory.")
+    parser.add_argument("--delta_index_path", type=str, default=None, help="Delta index of appended docs.")
+    parser.add_argument("--retriever_name", type=str, default="e5", help="Name of the retriever model.")
+    parser.add_argument("--retriever_model", type=str, default="intfloat/e5-base-v2", help="Path of the model.")
+    parser.add_argument("--retriever_device", type=str, default=None, help="Encoder device.")
+    parser.add_argument("--merge", action="store_true", help="Merge the delta into --output_index_path.")
+    parser.add_argument("--output_index_path", type=str, default=None, help="Where --merge writes the new index.")
+    args = parser.parse_args()
+
+    if args.merge:
+        if not (args.index_path and args.delta_index_path and args.output_index_path):
+            parser.error("--merge needs --index_path, --delta_index_path and --output_index_path")
+        merge_delta(args.index_path, args.delta_index_path, args.output_index_path)
+    elif args.server_url is not None:
+        docs = read_docs(args.docs_path)
+        session = requests.Session()
+        url = args.server_url.rstrip("/") + "/append"
+        num_docs = None
+        for start in tqdm(range(0, len(docs), args.batch_size), desc="Appending: "):
+            response = session.post(url, json={"documents": docs[start : start + args.batch_size]})
+            response.raise_for_status()
+            num_docs = response.json()["num_docs"]
+        print(f"Appended {len(docs)} docs, corpus now has {num_docs}")
+    else:
+        if not (args.docs_path and args.index_path and args.corpus_path and args.delta_index_path):
+            parser.error("Offline appends need --docs_path, --index_path, --corpus_path and --delta_index_path")
+        from retrieval_server import Config, DenseRetriever
+
+        config = Config(
+            retrieval_method=args.retriever_name,
+            index_path=args.index_path,
+            corpus_path=args.corpus_path,
+            faiss_gpu=False,
+            faiss_mmap=True,
+            retrieval_model_path=args.retriever_model,
+            retrieval_device=args.retriever_device,
+            delta_index_path=args.delta_index_path,
+        )
+        retriever = DenseRetriever(config)
+        ids = retriever.append_documents(read_docs(args.docs_path))
+        print(f"Appended docs {ids[0]}..{ids[-1]}" if ids else "No docs to append")
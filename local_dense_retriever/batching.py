@@ -0,0 +1,315 @@
+import asyncio
+import math
+import time
+from collections import Counter, deque
+from typing import Optional, Union
+
+from metrics import BATCH_SIZE, collect_stages
+
+# Highest priority first; each lane has its own bounded queue.
+PRIORITIES = ("interactive", "training", "validation", "bulk")
+
+
+class QueueFullError(Exception):
+    """Raised by MicroBatcher.submit when the request's priority lane is full."""
+
+    def __init__(self, priority: str, retry_after: int):
+        super().__init__(f"{priority} queue is full, retry after {retry_after}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class RequestTooLargeError(ValueError):
+    """Raised by MicroBatcher.submit for a request that could never fit in its priority lane."""
+
+    def __init__(self, num_queries: int, max_queue_queries: int):
+        super().__init__(f"Request has {num_queries} queries, at most {max_queue_queries} can be queued at once")
+        self.num_queries = num_queries
+        self.max_queue_queries = max_queue_queries
+
+
+class _PendingRequest:
+    """One submit() call; resolved once every one of its chunks has been searched."""
+
+    def __init__(self, num_queries: int, num_chunks: int, future: asyncio.Future, timings: Optional[dict]):
+        self.results = [None] * num_queries
+        self.scores = [None] * num_queries
+        self.chunks_queued = num_chunks
+        self.chunks_left = num_chunks
+        self.future = future
+        self.timings = timings
+        self.enqueued_at = time.perf_counter()
+
+
+class _Chunk:
+    """At most max_batch_size consecutive queries of a request, queued in its priority lane."""
+
+    def __init__(
+        self,
+        request: _PendingRequest,
+        offset: int,
+        queries: list[str],
+        topks: list[int],
+        min_scores: list[Optional[float]],
+        search_kwargs: dict,
+    ):
+        self.request = request
+        self.offset = offset
+        self.queries = queries
+        self.topks = topks
+        self.min_scores = min_scores
+        self.search_kwargs = search_kwargs
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent /retrieve requests into one retriever call.
+
+    Requests are collected until either `max_batch_size` queries are pending or
+    `max_wait_ms` has elapsed since the first one arrived. The merged batch is searched
+    once at the largest requested topk (in a worker thread, so the event loop keeps
+    accepting requests) and each request gets back its own slice of the results.
+    Per-query topks and min_score cutoffs are handed to the retriever, which applies them
+    to the shared search. Requests with different search kwargs (e.g. nprobe) are searched
+    as separate groups.
+
+    Each request is queued in a priority lane (see PRIORITIES) as chunks of at most
+    `max_batch_size` queries, and every batch is filled from the highest non-empty lane first,
+    so a large validation or bulk request is searched chunk by chunk with interactive and
+    training work in between. A request that would push its lane past `max_queue_queries`
+    queued queries is rejected with QueueFullError instead of piling up, and one that is
+    larger than the bound on its own with RequestTooLargeError.
+    """
+
+    def __init__(
+        self,
+        search_fn,
+        max_batch_size: int = 512,
+        max_wait_ms: float = 5.0,
+        max_queue_queries: int = 4096,
+        default_priority: str = "training",
+    ):
+        # search_fn(query_list, num, topks=None, min_scores=None, **search_kwargs) -> (results, scores)
+        self.search_fn = search_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_queries = max_queue_queries
+        self.default_priority = default_priority
+
+        self.batch_size_hist = Counter()
+        self.num_batches = 0
+        self.num_requests = 0
+        self.num_queries = 0
+        self.search_time = 0.0
+
+        self._lanes = {priority: deque() for priority in PRIORITIES}
+        self._lane_queries = {priority: 0 for priority in PRIORITIES}
+        self._lane_requests = {priority: 0 for priority in PRIORITIES}
+        self._rejected = Counter()
+        self._arrived = None
+        self._worker = None
+
+    async def start(self):
+        self._arrived = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(
+        self,
+        query_list: list[str],
+        num: Union[int, list[int]],
+        timings: Optional[dict] = None,
+        min_score: Union[None, float, list[Optional[float]]] = None,
+        priority: Optional[str] = None,
+        **search_kwargs,
+    ):
+        """
+        Search `query_list` as part of the next batch. `num` and `min_score` are either one value
+        for the whole request or one per query. If `timings` is given it is filled with the queue
+        wait, the batch size and the stage times (seconds) of the batch that served it.
+        Raises QueueFullError when the priority lane is full, RequestTooLargeError when the request
+        alone exceeds the lane bound and ValueError for unknown lanes.
+        """
+        if not query_list:
+            return [], []
+        priority = priority or self.default_priority
+        if priority not in self._lanes:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {PRIORITIES}")
+        if len(query_list) > self.max_queue_queries:
+            self._rejected[priority] += 1
+            raise RequestTooLargeError(len(query_list), self.max_queue_queries)
+        if self._lane_queries[priority] + len(query_list) > self.max_queue_queries:
+            self._rejected[priority] += 1
+            raise QueueFullError(priority, self._retry_after(priority))
+        topks = list(num) if isinstance(num, (list, tuple)) else [num] * len(query_list)
+        min_scores = list(min_score) if isinstance(min_score, (list, tuple)) else [min_score] * len(query_list)
+        search_kwargs = {k: v for k, v in search_kwargs.items() if v is not None}
+        future = asyncio.get_running_loop().create_future()
+        starts = range(0, len(query_list), self.max_batch_size)
+        request = _PendingRequest(len(query_list), len(starts), future, timings)
+        for start in starts:
+            end = start + self.max_batch_size
+            self._lanes[priority].append(
+                _Chunk(request, start, query_list[start:end], topks[start:end], min_scores[start:end], search_kwargs)
+            )
+        self._lane_queries[priority] += len(query_list)
+        self._lane_requests[priority] += 1
+        self._arrived.set()
+        return await future
+
+    def _retry_after(self, priority: str) -> int:
+        # queries ahead in this lane and above it, at the observed batch throughput
+        ahead = 0
+        for lane in PRIORITIES:
+            ahead += self._lane_queries[lane]
+            if lane == priority:
+                break
+        batch_s = self.search_time / self.num_batches if self.num_batches else 1.0
+        return max(1, math.ceil(ahead / self.max_batch_size * batch_s))
+
+    def _take(self, pending: list[_Chunk], num_queries: int) -> int:
+        # whole chunks only, so a batch never exceeds max_batch_size and the lanes are
+        # re-checked before every batch
+        for lane in PRIORITIES:
+            queue = self._lanes[lane]
+            while queue and num_queries + len(queue[0].queries) <= self.max_batch_size:
+                chunk = queue.popleft()
+                self._lane_queries[lane] -= len(chunk.queries)
+                chunk.request.chunks_queued -= 1
+                if chunk.request.chunks_queued == 0:
+                    self._lane_requests[lane] -= 1
+                if chunk.request.future.done():
+                    # an earlier chunk failed or the caller went away
+                    continue
+                pending.append(chunk)
+                num_queries += len(chunk.queries)
+        return num_queries
+
+    async def _collect(self) -> list[_Chunk]:
+        loop = asyncio.get_running_loop()
+        while not any(self._lanes.values()):
+            self._arrived.clear()
+            await self._arrived.wait()
+        pending = []
+        num_queries = self._take(pending, 0)
+        if not pending:
+            return pending
+        deadline = loop.time() + self.max_wait
+        while num_queries < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+            num_queries = self._take(pending, num_queries)
+        return pending
+
+    async def _run(self):
+        while True:
+            pending = await self._collect()
+            if not pending:
+                continue
+            groups = {}
+            for item in pending:
+                groups.setdefault(tuple(sorted(item.search_kwargs.items())), []).append(item)
+            for group in groups.values():
+                await self._dispatch(group)
+
+    async def _dispatch(self, pending: list[_Chunk]):
+        loop = asyncio.get_running_loop()
+        query_list = [q for item in pending for q in item.queries]
+        topks = [k for item in pending for k in item.topks]
+        min_scores = [m for item in pending for m in item.min_scores]
+        num = max(topks)
+        search_kwargs = dict(pending[0].search_kwargs)
+        # one search at the largest topk; only pass per-query cutoffs when they differ from it
+        if any(k != num for k in topks):
+            search_kwargs["topks"] = topks
+        if any(m is not None for m in min_scores):
+            search_kwargs["min_scores"] = min_scores
+
+        t0 = time.perf_counter()
+        try:
+            results, scores, stages = await loop.run_in_executor(
+                None, self._timed_search, query_list, num, search_kwargs
+            )
+        except Exception as e:
+            for item in pending:
+                if not item.request.future.done():
+                    item.request.future.set_exception(e)
+            return
+        batch_time = time.perf_counter() - t0
+        self.search_time += batch_time
+        self._record(len(query_list))
+
+        offset = 0
+        for item in pending:
+            request = item.request
+            if request.timings is not None:
+                # a request split over several batches reports the wait before its first one,
+                # summed batch and stage times, and the largest batch it was part of
+                request.timings.setdefault("queue", t0 - request.enqueued_at)
+                for name, value in stages.items():
+                    request.timings[name] = request.timings.get(name, 0.0) + value
+                request.timings["batch"] = request.timings.get("batch", 0.0) + batch_time
+                request.timings["batch_size"] = max(request.timings.get("batch_size", 0), len(query_list))
+            end = offset + len(item.queries)
+            request.results[item.offset : item.offset + len(item.queries)] = [
+                r[:k] for r, k in zip(results[offset:end], item.topks)
+            ]
+            request.scores[item.offset : item.offset + len(item.queries)] = [
+                s[:k] for s, k in zip(scores[offset:end], item.topks)
+            ]
+            offset = end
+            request.chunks_left -= 1
+            if request.chunks_left == 0 and not request.future.done():
+                self.num_requests += 1
+                request.future.set_result((request.results, request.scores))
+
+    def _timed_search(self, query_list: list[str], num: int, search_kwargs: dict):
+        with collect_stages() as stages:
+            results, scores = self.search_fn(query_list, num, **search_kwargs)
+        return results, scores, dict(stages)
+
+    def _record(self, num_queries: int):
+        BATCH_SIZE.observe(num_queries)
+        self.num_batches += 1
+        self.num_queries += num_queries
+        # power-of-two buckets: "1", "2", "4", ... keyed by upper bound
+        bucket = 1
+        while bucket < num_queries:
+            bucket *= 2
+        self.batch_size_hist[bucket] += 1
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "num_batches": self.num_batches,
+            "num_requests": self.num_requests,
+            "num_queries": self.num_queries,
+            "avg_batch_size": self.num_queries / self.num_batches if self.num_batches else 0.0,
+            "avg_search_ms": 1000.0 * self.search_time / self.num_batches if self.num_batches else 0.0,
+            "queue_depth": sum(self._lane_requests.values()),
+            "max_queue_queries": self.max_queue_queries,
+            "lanes": {
+                lane: {
+                    "queued_requests": self._lane_requests[lane],
+                    "queued_queries": self._lane_queries[lane],
+                    "rejected": self._rejected[lane],
+                }
+                for lane in PRIORITIES
+            },
+            "batch_size_hist": {f"<={k}": v for k, v in sorted(self.batch_size_hist.items())},
+        }
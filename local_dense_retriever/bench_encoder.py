@@ -0,0 +1,95 @@
+"""
+CPU benchmark of the query encoder: fp32 vs dynamic int8 across batch sizes.
+
+Queries are drawn from --query_file if given, otherwise synthesised with the 3 to 25
+word lengths our policy emits in <text_search>. For int8 it also reports the mean cosine
+similarity to the fp32 embeddings, as a quick check that quantization keeps retrieval quality.
+
+    python bench_encoder.py --retriever_model intfloat/e5-base-v2 --batch_sizes 1 8 32 128 --num_threads 8
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from retrieval_server import Encoder
+
+WORDS = (
+    "history of the castle and its commissioners who founded first national park river battle "
+    "album released singer born population capital city university president war award film "
+    "director novel author team won championship season company headquarters located"
+).split()
+
+
+def synthetic_queries(num_queries: int, min_words: int, max_words: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(min_words, max_words))) for _ in range(num_queries)]
+
+
+def bench(encoder: Encoder, queries: list[str], batch_size: int, warmup: int = 2):
+    for _ in range(warmup):
+        encoder.encode(queries[:batch_size])
+
+    embs = []
+    latencies = []
+    for start_idx in range(0, len(queries), batch_size):
+        t0 = time.perf_counter()
+        embs.append(encoder.encode(queries[start_idx : start_idx + batch_size]))
+        latencies.append(time.perf_counter() - t0)
+    latencies_ms = 1000.0 * np.asarray(latencies)
+    return np.concatenate(embs), {
+        "qps": len(queries) / latencies_ms.sum() * 1000.0,
+        "p50_batch_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_batch_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fp32 vs int8 CPU query encoding.")
+    parser.add_argument("--retriever_name", type=str, default="e5", help="Name of the retriever model.")
+    parser.add_argument(
+        "--retriever_model", type=str, default="intfloat/e5-base-v2", help="Path of the retriever model."
+    )
+    parser.add_argument("--query_file", type=str, default=None, help="One query per line.")
+    parser.add_argument("--num_queries", type=int, default=512, help="Number of queries to encode.")
+    parser.add_argument("--min_words", type=int, default=3, help="Min words per synthetic query.")
+    parser.add_argument("--max_words", type=int, default=25, help="Max words per synthetic query.")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 8, 32, 128], help="Batch sizes to try.")
+    parser.add_argument("--num_threads", type=int, default=None, help="torch intra-op threads.")
+    parser.add_argument("--max_length", type=int, default=256, help="Max query tokens.")
+    args = parser.parse_args()
+
+    if args.query_file is not None:
+        with open(args.query_file) as f:
+            queries = [line.strip() for line in f if line.strip()][: args.num_queries]
+    else:
+        queries = synthetic_queries(args.num_queries, args.min_words, args.max_words)
+
+    encoders = {}
+    for name, use_int8 in [("fp32", False), ("int8", True)]:
+        encoders[name] = Encoder(
+            model_name=args.retriever_name,
+            model_path=args.retriever_model,
+            pooling_method="mean",
+            max_length=args.max_length,
+            use_fp16=False,
+            device="cpu",
+            use_int8=use_int8,
+            num_threads=args.num_threads,
+        )
+
+    print(f"{len(queries)} queries, {args.num_threads or 'default'} threads")
+    print(f"{'mode':<8}{'batch':>7}{'QPS':>10}{'p50_batch_ms':>15}{'p99_batch_ms':>15}{'cos_vs_fp32':>13}")
+    for batch_size in args.batch_sizes:
+        fp32_embs = None
+        for name, encoder in encoders.items():
+            embs, stats = bench(encoder, queries, batch_size)
+            if fp32_embs is None:
+                fp32_embs = embs
+            cos = float(np.mean(np.sum(embs * fp32_embs, axis=1)))
+            print(
+                f"{name:<8}{batch_size:>7}{stats['qps']:>10.1f}"
+                f"{stats['p50_batch_ms']:>15.2f}{stats['p99_batch_ms']:>15.2f}{cos:>13.4f}"
+            )
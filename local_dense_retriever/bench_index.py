@@ -0,0 +1,135 @@
+"""
+Recall-vs-latency benchmark of index variants against the exact Flat index.
+
+For every index (and every nprobe / efSearch setting that applies to it) this reports
+recall@k against Flat, batched QPS and single-query p50/p99 latency, e.g.:
+
+    python bench_index.py --flat_index_path e5_Flat.index \
+        --index_paths e5_IVF65536_Flat.index e5_IVF65536_PQ64.index e5_HNSW32.index e5_SQ8.index \
+        --query_file queries.txt --retriever_model intfloat/e5-base-v2 --nprobe 16 64 256 --ef_search 64 256
+
+With --rescore_vectors_path every setting is also run as a two-stage cascade that rescores
+k' candidates (--rescore_k) exactly against the memory-mapped vectors.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from faiss_index import RescoringIndex, flat_index_vectors, make_search_params
+
+
+def load_query_embeddings(args, flat_index) -> np.ndarray:
+    if args.query_path is not None:
+        return np.ascontiguousarray(np.load(args.query_path)[: args.num_queries], dtype=np.float32)
+
+    if args.query_file is not None:
+        from retrieval_server import Encoder
+
+        with open(args.query_file) as f:
+            lines = [line.strip() for line in f if line.strip()]
+        queries = [json.loads(line)["question"] if line.startswith("{") else line for line in lines]
+        encoder = Encoder(
+            model_name=args.retriever_name,
+            model_path=args.retriever_model,
+            pooling_method="mean",
+            max_length=256,
+            use_fp16=False,
+        )
+        return encoder.encode(queries[: args.num_queries])
+
+    # No real queries: perturb random stored passages so every query has a known neighbourhood.
+    rng = np.random.default_rng(0)
+    vectors = flat_index_vectors(flat_index)
+    idxs = np.sort(rng.choice(len(vectors), size=min(args.num_queries, len(vectors)), replace=False))
+    queries = vectors[idxs] + rng.normal(scale=0.05, size=(len(idxs), vectors.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.ascontiguousarray(queries, dtype=np.float32)
+
+
+def recall_at_k(ground_truth: np.ndarray, retrieved: np.ndarray) -> float:
+    hits = sum(len(np.intersect1d(gt, ret[ret >= 0])) for gt, ret in zip(ground_truth, retrieved))
+    return hits / ground_truth.size
+
+
+def bench(index, queries: np.ndarray, topk: int, params, num_latency_queries: int):
+    t0 = time.perf_counter()
+    _, idxs = index.search(queries, topk, params=params)
+    batch_time = time.perf_counter() - t0
+
+    latencies = []
+    for query in queries[:num_latency_queries]:
+        t0 = time.perf_counter()
+        index.search(query[None, :], topk, params=params)
+        latencies.append(time.perf_counter() - t0)
+    latencies_ms = 1000.0 * np.asarray(latencies)
+    return idxs, {
+        "qps": len(queries) / batch_time,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recall@k / QPS / latency of FAISS index variants.")
+    parser.add_argument("--flat_index_path", type=str, required=True, help="Exact Flat index used as ground truth.")
+    parser.add_argument("--index_paths", type=str, nargs="+", required=True, help="Index variants to benchmark.")
+    parser.add_argument("--query_path", type=str, default=None, help="float32 .npy file of query embeddings.")
+    parser.add_argument("--query_file", type=str, default=None, help="Text (or JSONL with 'question') query file.")
+    parser.add_argument("--retriever_name", type=str, default="e5", help="Name of the retriever model.")
+    parser.add_argument(
+        "--retriever_model", type=str, default="intfloat/e5-base-v2", help="Path of the retriever model."
+    )
+    parser.add_argument("--num_queries", type=int, default=1000, help="Number of benchmark queries.")
+    parser.add_argument("--num_latency_queries", type=int, default=200, help="Queries timed one at a time.")
+    parser.add_argument("--topk", type=int, default=10, help="k for recall@k.")
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[], help="nprobe values to sweep for IVF indexes.")
+    parser.add_argument("--ef_search", type=int, nargs="*", default=[], help="efSearch values to sweep for HNSW.")
+    parser.add_argument("--num_threads", type=int, default=None, help="OpenMP threads used by faiss.")
+    parser.add_argument("--rescore_vectors_path", type=str, default=None, help="fp16/fp32 .npy for exact rescoring.")
+    parser.add_argument("--rescore_k", type=int, nargs="*", default=[100], help="k' values to sweep with rescoring.")
+    args = parser.parse_args()
+
+    if args.num_threads is not None:
+        faiss.omp_set_num_threads(args.num_threads)
+
+    flat_index = faiss.read_index(args.flat_index_path)
+    queries = load_query_embeddings(args, flat_index)
+    rescore_vectors = None
+    if args.rescore_vectors_path is not None:
+        rescore_vectors = np.load(args.rescore_vectors_path, mmap_mode="r")
+    ground_truth, flat_stats = bench(flat_index, queries, args.topk, None, args.num_latency_queries)
+
+    rows = [("Flat", "-", os.path.getsize(args.flat_index_path), 1.0, flat_stats)]
+    for index_path in args.index_paths:
+        index = faiss.read_index(index_path)
+        settings = [("default", None)]
+        settings += [(f"nprobe={n}", make_search_params(index, nprobe=n)) for n in args.nprobe]
+        settings += [(f"efSearch={ef}", make_search_params(index, ef_search=ef)) for ef in args.ef_search]
+        for name, params in settings:
+            if name != "default" and params is None:
+                continue  # knob does not apply to this index type
+            idxs, stats = bench(index, queries, args.topk, params, args.num_latency_queries)
+            recall = recall_at_k(ground_truth, idxs)
+            rows.append((os.path.basename(index_path), name, os.path.getsize(index_path), recall, stats))
+            if rescore_vectors is None:
+                continue
+            for rescore_k in args.rescore_k:
+                cascade = RescoringIndex(index, rescore_vectors, rescore_k)
+                idxs, stats = bench(cascade, queries, args.topk, params, args.num_latency_queries)
+                recall = recall_at_k(ground_truth, idxs)
+                setting = f"{name}+rescore{rescore_k}"
+                rows.append((os.path.basename(index_path), setting, os.path.getsize(index_path), recall, stats))
+        del index
+
+    print(f"\n{len(queries)} queries, recall@{args.topk} against Flat")
+    print(f"{'index':<40}{'setting':<24}{'size_GB':>9}{'recall':>9}{'QPS':>11}{'p50_ms':>9}{'p99_ms':>9}")
+    for index_name, setting, size, recall, stats in rows:
+        print(
+            f"{index_name:<40}{setting:<24}{size / 1e9:>9.2f}{recall:>9.4f}"
+            f"{stats['qps']:>11.1f}{stats['p50_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+        )
@@ -0,0 +1,93 @@
+"""
+Bytes and encode/decode latency of one /retrieve response batch per format: full documents vs
+compact snippets (max_chars), each as stdlib JSON, orjson and msgpack (when installed).
+
+    python bench_response.py --corpus_path wiki-18.store --batch_size 512 --topk 3 --max_chars 1200
+
+Without --corpus_path, synthetic wiki-18 style passages are used.
+"""
+
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from response_format import MSGPACK_AVAILABLE, ORJSON_AVAILABLE, compact_doc
+
+
+def synthetic_docs(num_docs: int, doc_chars: int) -> list[dict]:
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz     "
+    docs = []
+    for doc_id in range(num_docs):
+        title = "".join(rng.choices(letters, k=20)).strip()
+        text = "".join(rng.choices(letters, k=doc_chars))
+        contents = f'"{title}"\n{text}'
+        docs.append({"id": str(doc_id), "title": title, "text": text, "contents": contents})
+    return docs
+
+
+def serializers() -> dict:
+    out = {"json": (lambda p: json.dumps(p, ensure_ascii=False).encode("utf-8"), json.loads)}
+    if ORJSON_AVAILABLE:
+        import orjson
+
+        out["orjson"] = (orjson.dumps, orjson.loads)
+    if MSGPACK_AVAILABLE:
+        import msgpack
+
+        out["msgpack"] = (lambda p: msgpack.packb(p, use_bin_type=True), msgpack.unpackb)
+    return out
+
+
+def time_ms(fn, arg, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - t0)
+    return 1000.0 * float(np.median(times))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /retrieve response formats.")
+    parser.add_argument("--corpus_path", type=str, default=None, help="Corpus store to sample documents from.")
+    parser.add_argument("--batch_size", type=int, default=512, help="Queries per response.")
+    parser.add_argument("--topk", type=int, default=3, help="Documents per query.")
+    parser.add_argument("--max_chars", type=int, default=1200, help="Snippet length for the compact format.")
+    parser.add_argument("--doc_chars", type=int, default=600, help="Length of synthetic passages.")
+    parser.add_argument("--repeats", type=int, default=20, help="Timing repeats per format.")
+    args = parser.parse_args()
+
+    num_hits = args.batch_size * args.topk
+    if args.corpus_path is not None:
+        from corpus_store import CorpusStore
+
+        store = CorpusStore(args.corpus_path)
+        docs = store.get_many(np.random.default_rng(0).integers(0, len(store), num_hits))
+    else:
+        docs = synthetic_docs(num_hits, args.doc_chars)
+    scores = np.random.default_rng(1).random(num_hits).tolist()
+
+    def payload(hits):
+        return {
+            "result": [
+                [{"document": doc, "score": score} for doc, score in zip(hits[i : i + args.topk], scores[i:])]
+                for i in range(0, num_hits, args.topk)
+            ]
+        }
+
+    payloads = {
+        "full": payload(docs),
+        f"compact({args.max_chars})": payload([compact_doc(doc, args.max_chars) for doc in docs]),
+    }
+    print(f"batch_size={args.batch_size} topk={args.topk}")
+    print(f"{'layout':<16} {'format':<8} {'bytes':>12} {'encode_ms':>10} {'decode_ms':>10}")
+    for layout, body in payloads.items():
+        for name, (dumps, loads) in serializers().items():
+            encoded = dumps(body)
+            encode_ms = time_ms(dumps, body, args.repeats)
+            decode_ms = time_ms(loads, encoded, args.repeats)
+            print(f"{layout:<16} {name:<8} {len(encoded):>12,} {encode_ms:>10.2f} {decode_ms:>10.2f}")
@@ -0,0 +1,226 @@
+"""
+Offline load test of the retriever on a synthetic corpus (no wiki-18 download, CPU is fine).
+
+Generates a random corpus store, random normalized embeddings in a FAISS index and a tiny
+randomly initialised BERT encoder, then drives the retriever either in-process
+(retriever.batch_search) or over HTTP (a retrieval_server.py subprocess, or --url) with a
+configurable concurrency and query-length mix. Reports QPS, p50/p95/p99 latency and RSS.
+
+    python bench_server.py --num_docs 200000 --dim 256 --mode http --concurrency 64 --num_requests 5000
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from corpus_store import build_corpus_store
+from faiss_index import INDEX_TYPES, build_index
+
+VOCAB_SIZE = 5000
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+
+def synthetic_words(num_words: int) -> list[str]:
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choices(letters, k=rng.randint(3, 9))) for _ in range(num_words)]
+
+
+def build_synthetic_assets(workdir: str, num_docs: int, dim: int, index_type: str, doc_words: int = 100) -> dict:
+    words = synthetic_words(VOCAB_SIZE - len(SPECIAL_TOKENS))
+    rng = random.Random(1)
+
+    corpus_path = os.path.join(workdir, "corpus.jsonl")
+    with open(corpus_path, "w") as f:
+        for doc_id in range(num_docs):
+            title = " ".join(rng.choices(words, k=3))
+            text = " ".join(rng.choices(words, k=doc_words))
+            f.write(json.dumps({"id": str(doc_id), "contents": f'"{title}"\n{text}'}) + "\n")
+    store_dir = os.path.join(workdir, "corpus.store")
+    build_corpus_store(corpus_path, store_dir)
+
+    emb = np.random.default_rng(2).standard_normal((num_docs, dim), dtype=np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    index = build_index(emb, index_type, nlist=max(1, int(np.sqrt(num_docs))), pq_m=max(1, dim // 8))
+    index_path = os.path.join(workdir, f"{index_type}.index")
+    faiss.write_index(index, index_path)
+
+    # tiny random BERT + matching WordPiece vocab, loadable by AutoModel/AutoTokenizer
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    model_dir = os.path.join(workdir, "encoder")
+    os.makedirs(model_dir, exist_ok=True)
+    vocab_file = os.path.join(model_dir, "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(SPECIAL_TOKENS + words) + "\n")
+    BertTokenizerFast(vocab_file=vocab_file).save_pretrained(model_dir)
+    model_config = BertConfig(
+        vocab_size=VOCAB_SIZE,
+        hidden_size=dim,
+        num_hidden_layers=2,
+        num_attention_heads=max(1, dim // 64),
+        intermediate_size=dim * 4,
+    )
+    BertModel(model_config).save_pretrained(model_dir)
+    return {"words": words, "corpus_path": store_dir, "index_path": index_path, "model_path": model_dir}
+
+
+def parse_length_mix(spec: str) -> tuple[list[int], list[float]]:
+    """'3:0.4,8:0.4,20:0.2' -> ([3, 8, 20], [0.4, 0.4, 0.2])"""
+    lengths, weights = [], []
+    for part in spec.split(","):
+        length, weight = part.split(":")
+        lengths.append(int(length))
+        weights.append(float(weight))
+    return lengths, weights
+
+
+def make_queries(words: list[str], num_queries: int, length_mix: str, seed: int = 3) -> list[str]:
+    rng = random.Random(seed)
+    lengths, weights = parse_length_mix(length_mix)
+    return [" ".join(rng.choices(words, k=rng.choices(lengths, weights)[0])) for _ in range(num_queries)]
+
+
+def rss_mb(pid: int = None) -> float:
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return float("nan")
+
+
+def run_load(call, queries: list[str], concurrency: int, queries_per_request: int) -> dict:
+    requests_ = [queries[i : i + queries_per_request] for i in range(0, len(queries), queries_per_request)]
+    latencies = []
+
+    def timed(batch):
+        t0 = time.perf_counter()
+        call(batch)
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, requests_))
+    wall = time.perf_counter() - t0
+    latencies_ms = 1000.0 * np.asarray(latencies)
+    return {
+        "requests": len(requests_),
+        "qps": len(queries) / wall,
+        "rps": len(requests_) / wall,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def wait_ready(base_url: str, timeout: float = 600.0):
+    import requests
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/ready", timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1.0)
+    raise TimeoutError(f"{base_url} not ready after {timeout}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic load test of the local retriever.")
+    parser.add_argument("--mode", type=str, default="inprocess", choices=["inprocess", "http"], help="How to drive it.")
+    parser.add_argument("--url", type=str, default=None, help="Benchmark an already running /retrieve URL instead.")
+    parser.add_argument("--workdir", type=str, default=None, help="Where to write synthetic assets (default: temp).")
+    parser.add_argument("--num_docs", type=int, default=100_000, help="Synthetic corpus size.")
+    parser.add_argument("--dim", type=int, default=128, help="Embedding / tiny encoder hidden size.")
+    parser.add_argument("--index_type", type=str, default="flat", choices=INDEX_TYPES, help="Index to build.")
+    parser.add_argument("--num_requests", type=int, default=2000, help="Requests to send.")
+    parser.add_argument("--queries_per_request", type=int, default=1, help="Queries per request.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients.")
+    parser.add_argument("--length_mix", type=str, default="3:0.3,8:0.5,20:0.2", help="words:weight query mix.")
+    parser.add_argument("--topk", type=int, default=3, help="Passages per query.")
+    parser.add_argument("--port", type=int, default=8123, help="Port for the HTTP server subprocess.")
+    parser.add_argument(
+        "--server_args", type=str, nargs=argparse.REMAINDER, default=[], help="Extra retrieval_server.py flags."
+    )
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="retriever_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    t0 = time.perf_counter()
+    assets = build_synthetic_assets(workdir, args.num_docs, args.dim, args.index_type)
+    print(f"Built synthetic assets in {workdir} ({time.perf_counter() - t0:.1f}s)")
+    queries = make_queries(assets["words"], args.num_requests * args.queries_per_request, args.length_mix)
+
+    server = None
+    if args.mode == "inprocess" and args.url is None:
+        from retrieval_server import Config, get_retriever
+
+        config = Config(
+            retrieval_method="e5",
+            index_path=assets["index_path"],
+            corpus_path=assets["corpus_path"],
+            retrieval_topk=args.topk,
+            faiss_gpu=False,
+            retrieval_model_path=assets["model_path"],
+            retrieval_device="cpu",
+        )
+        retriever = get_retriever(config)
+
+        def call(batch):
+            retriever.batch_search(batch, num=args.topk, return_score=True)
+
+        rss = lambda: rss_mb()  # noqa: E731
+    else:
+        import requests
+
+        url = args.url
+        if url is None:
+            server_cmd = [
+                sys.executable,
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_server.py"),
+                "--index_path", assets["index_path"],
+                "--corpus_path", assets["corpus_path"],
+                "--retriever_model", assets["model_path"],
+                "--retriever_device", "cpu",
+                "--topk", str(args.topk),
+                "--port", str(args.port),
+            ] + args.server_args  # fmt: skip
+            server = subprocess.Popen(server_cmd)
+            url = f"http://127.0.0.1:{args.port}/retrieve"
+            wait_ready(url.rsplit("/", 1)[0])
+        session = requests.Session()
+
+        def call(batch):
+            response = session.post(url, json={"queries": batch, "topk": args.topk, "return_scores": True})
+            response.raise_for_status()
+
+        rss = lambda: rss_mb(server.pid) if server is not None else float("nan")  # noqa: E731
+
+    try:
+        run_load(call, queries[: args.concurrency], args.concurrency, args.queries_per_request)  # warmup
+        stats = run_load(call, queries, args.concurrency, args.queries_per_request)
+        stats["rss_mb"] = rss()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(
+        f"mode={args.mode} docs={args.num_docs} dim={args.dim} index={args.index_type} "
+        f"concurrency={args.concurrency} queries/request={args.queries_per_request}"
+    )
+    print(json.dumps(stats, indent=2))
@@ -0,0 +1,202 @@
+"""
+Pure NumPy/SciPy BM25 engine, a JVM-free alternative to the Pyserini LuceneSearcher.
+
+The index is a term-major CSR matrix of precomputed BM25 impact weights
+(idf * saturated tf, length normalised) stored as memory-mapped arrays:
+
+    meta.json      k1, b, num_docs, avgdl
+    vocab.json     term -> row
+    indptr.npy     int64, num_terms + 1
+    indices.npy    int32 doc ids, sorted within each term
+    data.npy       float32 weights
+    docs/          optional corpus store (see corpus_store.py), the "contain_doc" case
+
+A batch of queries is scored with one sparse product between the query term counts and
+the posting rows of the terms the batch actually uses, followed by a partial sort per query.
+
+Build an index:
+    python bm25_native.py --corpus_path wiki-18.jsonl --output_dir wiki-18.bm25 --store_docs
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+from tqdm import tqdm
+
+from corpus_store import build_corpus_store
+
+META_FILE = "meta.json"
+VOCAB_FILE = "vocab.json"
+DOCS_DIR = "docs"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Lucene's default English stop set
+STOPWORDS = frozenset(
+    "a an and are as at be but by for if in into is it no not of on or such that the their then there "
+    "these they this to was will with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [tok for tok in _TOKEN_RE.findall(text.lower()) if tok not in STOPWORDS]
+
+
+def is_native_bm25_index(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE)) and os.path.exists(
+        os.path.join(path, VOCAB_FILE)
+    )
+
+
+def _iter_contents(corpus_path: str):
+    opener = gzip.open if corpus_path.endswith(".gz") else open
+    with opener(corpus_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)["contents"]
+
+
+def build_bm25_index(
+    corpus_path: str, output_dir: str, k1: float = 0.9, b: float = 0.4, store_docs: bool = False
+) -> int:
+    """Build a native BM25 index from a JSONL corpus with a 'contents' field. Returns the number of docs."""
+    os.makedirs(output_dir, exist_ok=True)
+    vocab = {}
+    term_ids = array("i")
+    doc_ids = array("i")
+    tfs = array("f")
+    doc_lens = array("i")
+
+    for doc_id, contents in enumerate(tqdm(_iter_contents(corpus_path), desc="Tokenizing corpus: ")):
+        tokens = tokenize(contents)
+        doc_lens.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_ids.append(doc_id)
+            tfs.append(tf)
+
+    num_docs = len(doc_lens)
+    term_ids = np.frombuffer(term_ids, dtype=np.int32)
+    doc_ids = np.frombuffer(doc_ids, dtype=np.int32)
+    tfs = np.frombuffer(tfs, dtype=np.float32)
+    doc_lens = np.frombuffer(doc_lens, dtype=np.int32).astype(np.float32)
+    avgdl = float(doc_lens.mean()) if num_docs else 0.0
+
+    # Postings were appended doc by doc, so a stable sort by term keeps doc ids ascending per term.
+    order = np.argsort(term_ids, kind="stable")
+    term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+    df = np.bincount(term_ids, minlength=len(vocab))
+    indptr = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+    idf = np.log1p((num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+    norm = k1 * (1.0 - b + b * doc_lens[doc_ids] / max(avgdl, 1e-9))
+    weights = (idf[term_ids] * tfs * (k1 + 1.0) / (tfs + norm)).astype(np.float32)
+
+    np.save(os.path.join(output_dir, "indptr.npy"), indptr)
+    np.save(os.path.join(output_dir, "indices.npy"), doc_ids)
+    np.save(os.path.join(output_dir, "data.npy"), weights)
+    with open(os.path.join(output_dir, VOCAB_FILE), "w") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(output_dir, META_FILE), "w") as f:
+        json.dump({"k1": k1, "b": b, "num_docs": num_docs, "avgdl": avgdl}, f)
+
+    if store_docs:
+        build_corpus_store(corpus_path, os.path.join(output_dir, DOCS_DIR))
+    return num_docs
+
+
+class NativeBM25Index:
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, VOCAB_FILE)) as f:
+            self.vocab = json.load(f)
+        self.num_docs = self.meta["num_docs"]
+        self.indptr = np.load(os.path.join(index_dir, "indptr.npy"), mmap_mode="r")
+        self.indices = np.load(os.path.join(index_dir, "indices.npy"), mmap_mode="r")
+        self.data = np.load(os.path.join(index_dir, "data.npy"), mmap_mode="r")
+
+    @property
+    def docs_dir(self) -> str:
+        return os.path.join(self.index_dir, DOCS_DIR)
+
+    def _query_matrix(self, query_list: list[str]):
+        """Query term counts (num_queries x batch_terms) and the posting rows of those terms."""
+        batch_terms = {}
+        rows, cols, vals = [], [], []
+        for row, query in enumerate(query_list):
+            for term, count in Counter(tokenize(query)).items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    continue
+                rows.append(row)
+                cols.append(batch_terms.setdefault(term_id, len(batch_terms)))
+                vals.append(count)
+        queries = sp.csr_matrix(
+            (np.asarray(vals, dtype=np.float32), (rows, cols)), shape=(len(query_list), len(batch_terms))
+        )
+
+        term_ids = np.fromiter(batch_terms.keys(), dtype=np.int64, count=len(batch_terms))
+        starts = self.indptr[term_ids]
+        ends = self.indptr[term_ids + 1]
+        lengths = ends - starts
+        sub_indptr = np.concatenate([[0], np.cumsum(lengths)])
+        positions = np.arange(sub_indptr[-1], dtype=np.int64) + np.repeat(starts - sub_indptr[:-1], lengths)
+        postings = sp.csr_matrix(
+            (self.data[positions], self.indices[positions], sub_indptr), shape=(len(batch_terms), self.num_docs)
+        )
+        return queries, postings
+
+    def search(self, query_list: list[str], k: int) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        """Top-k (doc ids, scores) per query, best first; queries with no known terms get empty arrays."""
+        queries, postings = self._query_matrix(query_list)
+        scores = (queries @ postings).tocsr()
+
+        all_idxs, all_scores = [], []
+        for row in range(len(query_list)):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            row_scores = scores.data[start:end]
+            row_idxs = scores.indices[start:end]
+            if len(row_scores) > k:
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                row_scores, row_idxs = row_scores[top], row_idxs[top]
+            order = np.argsort(-row_scores, kind="stable")
+            all_idxs.append(row_idxs[order].astype(np.int64))
+            all_scores.append(row_scores[order])
+        return all_idxs, all_scores
+
+
+# Per-process index for the multi-process search pool; workers mmap the same files.
+_worker_index = None
+
+
+def init_search_worker(index_dir: str):
+    global _worker_index
+    _worker_index = NativeBM25Index(index_dir)
+
+
+def worker_search(query_list: list[str], k: int):
+    return _worker_index.search(query_list, k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a native (NumPy/SciPy) BM25 index.")
+    parser.add_argument("--corpus_path", type=str, required=True, help="Corpus JSONL (or .jsonl.gz) file.")
+    parser.add_argument("--output_dir", type=str, required=True, help="Directory to write the index into.")
+    parser.add_argument("--k1", type=float, default=0.9, help="BM25 k1.")
+    parser.add_argument("--b", type=float, default=0.4, help="BM25 b.")
+    parser.add_argument(
+        "--store_docs", action="store_true", help="Also store the documents in the index (no corpus needed to serve)."
+    )
+    args = parser.parse_args()
+
+    num_docs = build_bm25_index(args.corpus_path, args.output_dir, k1=args.k1, b=args.b, store_docs=args.store_docs)
+    print(f"Indexed {num_docs} docs into {args.output_dir}")
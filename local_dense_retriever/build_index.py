@@ -0,0 +1,75 @@
+"""
+Build a compressed / approximate FAISS index from existing embeddings.
+
+The embeddings come either from a float32 .npy file (N x d, memory-mapped) or directly
+from the prebuilt Flat index, e.g.:
+
+    python build_index.py --flat_index_path e5_Flat.index --index_type ivf_pq --nlist 65536 --pq_m 64 \
+        --output_path e5_IVF65536_PQ64.index
+
+With --rescore_vectors_path the embeddings are also written as an fp16 (or fp32) .npy for
+two-stage search (retrieval_server.py --rescore_vectors_path / --rescore_k).
+"""
+
+import argparse
+import os
+
+import faiss
+import numpy as np
+
+from faiss_index import INDEX_TYPES, build_index, flat_index_vectors, write_rescore_vectors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an IVF-Flat / IVF-PQ / HNSW / SQ8 index from embeddings.")
+    parser.add_argument("--embedding_path", type=str, default=None, help="float32 .npy file of passage embeddings.")
+    parser.add_argument(
+        "--flat_index_path", type=str, default=None, help="Read the embeddings out of an existing Flat index instead."
+    )
+    parser.add_argument("--index_type", type=str, required=True, choices=INDEX_TYPES, help="Index variant to build.")
+    parser.add_argument("--output_path", type=str, required=True, help="Where to write the new index.")
+    parser.add_argument("--nlist", type=int, default=65536, help="Number of IVF lists.")
+    parser.add_argument("--pq_m", type=int, default=64, help="Number of PQ sub-quantizers.")
+    parser.add_argument("--pq_nbits", type=int, default=8, help="Bits per PQ code.")
+    parser.add_argument("--hnsw_m", type=int, default=32, help="HNSW graph degree.")
+    parser.add_argument("--ef_construction", type=int, default=200, help="HNSW efConstruction.")
+    parser.add_argument("--train_size", type=int, default=1_000_000, help="Number of vectors sampled for training.")
+    parser.add_argument("--add_batch_size", type=int, default=1_000_000, help="Vectors added per index.add call.")
+    parser.add_argument("--num_threads", type=int, default=None, help="OpenMP threads used by faiss.")
+    parser.add_argument(
+        "--rescore_vectors_path", type=str, default=None, help="Also write the embeddings here for rescoring."
+    )
+    parser.add_argument(
+        "--rescore_dtype", type=str, default="float16", choices=["float16", "float32"], help="dtype of rescore vectors."
+    )
+
+    args = parser.parse_args()
+    if (args.embedding_path is None) == (args.flat_index_path is None):
+        parser.error("Exactly one of --embedding_path and --flat_index_path is required.")
+
+    if args.num_threads is not None:
+        faiss.omp_set_num_threads(args.num_threads)
+
+    if args.embedding_path is not None:
+        embeddings = np.load(args.embedding_path, mmap_mode="r")
+    else:
+        flat_index = faiss.read_index(args.flat_index_path)
+        embeddings = flat_index_vectors(flat_index)
+    print(f"Loaded {embeddings.shape[0]} embeddings of dim {embeddings.shape[1]}")
+    if args.rescore_vectors_path is not None:
+        write_rescore_vectors(embeddings, args.rescore_vectors_path, dtype=args.rescore_dtype)
+        print(f"Wrote {args.rescore_dtype} rescore vectors to {args.rescore_vectors_path}")
+
+    index = build_index(
+        embeddings,
+        args.index_type,
+        nlist=args.nlist,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+        train_size=args.train_size,
+        add_batch_size=args.add_batch_size,
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(args.output_path)), exist_ok=True)
+    faiss.write_index(index, args.output_path)
+    print(f"Wrote {args.index_type} index with {index.ntotal} vectors to {args.output_path}")
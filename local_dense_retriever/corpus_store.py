@@ -0,0 +1,126 @@
+"""
+Memory-mapped, offset-indexed document store.
+
+The corpus JSONL is converted once into two files inside a store directory:
+
+    docs.bin      all JSON lines concatenated into one contiguous byte blob
+    offsets.npy   int64 array of length num_docs + 1, doc i is docs.bin[offsets[i]:offsets[i + 1]]
+
+Both are opened with mmap, so startup only touches the file headers and every server
+process on the host shares the same page cache.
+
+Build a store:
+    python corpus_store.py --corpus_path wiki-18.jsonl --output_dir wiki-18.store
+
+Docs can be appended later (append_to_corpus_store); existing ids never change.
+"""
+
+import argparse
+import gzip
+import json
+import os
+from array import array
+from typing import Optional
+
+import numpy as np
+from tqdm import tqdm
+
+DOCS_FILE = "docs.bin"
+OFFSETS_FILE = "offsets.npy"
+
+
+def is_corpus_store(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, OFFSETS_FILE))
+
+
+def build_corpus_store(corpus_path: str, output_dir: str) -> int:
+    """Stream a (optionally gzipped) JSONL corpus into a store directory. Returns the number of docs."""
+    os.makedirs(output_dir, exist_ok=True)
+    opener = gzip.open if corpus_path.endswith(".gz") else open
+    offsets = array("q", [0])
+    with opener(corpus_path, "rb") as fin, open(os.path.join(output_dir, DOCS_FILE), "wb") as fout:
+        for line in tqdm(fin, desc="Building corpus store: "):
+            line = line.strip()
+            if not line:
+                continue
+            fout.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(output_dir, OFFSETS_FILE), np.frombuffer(offsets, dtype=np.int64))
+    return len(offsets) - 1
+
+
+def append_to_corpus_store(store_dir: str, docs: list[dict]) -> int:
+    """
+    Append docs to an existing store and return the id of the first one. offsets.npy is
+    replaced atomically after the bytes are written, so a crash leaves the store as it was.
+    Not safe against concurrent appenders.
+    """
+    offsets_path = os.path.join(store_dir, OFFSETS_FILE)
+    offsets = np.load(offsets_path)
+    lines = [json.dumps(doc, ensure_ascii=False).encode("utf-8") for doc in docs]
+    with open(os.path.join(store_dir, DOCS_FILE), "r+b") as f:
+        # anything past the last offset is left over from an interrupted append
+        f.seek(int(offsets[-1]))
+        f.write(b"".join(lines))
+        f.truncate()
+    new_offsets = np.concatenate([offsets, offsets[-1] + np.cumsum([len(line) for line in lines], dtype=np.int64)])
+    tmp_path = offsets_path + ".tmp.npy"
+    np.save(tmp_path, new_offsets)
+    os.replace(tmp_path, offsets_path)
+    return len(offsets) - 1
+
+
+class CorpusStore:
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.refresh()
+
+    def refresh(self):
+        """Re-open the files, picking up docs appended since the store was opened."""
+        docs_path = os.path.join(self.store_dir, DOCS_FILE)
+        # blob first: readers holding the old offsets only index bytes that already existed
+        if os.path.getsize(docs_path) > 0:
+            self.blob = np.memmap(docs_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+        self.offsets = np.load(os.path.join(self.store_dir, OFFSETS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return self.get_many([idx])[0]
+
+    def get_raw_many(self, idxs) -> list[bytes]:
+        """Return the raw JSON bytes of each doc, gathered from the blob in one vectorised read."""
+        idxs = np.asarray(idxs).astype(np.int64).reshape(-1)
+        valid = (idxs >= 0) & (idxs < len(self))
+        if not valid.any():
+            # also covers an empty store, where the placeholder index 0 has no offsets[1] to read
+            return [None] * len(idxs)
+        safe_idxs = np.where(valid, idxs, 0)
+        starts = np.where(valid, self.offsets[safe_idxs], 0)
+        lengths = np.where(valid, self.offsets[safe_idxs + 1] - starts, 0)
+
+        # Build the byte positions of every requested doc back to back and gather them at once.
+        ends = np.cumsum(lengths)
+        total = int(ends[-1])
+        positions = np.arange(total, dtype=np.int64) + np.repeat(starts - (ends - lengths), lengths)
+        gathered = self.blob[positions].tobytes()
+
+        bounds = np.concatenate([[0], ends]).tolist()
+        return [gathered[bounds[i] : bounds[i + 1]] if valid[i] else None for i in range(len(idxs))]
+
+    def get_many(self, idxs) -> list[Optional[dict]]:
+        """Return the docs (as dicts) for `idxs`. Out-of-range ids (e.g. FAISS -1 padding) map to None."""
+        return [json.loads(raw) if raw is not None else None for raw in self.get_raw_many(idxs)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a memory-mapped corpus store from a JSONL corpus.")
+    parser.add_argument("--corpus_path", type=str, required=True, help="Corpus JSONL (or .jsonl.gz) file.")
+    parser.add_argument("--output_dir", type=str, required=True, help="Directory to write the store into.")
+    args = parser.parse_args()
+
+    num_docs = build_corpus_store(args.corpus_path, args.output_dir)
+    print(f"Wrote {num_docs} docs to {args.output_dir}")
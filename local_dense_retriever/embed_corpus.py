@@ -0,0 +1,219 @@
+"""
+Offline, resumable corpus embedding and index build for our own corpus or encoder.
+
+    python embed_corpus.py --corpus_path corpus.jsonl --output_dir e5_index --retriever_model intfloat/e5-base-v2 \
+        --num_workers 16 --retriever_num_threads 4 --index_type ivf_pq --nlist 65536 --pq_m 64
+
+Steps, each of which picks up where a crashed or interrupted run stopped:
+
+1. The JSONL (or .jsonl.gz) is streamed into a corpus store at <output_dir>/corpus (see
+   corpus_store.py); the server can serve it directly with --corpus_path <output_dir>/corpus.
+2. The store is split into chunks of --chunk_size docs, encoded by --num_workers processes,
+   each holding one Encoder. Workers write their rows straight into the memory-mapped
+   <output_dir>/embeddings.npy (float32, num_docs x dim) and then drop a marker in
+   <output_dir>/progress/, so finished chunks are skipped on restart. progress/manifest.json pins
+   the doc count, dim and --chunk_size of the run; resuming with different ones is refused, and a
+   marker whose start/end do not match its chunk is ignored.
+3. The embeddings are trained/added into the chosen FAISS index (faiss_index.build_index) and
+   written to <output_dir>/<index_type>.index. embeddings.npy also works with build_index.py.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from tqdm import tqdm
+
+from corpus_store import CorpusStore, build_corpus_store, is_corpus_store
+from faiss_index import INDEX_TYPES, build_index
+
+CORPUS_DIR = "corpus"
+EMBEDDINGS_FILE = "embeddings.npy"
+PROGRESS_DIR = "progress"
+MANIFEST_FILE = "manifest.json"
+
+_worker = {}
+
+
+def embedding_dim(model_path: str) -> int:
+    from transformers import AutoConfig
+
+    model_config = AutoConfig.from_pretrained(model_path)
+    return getattr(model_config, "hidden_size", None) or model_config.d_model
+
+
+def init_embed_worker(encoder_kwargs: dict, devices: list, worker_counter, store_dir: str, embedding_path: str):
+    from retrieval_server import Encoder
+
+    with worker_counter.get_lock():
+        worker_id = worker_counter.value
+        worker_counter.value += 1
+    encoder_kwargs = dict(encoder_kwargs, device=devices[worker_id % len(devices)] if devices else None)
+    _worker["encoder"] = Encoder(**encoder_kwargs)
+    _worker["store"] = CorpusStore(store_dir)
+    _worker["embedding_path"] = embedding_path
+
+
+def embed_chunk(chunk_id: int, start: int, end: int, batch_size: int, marker_path: str) -> int:
+    encoder, store = _worker["encoder"], _worker["store"]
+    embeddings = np.load(_worker["embedding_path"], mmap_mode="r+")
+    for batch_start in range(start, end, batch_size):
+        batch_end = min(batch_start + batch_size, end)
+        docs = store.get_many(np.arange(batch_start, batch_end))
+        embeddings[batch_start:batch_end] = encoder.encode([doc["contents"] for doc in docs], is_query=False)
+    embeddings.flush()
+    del embeddings
+    # the marker is written only after the rows are flushed, so a crash re-encodes the whole chunk
+    write_json(marker_path, {"chunk_id": chunk_id, "start": start, "end": end})
+    return end - start
+
+
+def prepare_store(corpus_path: str, output_dir: str) -> str:
+    if is_corpus_store(corpus_path):
+        return corpus_path
+    store_dir = os.path.join(output_dir, CORPUS_DIR)
+    if not is_corpus_store(store_dir):
+        # offsets.npy is written last, so a half-built store is rebuilt from scratch
+        build_corpus_store(corpus_path, store_dir)
+    return store_dir
+
+
+def prepare_embeddings(embedding_path: str, num_docs: int, dim: int):
+    if os.path.exists(embedding_path):
+        embeddings = np.load(embedding_path, mmap_mode="r")
+        if embeddings.shape != (num_docs, dim) or embeddings.dtype != np.float32:
+            raise ValueError(
+                f"{embedding_path} has shape {embeddings.shape} / {embeddings.dtype}, expected ({num_docs}, {dim}) "
+                "float32; remove it (and the progress dir) to start over"
+            )
+        return
+    tmp_path = embedding_path + ".tmp.npy"
+    embeddings = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(num_docs, dim))
+    del embeddings
+    os.replace(tmp_path, embedding_path)
+
+
+def write_json(path: str, obj: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def check_manifest(progress_dir: str, num_docs: int, dim: int, chunk_size: int):
+    manifest = {"num_docs": num_docs, "dim": dim, "chunk_size": chunk_size}
+    manifest_path = os.path.join(progress_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise ValueError(
+                f"{manifest_path} records {previous}, but this run has {manifest}; resume with the same "
+                "--chunk_size (or remove the progress dir and embeddings.npy to start over)"
+            )
+        return
+    # runs started before the manifest existed still resume: chunk_done checks every marker's rows
+    write_json(manifest_path, manifest)
+
+
+def chunk_done(marker_path: str, chunk_id: int, start: int, end: int) -> bool:
+    if not os.path.exists(marker_path):
+        return False
+    with open(marker_path) as f:
+        marker = json.load(f)
+    return (marker.get("chunk_id"), marker.get("start"), marker.get("end")) == (chunk_id, start, end)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed a corpus with Encoder and build a FAISS index, resumably.")
+    parser.add_argument("--corpus_path", type=str, required=True, help="Corpus JSONL(.gz) or a corpus store dir.")
+    parser.add_argument("--output_dir", type=str, required=True, help="Where to write the store, embeddings, index.")
+    parser.add_argument("--retriever_name", type=str, default="e5", help="Name of the retriever model.")
+    parser.add_argument("--retriever_model", type=str, default="intfloat/e5-base-v2", help="Path of the model.")
+    parser.add_argument("--pooling_method", type=str, default="mean", help="Pooling method of the encoder.")
+    parser.add_argument("--max_length", type=int, default=256, help="Max passage length in tokens.")
+    parser.add_argument("--use_fp16", action="store_true", help="Encode in fp16 (GPU only).")
+    parser.add_argument(
+        "--devices", type=str, nargs="*", default=[], help="Devices assigned round-robin to workers, e.g. cuda:0 cuda:1."
+    )
+    parser.add_argument("--retriever_int8", action="store_true", help="int8 dynamic quantization (CPU only).")
+    parser.add_argument("--retriever_num_threads", type=int, default=None, help="torch threads per worker (CPU).")
+    parser.add_argument("--encode_token_budget", type=int, default=None, help="Max padded tokens per forward pass.")
+    parser.add_argument("--num_workers", type=int, default=1, help="Encoding processes.")
+    parser.add_argument("--chunk_size", type=int, default=100_000, help="Docs per checkpointed chunk.")
+    parser.add_argument("--batch_size", type=int, default=256, help="Docs per Encoder.encode call.")
+    parser.add_argument(
+        "--index_type", type=str, default="flat", choices=INDEX_TYPES + ["none"], help="Index to build at the end."
+    )
+    parser.add_argument("--nlist", type=int, default=65536, help="Number of IVF lists.")
+    parser.add_argument("--pq_m", type=int, default=64, help="Number of PQ sub-quantizers.")
+    parser.add_argument("--pq_nbits", type=int, default=8, help="Bits per PQ code.")
+    parser.add_argument("--hnsw_m", type=int, default=32, help="HNSW graph degree.")
+    parser.add_argument("--train_size", type=int, default=1_000_000, help="Number of vectors sampled for training.")
+    args = parser.parse_args()
+
+    progress_dir = os.path.join(args.output_dir, PROGRESS_DIR)
+    os.makedirs(progress_dir, exist_ok=True)
+    store_dir = prepare_store(args.corpus_path, args.output_dir)
+    num_docs = len(CorpusStore(store_dir))
+    dim = embedding_dim(args.retriever_model)
+    embedding_path = os.path.join(args.output_dir, EMBEDDINGS_FILE)
+    check_manifest(progress_dir, num_docs, dim, args.chunk_size)
+    prepare_embeddings(embedding_path, num_docs, dim)
+
+    chunks = []
+    for chunk_id, start in enumerate(range(0, num_docs, args.chunk_size)):
+        end = min(start + args.chunk_size, num_docs)
+        marker_path = os.path.join(progress_dir, f"chunk_{chunk_id:06d}.json")
+        # the manifest pins the chunk size, but a marker covering other rows still must not count
+        if not chunk_done(marker_path, chunk_id, start, end):
+            chunks.append((chunk_id, start, end, marker_path))
+    print(f"{num_docs} docs, dim {dim}: {len(chunks)} of {-(-num_docs // args.chunk_size)} chunks left to encode")
+
+    if chunks:
+        encoder_kwargs = {
+            "model_name": args.retriever_name,
+            "model_path": args.retriever_model,
+            "pooling_method": args.pooling_method,
+            "max_length": args.max_length,
+            "use_fp16": args.use_fp16,
+            "use_int8": args.retriever_int8,
+            "num_threads": args.retriever_num_threads,
+            "token_budget": args.encode_token_budget,
+        }
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=args.num_workers,
+            mp_context=ctx,
+            initializer=init_embed_worker,
+            initargs=(encoder_kwargs, args.devices, ctx.Value("i", 0), store_dir, embedding_path),
+        ) as pool:
+            futures = [
+                pool.submit(embed_chunk, chunk_id, start, end, args.batch_size, marker_path)
+                for chunk_id, start, end, marker_path in chunks
+            ]
+            with tqdm(total=sum(end - start for _, start, end, _ in chunks), desc="Encoding passages: ") as bar:
+                for future in as_completed(futures):
+                    bar.update(future.result())
+
+    if args.index_type != "none":
+        import faiss
+
+        embeddings = np.load(embedding_path, mmap_mode="r")
+        index = build_index(
+            embeddings,
+            args.index_type,
+            nlist=args.nlist,
+            pq_m=args.pq_m,
+            pq_nbits=args.pq_nbits,
+            hnsw_m=args.hnsw_m,
+            train_size=args.train_size,
+        )
+        index_path = os.path.join(args.output_dir, f"{args.index_type}.index")
+        faiss.write_index(index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        print(f"Wrote {args.index_type} index with {index.ntotal} vectors to {index_path}")
+    print(f"Serve with: --index_path <index> --corpus_path {store_dir} --retriever_model {args.retriever_model}")
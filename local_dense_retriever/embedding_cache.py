@@ -0,0 +1,274 @@
+"""
+Query-embedding cache for Encoder.encode.
+
+Entries are keyed by (encoder identity, prefix-augmented query text, max_length) and live in an
+in-memory LRU bounded by bytes. The identity covers everything besides the text that the vector
+depends on (model path and weights revision, precision, pooling; see Encoder.cache_model_id). An optional on-disk tier keeps every embedding in a
+memory-mapped float32 matrix next to a memory-mapped key column, so it survives restarts
+and is bounded by a maximum number of rows (oldest rows are overwritten once it is full).
+Server workers share the disk tier: one of them writes it, the others read it. The tier's
+meta.json records the identity it was built for; a server with another encoder does not use it.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+KEY_DTYPE = "S40"  # hex sha1
+
+
+def cache_key(model_id: str, text: str, max_length: int) -> str:
+    return hashlib.sha1(f"{model_id}\x00{max_length}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    Ring buffer of embeddings in `<cache_dir>/embeddings.f32` with the key of each row in
+    `<cache_dir>/keys.bin` (both memory-mapped); `meta.json` records the shape, the encoder's
+    `model_id`, the write cursor and the number of rows ever written. A tier built for another shape or encoder is started over by
+    the writer and ignored by readers, with a warning either way.
+
+    Only one process writes: the one holding the exclusive lock on `writer.lock`. With several
+    server workers the others open the tier read-only, pick up the rows the writer flushed
+    (at most every `refresh_s`, from the cursor in meta.json), and re-check a row's key on every
+    read, so a row the writer has recycled since is a miss rather than a wrong embedding.
+    """
+
+    def __init__(self, cache_dir: str, dim: int, max_rows: int, model_id: str = "", refresh_s: float = 10.0):
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self.max_rows = max_rows
+        self.model_id = model_id
+        self.refresh_s = refresh_s
+        os.makedirs(cache_dir, exist_ok=True)
+        self.meta_path = os.path.join(cache_dir, "meta.json")
+        self.emb_path = os.path.join(cache_dir, "embeddings.f32")
+        self.keys_path = os.path.join(cache_dir, "keys.bin")
+
+        self._writer_lock = open(os.path.join(cache_dir, "writer.lock"), "w")
+        try:
+            fcntl.flock(self._writer_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.writable = True
+        except BlockingIOError:
+            self._writer_lock.close()
+            self._writer_lock = None
+            self.writable = False
+
+        self.embeddings = None
+        self.keys = None
+        self.key_to_row = {}
+        self.next_row = 0
+        # rows ever written; tells a reader whether the writer went all the way round the ring
+        self.num_writes = 0
+        self._dirty = 0
+        self._refreshed_at = 0.0
+        self._warned = False
+        if self.writable:
+            meta = self._read_meta()
+            # incompatible or missing layout: start over (no reader maps files without a matching meta.json)
+            self._map("r+" if meta is not None else "w+")
+            self.next_row = meta["next_row"] if meta is not None else 0
+            self.num_writes = meta.get("num_writes", 0) if meta is not None else 0
+            self.key_to_row = {key.decode(): row for row, key in enumerate(self.keys.tolist()) if key}
+        else:
+            self.refresh()
+
+    def _read_meta(self) -> Optional[dict]:
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if (meta["dim"], meta["max_rows"], meta.get("model_id")) != (self.dim, self.max_rows, self.model_id):
+            if not self._warned:
+                action = "starting it over" if self.writable else "not using it in this worker"
+                warnings.warn(
+                    f"Embedding cache in {self.cache_dir} was built for model {meta.get('model_id')!r} "
+                    f"(dim {meta['dim']}, {meta['max_rows']} rows), not {self.model_id!r} "
+                    f"(dim {self.dim}, {self.max_rows} rows); {action}"
+                )
+                self._warned = True
+            return None
+        return meta
+
+    def _map(self, mode: str):
+        self.embeddings = np.memmap(self.emb_path, dtype=np.float32, mode=mode, shape=(self.max_rows, self.dim))
+        self.keys = np.memmap(self.keys_path, dtype=KEY_DTYPE, mode=mode, shape=(self.max_rows,))
+
+    def refresh(self):
+        """Read-only side: index the rows the writer has flushed since the last refresh."""
+        self._refreshed_at = time.monotonic()
+        meta = self._read_meta()
+        if meta is None:
+            return
+        num_writes = meta.get("num_writes", 0)
+        first_map = self.keys is None
+        if first_map:
+            self._map("r")
+        if first_map or num_writes - self.num_writes >= self.max_rows:
+            self.key_to_row = {key.decode(): row for row, key in enumerate(self.keys.tolist()) if key}
+        else:
+            start, end = self.next_row, meta["next_row"]
+            rows = range(start, end) if start <= end else [*range(start, self.max_rows), *range(end)]
+            for row in rows:
+                key = self.keys[row]
+                if key:
+                    self.key_to_row[key.decode()] = row
+        self.next_row = meta["next_row"]
+        self.num_writes = num_writes
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        if not self.writable and time.monotonic() - self._refreshed_at > self.refresh_s:
+            self.refresh()
+        row = self.key_to_row.get(key)
+        if row is None:
+            return None
+        emb = np.array(self.embeddings[row])
+        if not self.writable and self.keys[row].decode() != key:
+            # recycled by the writer after we indexed it (checked after the copy, see put)
+            self.key_to_row.pop(key, None)
+            return None
+        return emb
+
+    def put(self, key: str, emb: np.ndarray):
+        if not self.writable or key in self.key_to_row:
+            return
+        row = self.next_row
+        old_key = self.keys[row]
+        if old_key:
+            self.key_to_row.pop(old_key.decode(), None)
+        # clear the key while the row is rewritten so readers never pair it with the new embedding
+        self.keys[row] = b""
+        self.embeddings[row] = emb
+        self.keys[row] = key.encode()
+        self.key_to_row[key] = row
+        self.next_row = (row + 1) % self.max_rows
+        self.num_writes += 1
+        self._dirty += 1
+
+    def flush(self):
+        if not self._dirty:
+            return
+        self.embeddings.flush()
+        self.keys.flush()
+        meta = {
+            "dim": self.dim,
+            "max_rows": self.max_rows,
+            "model_id": self.model_id,
+            "next_row": self.next_row,
+            "num_writes": self.num_writes,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+        self._dirty = 0
+
+    def __len__(self):
+        return len(self.key_to_row)
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        max_bytes: int = 512 * 1024 * 1024,
+        disk_cache_dir: Optional[str] = None,
+        disk_max_rows: int = 1_000_000,
+        flush_every: int = 1024,
+        dim: Optional[int] = None,
+        model_id: str = "",
+    ):
+        self.max_bytes = max_bytes
+        self.model_id = model_id
+        self.disk_cache_dir = disk_cache_dir
+        self.disk_max_rows = disk_max_rows
+        self.flush_every = flush_every
+
+        self._lru = OrderedDict()
+        self._bytes = 0
+        self._disk = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if dim is not None:
+            # open the disk tier eagerly so entries from previous runs are hit right away
+            self._get_disk(dim)
+
+    def _get_disk(self, dim: int) -> Optional[DiskEmbeddingStore]:
+        if self.disk_cache_dir is not None and self._disk is None:
+            self._disk = DiskEmbeddingStore(self.disk_cache_dir, dim, self.disk_max_rows, model_id=self.model_id)
+        return self._disk
+
+    def _put_memory(self, key: str, emb: np.ndarray):
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return
+        self._lru[key] = emb
+        self._bytes += emb.nbytes
+        while self._bytes > self.max_bytes and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def lookup(self, keys: list[str]) -> list[Optional[np.ndarray]]:
+        found = []
+        with self._lock:
+            for key in keys:
+                emb = self._lru.get(key)
+                if emb is not None:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                elif self._disk is not None and (emb := self._disk.get(key)) is not None:
+                    self._put_memory(key, emb)
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+                found.append(emb)
+        return found
+
+    def insert(self, keys: list[str], embs: np.ndarray):
+        with self._lock:
+            disk = self._get_disk(embs.shape[1])
+            for key, emb in zip(keys, embs):
+                emb = np.array(emb, dtype=np.float32)
+                self._put_memory(key, emb)
+                if disk is not None:
+                    disk.put(key, emb)
+            if disk is not None and disk._dirty >= self.flush_every:
+                disk.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._disk is not None:
+                self._disk.flush()
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._lru),
+            "memory_bytes": self._bytes,
+            "disk_entries": len(self._disk) if self._disk is not None else 0,
+            "disk_writable": self._disk.writable if self._disk is not None else False,
+        }
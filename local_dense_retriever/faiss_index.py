@@ -0,0 +1,179 @@
+"""
+Helpers for building and searching the compressed / approximate FAISS index variants.
+
+All variants use inner-product metric over the same (normalized) embeddings as the
+prebuilt e5 Flat index, so they can be swapped into the server with --index_path.
+
+A compressed index can also be used as the first stage of a cascade (RescoringIndex): it
+proposes k' candidates, which are rescored exactly against fp16/fp32 vectors read from a
+memory-mapped .npy file (write_rescore_vectors).
+"""
+
+import faiss
+import numpy as np
+from tqdm import tqdm
+
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "pq", "hnsw", "sq8"]
+RESCORE_QUERY_CHUNK = 64
+
+
+def index_factory_string(
+    index_type: str, nlist: int = 65536, pq_m: int = 64, pq_nbits: int = 8, hnsw_m: int = 32
+) -> str:
+    if index_type == "flat":
+        return "Flat"
+    elif index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    elif index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    elif index_type == "pq":
+        return f"PQ{pq_m}x{pq_nbits}"
+    elif index_type == "hnsw":
+        return f"HNSW{hnsw_m},Flat"
+    elif index_type == "sq8":
+        return "SQ8"
+    else:
+        raise NotImplementedError(f"Index type {index_type} not implemented! Choose from {INDEX_TYPES}.")
+
+
+def flat_index_vectors(index) -> np.ndarray:
+    """Zero-copy (num_vectors, dim) view of the vectors stored in a Flat index."""
+    index = faiss.downcast_index(index)
+    if not isinstance(index, faiss.IndexFlat):
+        raise ValueError(f"Expected a Flat index, got {type(index).__name__}")
+    xb = faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d)
+    return xb.reshape(index.ntotal, index.d)
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str,
+    nlist: int = 65536,
+    pq_m: int = 64,
+    pq_nbits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    train_size: int = 1_000_000,
+    add_batch_size: int = 1_000_000,
+    seed: int = 0,
+):
+    """Train (if needed) and fill a new inner-product index from `embeddings` (N x d, may be a memmap)."""
+    num_vectors, dim = embeddings.shape
+    factory = index_factory_string(index_type, nlist=nlist, pq_m=pq_m, pq_nbits=pq_nbits, hnsw_m=hnsw_m)
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = ef_construction
+
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        num_train = min(train_size, num_vectors)
+        train_idxs = np.sort(rng.choice(num_vectors, size=num_train, replace=False))
+        train_vectors = np.ascontiguousarray(embeddings[train_idxs], dtype=np.float32)
+        index.train(train_vectors)
+        del train_vectors
+
+    for start_idx in tqdm(range(0, num_vectors, add_batch_size), desc=f"Adding to {factory}: "):
+        batch = np.ascontiguousarray(embeddings[start_idx : start_idx + add_batch_size], dtype=np.float32)
+        index.add(batch)
+    return index
+
+
+def write_rescore_vectors(
+    embeddings: np.ndarray, output_path: str, dtype: str = "float16", chunk_size: int = 1_000_000
+):
+    """Copy `embeddings` (N x d, may be a memmap) into an .npy file of `dtype` for RescoringIndex."""
+    out = np.lib.format.open_memmap(output_path, mode="w+", dtype=dtype, shape=embeddings.shape)
+    for start_idx in tqdm(range(0, len(embeddings), chunk_size), desc="Writing rescore vectors: "):
+        out[start_idx : start_idx + chunk_size] = embeddings[start_idx : start_idx + chunk_size]
+    out.flush()
+    del out
+
+
+class RescoringIndex:
+    """
+    Two-stage search: the wrapped (compressed) index returns `rescore_k` candidates per query,
+    which are rescored by exact inner product against `vectors` (N x d, fp16 or fp32, usually
+    memory-mapped) before the top k are returned. Exposes the `search` / `d` / `ntotal` subset
+    of the faiss index API the server and benchmarks use.
+    """
+
+    def __init__(self, index, vectors: np.ndarray, rescore_k: int = 100):
+        if vectors.shape != (index.ntotal, index.d):
+            raise ValueError(f"Rescore vectors have shape {vectors.shape}, index has {index.ntotal} x {index.d}")
+        self.index = index
+        self.vectors = vectors
+        self.rescore_k = rescore_k
+        self.d = index.d
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def search(self, x: np.ndarray, k: int, params=None):
+        num_candidates = max(k, self.rescore_k)
+        _, candidates = self.index.search(x, num_candidates, params=params)
+        scores = np.full(candidates.shape, -np.inf, dtype=np.float32)
+        for start_idx in range(0, len(x), RESCORE_QUERY_CHUNK):
+            chunk = candidates[start_idx : start_idx + RESCORE_QUERY_CHUNK]
+            valid = chunk >= 0
+            # gather each distinct candidate once, in file order
+            rows, inverse = np.unique(chunk[valid], return_inverse=True)
+            vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+            queries = np.repeat(x[start_idx : start_idx + RESCORE_QUERY_CHUNK], valid.sum(axis=1), axis=0)
+            chunk_scores = scores[start_idx : start_idx + RESCORE_QUERY_CHUNK]
+            chunk_scores[valid] = np.einsum("nd,nd->n", vectors[inverse], queries)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        idxs = np.where(np.isfinite(scores), candidates, -1)
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(idxs, order, axis=1)
+
+
+def set_default_search_params(index, nprobe: int = None, ef_search: int = None):
+    """Apply server-wide runtime knobs to an index (no-op for knobs the index does not have)."""
+    if isinstance(index, RescoringIndex):
+        index = index.index
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass
+    if ef_search is not None:
+        hnsw_index = _find_hnsw(index)
+        if hnsw_index is not None:
+            hnsw_index.hnsw.efSearch = ef_search
+
+
+def make_search_params(index, nprobe: int = None, ef_search: int = None):
+    """Per-call SearchParameters for `index.search(..., params=...)`, or None if nothing applies."""
+    if isinstance(index, RescoringIndex):
+        index = index.index
+    is_ivf = True
+    try:
+        ivf_index = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        is_ivf = False
+
+    if is_ivf:
+        # efSearch can still apply to an HNSW coarse quantizer, e.g. "IVF65536_HNSW32,PQ64".
+        quantizer_params = None
+        if ef_search is not None and _find_hnsw(ivf_index.quantizer) is not None:
+            quantizer_params = faiss.SearchParametersHNSW(efSearch=ef_search)
+        if nprobe is None and quantizer_params is None:
+            return None
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe if nprobe is not None else ivf_index.nprobe
+        if quantizer_params is not None:
+            params.quantizer_params = quantizer_params
+            # keep the python object alive for as long as params references it
+            params.referenced_objects = [quantizer_params]
+        return params
+
+    if ef_search is not None and _find_hnsw(index) is not None:
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def _find_hnsw(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return index
+    return None
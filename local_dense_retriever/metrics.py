@@ -0,0 +1,149 @@
+"""
+Minimal Prometheus-style metrics for the retrieval server, rendered in the text exposition
+format by the /metrics endpoint (no prometheus_client dependency).
+
+Stage timings are recorded with `stage_timer("encode")` etc. Besides the process-wide
+histogram, timings are also collected per thread while a `collect_stages()` block is active,
+which is how a batch attributes its tokenize / encode / search / load_docs time to the
+requests it served.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    out.append((f"{self.name}_bucket", {**labels, "le": le}, cumulative))
+                out.append((f"{self.name}_sum", labels, total))
+                out.append((f"{self.name}_count", labels, count))
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("retrieval_stage_seconds", "Time spent per retrieval stage.")
+REQUEST_SECONDS = REGISTRY.histogram("retrieval_request_seconds", "End-to-end /retrieve latency.")
+REQUESTS_TOTAL = REGISTRY.counter("retrieval_requests_total", "Number of /retrieve requests by status.")
+QUERIES_TOTAL = REGISTRY.counter("retrieval_queries_total", "Number of queries received by /retrieve.")
+BATCH_SIZE = REGISTRY.histogram("retrieval_batch_size", "Queries per coalesced retrieval batch.", SIZE_BUCKETS)
+QUEUE_DEPTH = REGISTRY.gauge("retrieval_queue_depth", "Requests waiting in each micro-batcher priority lane.")
+CACHE_HIT_RATIO = REGISTRY.gauge("retrieval_cache_hit_ratio", "Hit ratio per cache.")
+CACHE_LOOKUPS = REGISTRY.gauge("retrieval_cache_lookups", "Cache lookups per cache and outcome.")
+
+_local = threading.local()
+
+
+@contextmanager
+def stage_timer(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        collected = getattr(_local, "stages", None)
+        if collected is not None:
+            collected[stage] = collected.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def collect_stages():
+    """Collect stage timings recorded on this thread into the yielded dict (seconds per stage)."""
+    previous = getattr(_local, "stages", None)
+    _local.stages = {}
+    try:
+        yield _local.stages
+    finally:
+        _local.stages = previous
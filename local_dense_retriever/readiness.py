@@ -0,0 +1,62 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class LoadTracker:
+    """Per-component load status behind the server's /health and /ready endpoints."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.components = {}
+        self._lock = threading.Lock()
+
+    def expect(self, *names: str):
+        with self._lock:
+            for name in names:
+                self.components.setdefault(name, {"status": "pending"})
+
+    @contextmanager
+    def track(self, name: str):
+        t0 = time.perf_counter()
+        with self._lock:
+            self.components[name] = {"status": "loading"}
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self.components[name] = {"status": "failed", "error": repr(e), "seconds": time.perf_counter() - t0}
+            raise
+        with self._lock:
+            self.components[name] = {"status": "ready", "seconds": time.perf_counter() - t0}
+
+    def run_parallel(self, loaders: dict) -> dict:
+        """Run {name: fn} concurrently, tracking each one; re-raises the first failure."""
+        self.expect(*loaders)
+
+        def run(name, fn):
+            with self.track(name):
+                return fn()
+
+        with ThreadPoolExecutor(max_workers=len(loaders)) as pool:
+            futures = {name: pool.submit(run, name, fn) for name, fn in loaders.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return bool(self.components) and all(c["status"] == "ready" for c in self.components.values())
+
+    @property
+    def failed(self) -> bool:
+        with self._lock:
+            return any(c["status"] == "failed" for c in self.components.values())
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "ready": bool(self.components) and all(c["status"] == "ready" for c in self.components.values()),
+                "uptime_s": time.time() - self.started_at,
+                "components": {name: dict(c) for name, c in self.components.items()},
+            }
@@ -0,0 +1,66 @@
+"""
+Compact snippets and content-negotiated encoding for /retrieve responses.
+
+Clients that only show the model a truncated passage can ask the server for `max_chars`:
+each document is then cut down to {"id", "title", "text"} with the text cut to `max_chars`
+characters, and the redundant `contents` field is dropped. A cut passage carries
+"truncated": true instead of a marker in the text, so the client alone decides how to show it
+and the title and text are exactly what the client would have split out of `contents`. The body is encoded as msgpack when the request sends
+`Accept: application/msgpack` (and msgpack is installed), otherwise as JSON via orjson when
+available, falling back to the standard library.
+"""
+
+import json
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def compact_doc(doc: dict, max_chars: int) -> dict:
+    if doc is None:
+        return None
+    if "title" in doc and "text" in doc:
+        title, text = doc["title"], doc["text"]
+    else:
+        # wiki-18 style: contents = '"Title"\ntext'; the title line is kept verbatim, quotes included
+        title, _, text = doc.get("contents", "").partition("\n")
+    compact = {"title": title, "text": text[:max_chars]}
+    if len(text) > max_chars:
+        compact["truncated"] = True
+    if "id" in doc:
+        compact["id"] = doc["id"]
+    return compact
+
+
+def wants_msgpack(accept: str) -> bool:
+    return MSGPACK_AVAILABLE and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def encode_body(payload, accept: str = "") -> tuple[bytes, str]:
+    """Serialize `payload` for the given Accept header; returns (body, media_type)."""
+    if wants_msgpack(accept):
+        return msgpack.packb(payload, use_bin_type=True), "application/msgpack"
+    if ORJSON_AVAILABLE:
+        # numpy scalars can slip into scores; OPT_SERIALIZE_NUMPY handles them without a copy
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), "application/json"
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), "application/json"
+
+
+def encode_response(payload, accept: str = "", **kwargs) -> Response:
+    body, media_type = encode_body(payload, accept)
+    return Response(content=body, media_type=media_type, **kwargs)
@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class ResultCache:
+    """
+    Bounded LRU of per-query search results with a TTL.
+
+    Entries are keyed by (query, search kwargs) and remember the depth they were searched at,
+    so a lookup for any topk up to that depth is a hit and is answered by slicing. Results are
+    deterministic for a fixed index and corpus; call `invalidate()` whenever either is swapped.
+    """
+
+    def __init__(self, max_entries: int = 100_000, ttl_s: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(query: str, search_kwargs: dict) -> tuple:
+        return (query, tuple(sorted(search_kwargs.items())))
+
+    def get(self, key: tuple, num: int) -> Optional[tuple[list, list]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        results, scores, depth, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        if depth < num and len(results) == depth:
+            # cached too shallow (and the search was not simply exhausted)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return results[:num], scores[:num]
+
+    def put(self, key: tuple, results: list, scores: list, num: int):
+        self._entries[key] = (results, scores, num, time.monotonic() + self.ttl_s)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self):
+        self._entries.clear()
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
@@ -1,37 +1,208 @@
 import argparse
+import asyncio
+import contextlib
+import copy
+import fcntl
+import functools
+import hashlib
 import json
+import multiprocessing
+import shutil
+import threading
+import time
 import warnings
 import os
-from typing import Optional
+from typing import Optional, Union
 
 import datasets
 import faiss
 import numpy as np
 import torch
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from tqdm import tqdm
-from transformers import AutoModel, AutoTokenizer
+from transformers import AutoConfig, AutoModel, AutoTokenizer
 
+from batching import PRIORITIES, MicroBatcher, QueueFullError, RequestTooLargeError
+from bm25_native import NativeBM25Index, init_search_worker, worker_search, is_native_bm25_index
+from corpus_store import CorpusStore, append_to_corpus_store, build_corpus_store, is_corpus_store
+from embedding_cache import EmbeddingCache, cache_key
+from faiss_index import RescoringIndex, make_search_params, set_default_search_params
+from metrics import (
+    CACHE_HIT_RATIO,
+    CACHE_LOOKUPS,
+    QUERIES_TOTAL,
+    QUEUE_DEPTH,
+    REGISTRY,
+    REQUEST_SECONDS,
+    REQUESTS_TOTAL,
+    stage_timer,
+)
+from readiness import LoadTracker
+from response_format import compact_doc, encode_response
+from result_cache import ResultCache
 
-def load_corpus(corpus_path: str):
+
+ENCODER_STATE_FILE = "model_state.pt"
+
+
+def _snapshot_fresh(snapshot_dir: str, name: str, source: dict) -> bool:
+    meta_path = os.path.join(snapshot_dir, f"{name}.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        return json.load(f) == source
+
+
+def _mark_snapshot(snapshot_dir: str, name: str, source: dict):
+    meta_path = os.path.join(snapshot_dir, f"{name}.json")
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(source, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+@contextlib.contextmanager
+def _snapshot_lock(snapshot_dir: str, name: str):
+    # With --workers N every process loads at once; the first one to get the lock builds the
+    # snapshot and the others wait for it, then find it fresh.
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, f"{name}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _replace_path(tmp_path: str, path: str):
+    # os.replace cannot overwrite a non-empty directory, so move the old one aside first
+    if os.path.isdir(path):
+        old_path = f"{path}.old-{os.getpid()}"
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path)
+    else:
+        os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=None)
+def _model_revision(model_path: str) -> str:
+    """The resolved commit of a Hub model id, or a content hash of a local model directory."""
+    if not os.path.isdir(model_path):
+        from huggingface_hub import snapshot_download
+
+        # resolves the ref through the Hub (or the local cache when offline) and fetches only the
+        # config; the returned snapshots/<commit> directory is named after the resolved revision
+        return os.path.basename(snapshot_download(model_path, allow_patterns=["config.json"]))
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(model_path):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, model_path).encode("utf-8"))
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 24), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+# Load progress of the retriever components, reported by /health and /ready.
+load_tracker = LoadTracker()
+
+
+def load_corpus(corpus_path: str, snapshot_dir: Optional[str] = None):
+    # A directory built by corpus_store.py is memory-mapped; a raw JSONL goes through datasets,
+    # or is converted once into a corpus store under snapshot_dir so later starts can mmap it.
+    if is_corpus_store(corpus_path):
+        return CorpusStore(corpus_path)
+    if snapshot_dir is not None:
+        store_dir = os.path.join(snapshot_dir, "corpus")
+        stat = os.stat(corpus_path)
+        source = {"corpus_path": os.path.abspath(corpus_path), "size": stat.st_size, "mtime": stat.st_mtime}
+        with _snapshot_lock(snapshot_dir, "corpus"):
+            if not _snapshot_fresh(snapshot_dir, "corpus", source):
+                # built next to the old snapshot and swapped in, so a crash never leaves a partial one
+                tmp_dir = f"{store_dir}.tmp-{os.getpid()}"
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                build_corpus_store(corpus_path, tmp_dir)
+                _replace_path(tmp_dir, store_dir)
+                _mark_snapshot(snapshot_dir, "corpus", source)
+        return CorpusStore(store_dir)
     corpus = datasets.load_dataset("json", data_files=corpus_path, split="train", num_proc=4)
     return corpus
 
 
 def load_docs(corpus, doc_idxs):
-    results = [corpus[int(idx)] for idx in doc_idxs]
-    return results
+    with stage_timer("load_docs"):
+        if isinstance(corpus, CorpusStore):
+            return corpus.get_many(doc_idxs)
+        results = [corpus[int(idx)] if int(idx) >= 0 else None for idx in doc_idxs]
+        return results
+
+
+def read_index(index_path: str, mmap: bool = False):
+    if not mmap:
+        return faiss.read_index(index_path)
+    # Map the index file instead of copying it into process memory, so every server worker
+    # shares one copy through the page cache. IO_FLAG_MMAP_IFC (faiss >= 1.10) also maps Flat codes.
+    io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    return faiss.read_index(index_path, io_flags)
 
 
-def load_model(model_path: str, use_fp16: bool = False):
-    model = AutoModel.from_pretrained(model_path, trust_remote_code=True)
+def load_model(
+    model_path: str,
+    use_fp16: bool = False,
+    device: str = "cuda",
+    use_int8: bool = False,
+    num_threads: Optional[int] = None,
+    snapshot_dir: Optional[str] = None,
+):
+    use_int8 = use_int8 and device == "cpu"
+    source = None
+    if snapshot_dir is not None:
+        # keyed on the weights themselves, not on a path that stays the same when they change
+        source = {
+            "model_path": os.path.abspath(model_path) if os.path.isdir(model_path) else model_path,
+            "revision": _model_revision(model_path),
+            "use_int8": use_int8,
+        }
+    with _snapshot_lock(snapshot_dir, "encoder") if snapshot_dir is not None else contextlib.nullcontext():
+        encoder_dir = os.path.join(snapshot_dir, "encoder") if snapshot_dir is not None else None
+        if snapshot_dir is not None and _snapshot_fresh(snapshot_dir, "encoder", source):
+            # config + state_dict of the (already quantized) model: skips from_pretrained weight
+            # conversion, and weights_only never unpickles arbitrary objects from the shared dir
+            model = AutoModel.from_config(AutoConfig.from_pretrained(encoder_dir), trust_remote_code=True)
+            if use_int8:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            model.load_state_dict(torch.load(os.path.join(encoder_dir, ENCODER_STATE_FILE), weights_only=True))
+            tokenizer = AutoTokenizer.from_pretrained(encoder_dir, use_fast=True)
+        else:
+            model = AutoModel.from_pretrained(model_path, trust_remote_code=True)
+            if use_int8:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True, trust_remote_code=True)
+            if snapshot_dir is not None:
+                tmp_dir = f"{encoder_dir}.tmp-{os.getpid()}"
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                os.makedirs(tmp_dir)
+                model.config.save_pretrained(tmp_dir)
+                tokenizer.save_pretrained(tmp_dir)
+                torch.save(model.state_dict(), os.path.join(tmp_dir, ENCODER_STATE_FILE))
+                _replace_path(tmp_dir, encoder_dir)
+                _mark_snapshot(snapshot_dir, "encoder", source)
     model.eval()
-    model.cuda()
-    if use_fp16:
-        model = model.half()
-    tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True, trust_remote_code=True)
+    if device == "cpu":
+        if num_threads is not None:
+            # pin intra-op parallelism so several server processes do not oversubscribe the cores
+            torch.set_num_threads(num_threads)
+    else:
+        model.to(device)
+        if use_fp16:
+            model = model.half()
     return model, tokenizer
 
 
@@ -47,19 +218,56 @@ def pooling(pooler_output, last_hidden_state, attention_mask=None, pooling_metho
         raise NotImplementedError("Pooling method not implemented!")
 
 
+def length_buckets(sorted_lengths, token_budget: int):
+    """Split ascending token lengths into contiguous slices whose padded size (rows x longest) fits the budget."""
+    start = 0
+    for end in range(1, len(sorted_lengths) + 1):
+        if (end - start) * sorted_lengths[end - 1] > token_budget and end - 1 > start:
+            yield slice(start, end - 1)
+            start = end - 1
+    yield slice(start, len(sorted_lengths))
+
+
 class Encoder:
-    def __init__(self, model_name, model_path, pooling_method, max_length, use_fp16):
+    def __init__(
+        self,
+        model_name,
+        model_path,
+        pooling_method,
+        max_length,
+        use_fp16,
+        device: Optional[str] = None,
+        use_int8: bool = False,
+        num_threads: Optional[int] = None,
+        cache: Optional[EmbeddingCache] = None,
+        snapshot_dir: Optional[str] = None,
+        token_budget: Optional[int] = None,
+    ):
         self.model_name = model_name
         self.model_path = model_path
         self.pooling_method = pooling_method
         self.max_length = max_length
-        self.use_fp16 = use_fp16
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = device
+        # fp16 only pays off on GPU; int8 dynamic quantization is CPU-only
+        self.use_fp16 = use_fp16 and device != "cpu"
+        self.use_int8 = use_int8 and device == "cpu"
 
-        self.model, self.tokenizer = load_model(model_path=model_path, use_fp16=use_fp16)
+        self.model, self.tokenizer = load_model(
+            model_path=model_path,
+            use_fp16=self.use_fp16,
+            device=device,
+            use_int8=self.use_int8,
+            num_threads=num_threads,
+            snapshot_dir=snapshot_dir,
+        )
         self.model.eval()
+        self.cache = cache
+        # Max padded tokens per forward pass; None encodes each call as a single padded batch.
+        self.token_budget = token_budget
 
-    @torch.no_grad()
-    def encode(self, query_list: list[str], is_query=True) -> np.ndarray:
+    def encode(self, query_list: list[str], is_query=True, use_cache: bool = True) -> np.ndarray:
         if isinstance(query_list, str):
             query_list = [query_list]
 
@@ -75,35 +283,107 @@ class Encoder:
                     f"Represent this sentence for searching relevant passages: {query}" for query in query_list
                 ]
 
-        inputs = self.tokenizer(
-            query_list, max_length=self.max_length, padding=True, truncation=True, return_tensors="pt"
+        if self.cache is None or not use_cache:
+            return self._encode(query_list)
+
+        # Only cache misses go through the model; duplicates within the batch are encoded once.
+        keys = [cache_key(self.cache.model_id, query, self.max_length) for query in query_list]
+        cached = self.cache.lookup(keys)
+        miss_keys = list(dict.fromkeys(key for key, emb in zip(keys, cached) if emb is None))
+        if miss_keys:
+            key_to_query = dict(zip(keys, query_list))
+            miss_embs = self._encode([key_to_query[key] for key in miss_keys])
+            self.cache.insert(miss_keys, miss_embs)
+            miss_map = dict(zip(miss_keys, miss_embs))
+            cached = [emb if emb is not None else miss_map[key] for key, emb in zip(keys, cached)]
+        return np.ascontiguousarray(np.stack(cached), dtype=np.float32)
+
+    def cache_model_id(self) -> str:
+        """Everything an embedding depends on besides the text, for keying the embedding cache."""
+        precision = "int8" if self.use_int8 else "fp16" if self.use_fp16 else "fp32"
+        return json.dumps(
+            {
+                "model_name": self.model_name,
+                "model_path": os.path.abspath(self.model_path) if os.path.isdir(self.model_path) else self.model_path,
+                "revision": _model_revision(self.model_path),
+                "precision": precision,
+                "pooling_method": self.pooling_method,
+            },
+            sort_keys=True,
         )
-        inputs = {k: v.cuda() for k, v in inputs.items()}
 
-        if "T5" in type(self.model).__name__:
-            decoder_input_ids = torch.zeros((inputs["input_ids"].shape[0], 1), dtype=torch.long).to(
-                inputs["input_ids"].device
-            )
-            output = self.model(**inputs, decoder_input_ids=decoder_input_ids, return_dict=True)
-            query_emb = output.last_hidden_state[:, 0, :]
-        else:
-            output = self.model(**inputs, return_dict=True)
-            query_emb = pooling(
-                output.pooler_output, output.last_hidden_state, inputs["attention_mask"], self.pooling_method
-            )
-            if "dpr" not in self.model_name.lower():
-                query_emb = torch.nn.functional.normalize(query_emb, dim=-1)
+    def _encode(self, query_list: list[str]) -> np.ndarray:
+        if self.token_budget is None or len(query_list) <= 1:
+            with stage_timer("tokenize"):
+                inputs = self.tokenizer(
+                    query_list, max_length=self.max_length, padding=True, truncation=True, return_tensors="pt"
+                )
+            return self._forward(inputs)
+
+        # Sort by token length and encode length buckets under the token budget, so short queries
+        # are not padded to the longest one in the batch; rows are scattered back in input order.
+        with stage_timer("tokenize"):
+            encoded = self.tokenizer(query_list, max_length=self.max_length, truncation=True)
+        lengths = np.array([len(ids) for ids in encoded["input_ids"]])
+        order = np.argsort(lengths, kind="stable")
+        query_emb = None
+        for bucket in length_buckets(lengths[order], self.token_budget):
+            rows = order[bucket]
+            with stage_timer("tokenize"):
+                inputs = self.tokenizer.pad(
+                    {key: [encoded[key][i] for i in rows] for key in encoded.keys()}, return_tensors="pt"
+                )
+            bucket_emb = self._forward(inputs)
+            if query_emb is None:
+                query_emb = np.empty((len(query_list), bucket_emb.shape[1]), dtype=np.float32)
+            query_emb[rows] = bucket_emb
+        return query_emb
+
+    @torch.no_grad()
+    def _forward(self, inputs) -> np.ndarray:
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with stage_timer("encode"):
+            if "T5" in type(self.model).__name__:
+                decoder_input_ids = torch.zeros((inputs["input_ids"].shape[0], 1), dtype=torch.long).to(
+                    inputs["input_ids"].device
+                )
+                output = self.model(**inputs, decoder_input_ids=decoder_input_ids, return_dict=True)
+                query_emb = output.last_hidden_state[:, 0, :]
+            else:
+                output = self.model(**inputs, return_dict=True)
+                query_emb = pooling(
+                    output.pooler_output, output.last_hidden_state, inputs["attention_mask"], self.pooling_method
+                )
+                if "dpr" not in self.model_name.lower():
+                    query_emb = torch.nn.functional.normalize(query_emb, dim=-1)
 
-        query_emb = query_emb.detach().cpu().numpy()
-        query_emb = query_emb.astype(np.float32, order="C")
+            query_emb = query_emb.detach().cpu().numpy()
+            query_emb = query_emb.astype(np.float32, order="C")
 
         del inputs, output
-        torch.cuda.empty_cache()
+        if self.device != "cpu":
+            torch.cuda.empty_cache()
 
         return query_emb
 
 
+def filter_hits(results: list, scores: list, topks: Optional[list] = None, min_scores: Optional[list] = None):
+    """Cut each query's hits to its own topk and drop hits scoring below its min_score (None = no cutoff)."""
+    out_results, out_scores = [], []
+    for i, (row_results, row_scores) in enumerate(zip(results, scores)):
+        k = topks[i] if topks is not None else len(row_results)
+        min_score = min_scores[i] if min_scores is not None else None
+        if min_score is not None:
+            k = min(k, sum(1 for score in row_scores[:k] if score >= min_score))
+        out_results.append(row_results[:k])
+        out_scores.append(row_scores[:k])
+    return out_results, out_scores
+
+
 class BaseRetriever:
+    # True when _batch_search applies topks / min_scores itself (and can skip fetching filtered docs)
+    filters_hits = False
+
     def __init__(self, config):
         self.config = config
         self.retrieval_method = config.retrieval_method
@@ -121,8 +401,34 @@ class BaseRetriever:
     def search(self, query: str, num: int = None, return_score: bool = False):
         return self._search(query, num, return_score)
 
-    def batch_search(self, query_list: list[str], num: int = None, return_score: bool = False):
-        return self._batch_search(query_list, num, return_score)
+    def batch_search(
+        self,
+        query_list: list[str],
+        num: int = None,
+        return_score: bool = False,
+        topks: Optional[list[int]] = None,
+        min_scores: Optional[list[Optional[float]]] = None,
+        **search_kwargs,
+    ):
+        """
+        `topks` / `min_scores` give each query its own depth and score cutoff; the batch is still
+        searched once at `num` (the largest topk). search_kwargs carries index-specific runtime
+        knobs (nprobe, ef_search); retrievers ignore unknown ones.
+        """
+        if topks is None and min_scores is None:
+            return self._batch_search(query_list, num, return_score, **search_kwargs)
+        if topks is not None:
+            num = max(topks)
+        if self.filters_hits:
+            return self._batch_search(
+                query_list, num, return_score, topks=topks, min_scores=min_scores, **search_kwargs
+            )
+        results, scores = self._batch_search(query_list, num, True, **search_kwargs)
+        results, scores = filter_hits(results, scores, topks, min_scores)
+        if return_score:
+            return results, scores
+        else:
+            return results
 
 
 class BM25Retriever(BaseRetriever):
@@ -130,10 +436,12 @@ class BM25Retriever(BaseRetriever):
         super().__init__(config)
         from pyserini.search.lucene import LuceneSearcher
 
-        self.searcher = LuceneSearcher(self.index_path)
-        self.contain_doc = self._check_contain_doc()
+        with load_tracker.track("bm25_index"):
+            self.searcher = LuceneSearcher(self.index_path)
+            self.contain_doc = self._check_contain_doc()
         if not self.contain_doc:
-            self.corpus = load_corpus(self.corpus_path)
+            with load_tracker.track("bm25_corpus"):
+                self.corpus = load_corpus(self.corpus_path, snapshot_dir=self.config.snapshot_dir)
         self.max_process_num = 8
 
     def _check_contain_doc(self):
@@ -142,7 +450,8 @@ class BM25Retriever(BaseRetriever):
     def _search(self, query: str, num: int = None, return_score: bool = False):
         if num is None:
             num = self.topk
-        hits = self.searcher.search(query, num)
+        with stage_timer("search"):
+            hits = self.searcher.search(query, num)
         if len(hits) < 1:
             if return_score:
                 return [], []
@@ -155,7 +464,8 @@ class BM25Retriever(BaseRetriever):
             hits = hits[:num]
 
         if self.contain_doc:
-            all_contents = [json.loads(self.searcher.doc(hit.docid).raw())["contents"] for hit in hits]
+            with stage_timer("load_docs"):
+                all_contents = [json.loads(self.searcher.doc(hit.docid).raw())["contents"] for hit in hits]
             results = [
                 {
                     "title": content.split("\n")[0].strip('"'),
@@ -172,7 +482,7 @@ class BM25Retriever(BaseRetriever):
         else:
             return results
 
-    def _batch_search(self, query_list: list[str], num: int = None, return_score: bool = False):
+    def _batch_search(self, query_list: list[str], num: int = None, return_score: bool = False, **search_kwargs):
         results = []
         scores = []
         for query in query_list:
@@ -185,32 +495,229 @@ class BM25Retriever(BaseRetriever):
             return results
 
 
+class NativeBM25Retriever(BaseRetriever):
+    """BM25 over an index built by bm25_native.py; no Pyserini/JVM needed."""
+
+    def __init__(self, config):
+        super().__init__(config)
+        with load_tracker.track("bm25_index"):
+            self.searcher = NativeBM25Index(self.index_path)
+            self.contain_doc = is_corpus_store(self.searcher.docs_dir)
+            if self.contain_doc:
+                self.docs = CorpusStore(self.searcher.docs_dir)
+        if not self.contain_doc:
+            with load_tracker.track("bm25_corpus"):
+                self.corpus = load_corpus(self.corpus_path, snapshot_dir=self.config.snapshot_dir)
+        self.max_process_num = 8
+        # Batches above this size are split across max_process_num worker processes.
+        self.min_parallel_batch = 64
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            # workers re-open the index by path, so the mmapped postings are shared via the page cache
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_process_num,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_search_worker,
+                initargs=(self.index_path,),
+            )
+        return self._pool
+
+    def _load_hits(self, doc_idxs):
+        if self.contain_doc:
+            with stage_timer("load_docs"):
+                docs = self.docs.get_many(doc_idxs)
+            # mirror the Pyserini contain_doc format
+            results = []
+            for doc in docs:
+                content = doc["contents"]
+                results.append(
+                    {
+                        "title": content.split("\n")[0].strip('"'),
+                        "text": "\n".join(content.split("\n")[1:]),
+                        "contents": content,
+                    }
+                )
+            return results
+        return load_docs(self.corpus, doc_idxs)
+
+    def _search(self, query: str, num: int = None, return_score: bool = False):
+        results, scores = self._batch_search([query], num, True)
+        if return_score:
+            return results[0], scores[0]
+        else:
+            return results[0]
+
+    def _batch_search(self, query_list: list[str], num: int = None, return_score: bool = False, **search_kwargs):
+        if isinstance(query_list, str):
+            query_list = [query_list]
+        if num is None:
+            num = self.topk
+
+        with stage_timer("search"):
+            if self.max_process_num > 1 and len(query_list) >= self.min_parallel_batch:
+                chunk_size = -(-len(query_list) // self.max_process_num)
+                chunks = [query_list[i : i + chunk_size] for i in range(0, len(query_list), chunk_size)]
+                batch_idxs, batch_scores = [], []
+                for chunk_idxs, chunk_scores in self._get_pool().map(worker_search, chunks, [num] * len(chunks)):
+                    batch_idxs.extend(chunk_idxs)
+                    batch_scores.extend(chunk_scores)
+            else:
+                batch_idxs, batch_scores = self.searcher.search(query_list, num)
+
+        if any(len(idxs) < num for idxs in batch_idxs):
+            warnings.warn("Not enough documents retrieved!", stacklevel=2)
+
+        # one gather for the docs of the whole batch
+        lengths = [len(idxs) for idxs in batch_idxs]
+        flat_results = self._load_hits(np.concatenate(batch_idxs) if batch_idxs else [])
+        results = []
+        offset = 0
+        for length in lengths:
+            results.append(flat_results[offset : offset + length])
+            offset += length
+        scores = [row_scores.tolist() for row_scores in batch_scores]
+
+        if return_score:
+            return results, scores
+        else:
+            return results
+
+
 class DenseRetriever(BaseRetriever):
+    filters_hits = True
+
     def __init__(self, config):
         super().__init__(config)
-        self.index = faiss.read_index(self.index_path)
+        # The three loads are independent and mostly release the GIL, so run them side by side.
+        loaded = load_tracker.run_parallel(
+            {
+                "index": lambda: self._load_index(config),
+                "corpus": lambda: load_corpus(self.corpus_path, snapshot_dir=config.snapshot_dir),
+                "encoder": lambda: self._load_encoder(config),
+            }
+        )
+        self.index = loaded["index"]
+        self.corpus = loaded["corpus"]
+        self.encoder = loaded["encoder"]
+        self.encoder.cache = self._build_embedding_cache(config)
+        self.topk = config.retrieval_topk
+        self.batch_size = config.retrieval_batch_size
+
+        # Appended docs go to a Flat delta index searched alongside the main one; delta row i
+        # is doc id base_ntotal + i, matching its position in the (appended) corpus store.
+        self.base_ntotal = self.index.ntotal
+        self.delta_index_path = config.delta_index_path
+        self.delta = None
+        self._delta_lock = threading.Lock()
+        self._append_lock = threading.Lock()
+        if self.delta_index_path is not None:
+            with load_tracker.track("delta_index"):
+                self._load_delta()
+
+    def _load_index(self, config):
+        index = read_index(self.index_path, mmap=config.faiss_mmap)
+        set_default_search_params(index, nprobe=config.faiss_nprobe, ef_search=config.faiss_ef_search)
         if config.faiss_gpu:
             co = faiss.GpuMultipleClonerOptions()
             co.useFloat16 = True
             co.shard = True
-            self.index = faiss.index_cpu_to_all_gpus(self.index, co=co)
+            index = faiss.index_cpu_to_all_gpus(index, co=co)
+        if config.rescore_vectors_path is not None:
+            # compressed first stage + exact rescoring of its candidates from the memmapped vectors
+            index = RescoringIndex(index, np.load(config.rescore_vectors_path, mmap_mode="r"), config.rescore_k)
+        return index
 
-        self.corpus = load_corpus(self.corpus_path)
-        self.encoder = Encoder(
+    def _load_encoder(self, config):
+        return Encoder(
             model_name=self.retrieval_method,
             model_path=config.retrieval_model_path,
             pooling_method=config.retrieval_pooling_method,
             max_length=config.retrieval_query_max_length,
             use_fp16=config.retrieval_use_fp16,
+            device=config.retrieval_device,
+            use_int8=config.retrieval_use_int8,
+            num_threads=config.retrieval_num_threads,
+            snapshot_dir=config.snapshot_dir,
+            token_budget=config.retrieval_token_budget,
         )
-        self.topk = config.retrieval_topk
-        self.batch_size = config.retrieval_batch_size
+
+    def _build_embedding_cache(self, config):
+        if not config.embedding_cache_bytes and config.embedding_cache_dir is None:
+            return None
+        return EmbeddingCache(
+            max_bytes=config.embedding_cache_bytes,
+            disk_cache_dir=config.embedding_cache_dir,
+            disk_max_rows=config.embedding_cache_disk_rows,
+            dim=self.index.d,
+            model_id=self.encoder.cache_model_id(),
+        )
+
+    def _load_delta(self):
+        if os.path.exists(self.delta_index_path):
+            self.delta = faiss.read_index(self.delta_index_path)
+        else:
+            self.delta = faiss.IndexFlatIP(self.index.d)
+        if not isinstance(self.corpus, CorpusStore):
+            return
+        # docs appended to the store whose vectors never made it into the delta (crash mid-append)
+        indexed = self.base_ntotal + self.delta.ntotal
+        if len(self.corpus) > indexed:
+            missing = np.arange(indexed, len(self.corpus))
+            self._add_to_delta(self._encode_docs(self.corpus.get_many(missing)), indexed)
+        elif len(self.corpus) < indexed:
+            warnings.warn(f"Corpus has {len(self.corpus)} docs but the indexes hold {indexed} vectors")
+
+    def _encode_docs(self, docs: list[dict]) -> np.ndarray:
+        contents = [doc["contents"] for doc in docs]
+        embs = [
+            self.encoder.encode(contents[i : i + self.batch_size], is_query=False, use_cache=False)
+            for i in range(0, len(contents), self.batch_size)
+        ]
+        return np.concatenate(embs) if embs else np.zeros((0, self.index.d), dtype=np.float32)
+
+    def _add_to_delta(self, embs: np.ndarray, start_id: int):
+        if start_id != self.base_ntotal + self.delta.ntotal:
+            raise RuntimeError(f"Appended doc id {start_id} does not follow the indexed ones; ids would shift")
+        with self._delta_lock:
+            self.delta.add(embs)
+        tmp_path = self.delta_index_path + ".tmp"
+        faiss.write_index(self.delta, tmp_path)
+        os.replace(tmp_path, self.delta_index_path)
+
+    def append_documents(self, docs: list[dict]) -> list[int]:
+        """Encode `docs`, append them to the corpus store and the delta index; returns their doc ids."""
+        if self.delta_index_path is None or not isinstance(self.corpus, CorpusStore):
+            raise ValueError("Appending needs --delta_index_path and a corpus store (see corpus_store.py)")
+        with self._append_lock:
+            embs = self._encode_docs(docs)
+            # store first: on a crash before the delta is saved, _load_delta re-encodes the tail
+            start_id = append_to_corpus_store(self.corpus.store_dir, docs)
+            self.corpus.refresh()
+            self._add_to_delta(embs, start_id)
+        return list(range(start_id, start_id + len(docs)))
+
+    def _search_index(self, query_emb: np.ndarray, num: int, params=None):
+        scores, idxs = self.index.search(query_emb, k=num, params=params)
+        if self.delta is None or self.delta.ntotal == 0:
+            return scores, idxs
+        with self._delta_lock:
+            delta_scores, delta_idxs = self.delta.search(query_emb, k=num)
+        delta_idxs = np.where(delta_idxs >= 0, delta_idxs + self.base_ntotal, -1)
+        all_idxs = np.concatenate([idxs, delta_idxs], axis=1)
+        all_scores = np.concatenate([scores, delta_scores], axis=1)
+        all_scores = np.where(all_idxs >= 0, all_scores, -np.inf)
+        order = np.argsort(-all_scores, axis=1, kind="stable")[:, :num]
+        return np.take_along_axis(all_scores, order, axis=1), np.take_along_axis(all_idxs, order, axis=1)
 
     def _search(self, query: str, num: int = None, return_score: bool = False):
         if num is None:
             num = self.topk
         query_emb = self.encoder.encode(query)
-        scores, idxs = self.index.search(query_emb, k=num)
+        scores, idxs = self._search_index(query_emb, num)
         idxs = idxs[0]
         scores = scores[0]
         results = load_docs(self.corpus, idxs)
@@ -219,39 +726,172 @@ class DenseRetriever(BaseRetriever):
         else:
             return results
 
-    def _batch_search(self, query_list: list[str], num: int = None, return_score: bool = False):
+    def _batch_search(
+        self,
+        query_list: list[str],
+        num: int = None,
+        return_score: bool = False,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        topks: Optional[list[int]] = None,
+        min_scores: Optional[list[Optional[float]]] = None,
+    ):
         if isinstance(query_list, str):
             query_list = [query_list]
         if num is None:
             num = self.topk
+        if topks is not None:
+            num = max(topks)
+        # Per-request knobs only apply to CPU indexes; GPU clones keep the server-wide defaults.
+        params = None
+        if not self.config.faiss_gpu:
+            params = make_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+
+        # With a token budget the encoder sizes its own forward passes, so the whole list is encoded
+        # at once and length buckets span all of it; batch_size then only chunks search and doc fetch.
+        all_emb = self.encoder.encode(query_list) if self.encoder.token_budget is not None else None
 
         results = []
         scores = []
         for start_idx in tqdm(range(0, len(query_list), self.batch_size), desc="Retrieval process: "):
             query_batch = query_list[start_idx : start_idx + self.batch_size]
-            batch_emb = self.encoder.encode(query_batch)
-            batch_scores, batch_idxs = self.index.search(batch_emb, k=num)
-            batch_scores = batch_scores.tolist()
-            batch_idxs = batch_idxs.tolist()
+            if all_emb is not None:
+                batch_emb = all_emb[start_idx : start_idx + self.batch_size]
+            else:
+                batch_emb = self.encoder.encode(query_batch)
+            with stage_timer("search"):
+                batch_scores, batch_idxs = self._search_index(batch_emb, num, params=params)
 
-            flat_idxs = sum(batch_idxs, [])
-            batch_results = load_docs(self.corpus, flat_idxs)
-            batch_results = [batch_results[i * num : (i + 1) * num] for i in range(len(batch_idxs))]
+            # Approximate indexes pad with -1 when fewer than num candidates are found; per-query
+            # topk and min_score cutoffs are applied here too so dropped hits are never fetched.
+            keep = batch_idxs >= 0
+            if topks is not None:
+                batch_topks = np.asarray(topks[start_idx : start_idx + self.batch_size])
+                keep &= np.arange(num)[None, :] < batch_topks[:, None]
+            if min_scores is not None:
+                batch_min = np.array(
+                    [-np.inf if m is None else m for m in min_scores[start_idx : start_idx + self.batch_size]],
+                    dtype=np.float32,
+                )
+                keep &= batch_scores >= batch_min[:, None]
 
-            results.extend(batch_results)
-            scores.extend(batch_scores)
+            flat_idxs = batch_idxs[keep]
+            flat_results = load_docs(self.corpus, flat_idxs)
+            flat_scores = batch_scores[keep].tolist()
+            bounds = np.concatenate([[0], np.cumsum(keep.sum(axis=1))]).tolist()
+            results.extend(flat_results[bounds[i] : bounds[i + 1]] for i in range(len(batch_idxs)))
+            scores.extend(flat_scores[bounds[i] : bounds[i + 1]] for i in range(len(batch_idxs)))
 
-            del batch_emb, batch_scores, batch_idxs, query_batch, flat_idxs, batch_results
-            torch.cuda.empty_cache()
+            del batch_emb, batch_scores, batch_idxs, query_batch, flat_idxs, flat_results, keep
+            if self.encoder.device != "cpu":
+                torch.cuda.empty_cache()
+        del all_emb
+
+        if return_score:
+            return results, scores
+        else:
+            return results
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Runs a sparse (BM25) and a dense retriever on the same batch concurrently and fuses the
+    two rankings, either with reciprocal rank fusion or a weighted sum of min-max normalised scores.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        from concurrent.futures import ThreadPoolExecutor
+
+        sparse_config = copy.copy(config)
+        sparse_config.retrieval_method = "bm25"
+        sparse_config.index_path = config.sparse_index_path
+        # load both sides concurrently as well
+        loaded = load_tracker.run_parallel(
+            {
+                "sparse_retriever": lambda: get_retriever(sparse_config, allow_hybrid=False),
+                "dense_retriever": lambda: get_retriever(config, allow_hybrid=False),
+            }
+        )
+        self.sparse = loaded["sparse_retriever"]
+        self.dense = loaded["dense_retriever"]
+        # expose the dense encoder so its embedding cache shows up in /stats
+        self.encoder = getattr(self.dense, "encoder", None)
 
+        self.fusion = config.hybrid_fusion
+        self.alpha = config.hybrid_alpha
+        self.rrf_k = config.hybrid_rrf_k
+        self.candidate_multiplier = config.hybrid_candidate_multiplier
+        # faiss and torch release the GIL, so the two searches overlap and the batch costs ~max(sparse, dense)
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    @staticmethod
+    def _doc_key(doc):
+        # Pyserini contain_doc hits carry no corpus id, so match the two sides on contents
+        return doc.get("contents") or doc.get("id")
+
+    def _fuse(self, sparse_docs, sparse_scores, dense_docs, dense_scores, num):
+        fused = {}
+        docs = {}
+        for weight, ranked_docs, ranked_scores in [
+            (1.0 - self.alpha, sparse_docs, sparse_scores),
+            (self.alpha, dense_docs, dense_scores),
+        ]:
+            if not ranked_docs:
+                continue
+            if self.fusion == "rrf":
+                contributions = [1.0 / (self.rrf_k + rank + 1) for rank in range(len(ranked_docs))]
+            else:
+                low, high = min(ranked_scores), max(ranked_scores)
+                span = high - low if high > low else 1.0
+                contributions = [weight * (score - low) / span for score in ranked_scores]
+            for doc, contribution in zip(ranked_docs, contributions):
+                key = self._doc_key(doc)
+                docs.setdefault(key, doc)
+                fused[key] = fused.get(key, 0.0) + contribution
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:num]
+        return [docs[key] for key, _ in ranked], [score for _, score in ranked]
+
+    def _search(self, query: str, num: int = None, return_score: bool = False):
+        results, scores = self._batch_search([query], num, True)
+        if return_score:
+            return results[0], scores[0]
+        else:
+            return results[0]
+
+    def _batch_search(self, query_list: list[str], num: int = None, return_score: bool = False, **search_kwargs):
+        if isinstance(query_list, str):
+            query_list = [query_list]
+        if num is None:
+            num = self.topk
+        num_candidates = num * self.candidate_multiplier
+
+        sparse_future = self._executor.submit(self.sparse.batch_search, query_list, num_candidates, True)
+        dense_future = self._executor.submit(
+            self.dense.batch_search, query_list, num_candidates, True, **search_kwargs
+        )
+        sparse_results, sparse_scores = sparse_future.result()
+        dense_results, dense_scores = dense_future.result()
+
+        results, scores = [], []
+        for i in range(len(query_list)):
+            item_results, item_scores = self._fuse(
+                sparse_results[i], sparse_scores[i], dense_results[i], dense_scores[i], num
+            )
+            results.append(item_results)
+            scores.append(item_scores)
         if return_score:
             return results, scores
         else:
             return results
 
 
-def get_retriever(config):
+def get_retriever(config, allow_hybrid: bool = True):
+    if allow_hybrid and config.sparse_index_path is not None:
+        return HybridRetriever(config)
     if config.retrieval_method == "bm25":
+        if is_native_bm25_index(config.index_path):
+            return NativeBM25Retriever(config)
         return BM25Retriever(config)
     else:
         return DenseRetriever(config)
@@ -270,11 +910,38 @@ class Config:
         dataset_path: str = "./data",
         data_split: str = "train",
         faiss_gpu: bool = True,
+        faiss_mmap: bool = False,
+        snapshot_dir: Optional[str] = None,
         retrieval_model_path: str = "./model",
         retrieval_pooling_method: str = "mean",
         retrieval_query_max_length: int = 256,
         retrieval_use_fp16: bool = False,
         retrieval_batch_size: int = 128,
+        retrieval_token_budget: Optional[int] = None,
+        retrieval_device: Optional[str] = None,
+        retrieval_use_int8: bool = False,
+        retrieval_num_threads: Optional[int] = None,
+        embedding_cache_bytes: int = 0,
+        embedding_cache_dir: Optional[str] = None,
+        embedding_cache_disk_rows: int = 1_000_000,
+        result_cache_size: int = 0,
+        result_cache_ttl_s: float = 3600.0,
+        sparse_index_path: Optional[str] = None,
+        hybrid_fusion: str = "rrf",
+        hybrid_alpha: float = 0.5,
+        hybrid_rrf_k: int = 60,
+        hybrid_candidate_multiplier: int = 2,
+        timing_headers: bool = False,
+        snippet_max_chars: Optional[int] = None,
+        batch_max_size: int = 512,
+        batch_max_wait_ms: float = 5.0,
+        max_queue_queries: int = 4096,
+        default_priority: str = "training",
+        faiss_nprobe: Optional[int] = None,
+        faiss_ef_search: Optional[int] = None,
+        delta_index_path: Optional[str] = None,
+        rescore_vectors_path: Optional[str] = None,
+        rescore_k: int = 100,
     ):
         self.retrieval_method = retrieval_method
         self.retrieval_topk = retrieval_topk
@@ -283,31 +950,171 @@ class Config:
         self.dataset_path = dataset_path
         self.data_split = data_split
         self.faiss_gpu = faiss_gpu
+        self.faiss_mmap = faiss_mmap
+        self.snapshot_dir = snapshot_dir
         self.retrieval_model_path = retrieval_model_path
         self.retrieval_pooling_method = retrieval_pooling_method
         self.retrieval_query_max_length = retrieval_query_max_length
         self.retrieval_use_fp16 = retrieval_use_fp16
         self.retrieval_batch_size = retrieval_batch_size
+        self.retrieval_token_budget = retrieval_token_budget
+        self.retrieval_device = retrieval_device
+        self.retrieval_use_int8 = retrieval_use_int8
+        self.retrieval_num_threads = retrieval_num_threads
+        self.embedding_cache_bytes = embedding_cache_bytes
+        self.embedding_cache_dir = embedding_cache_dir
+        self.embedding_cache_disk_rows = embedding_cache_disk_rows
+        self.result_cache_size = result_cache_size
+        self.result_cache_ttl_s = result_cache_ttl_s
+        self.sparse_index_path = sparse_index_path
+        self.hybrid_fusion = hybrid_fusion
+        self.hybrid_alpha = hybrid_alpha
+        self.hybrid_rrf_k = hybrid_rrf_k
+        self.hybrid_candidate_multiplier = hybrid_candidate_multiplier
+        self.timing_headers = timing_headers
+        self.snippet_max_chars = snippet_max_chars
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait_ms = batch_max_wait_ms
+        self.max_queue_queries = max_queue_queries
+        self.default_priority = default_priority
+        self.faiss_nprobe = faiss_nprobe
+        self.faiss_ef_search = faiss_ef_search
+        self.delta_index_path = delta_index_path
+        self.rescore_vectors_path = rescore_vectors_path
+        self.rescore_k = rescore_k
 
 
 class QueryRequest(BaseModel):
     queries: list[str]
-    topk: Optional[int] = None
+    # One value for the whole request, or one per query
+    topk: Union[None, int, list[int]] = None
+    min_score: Union[None, float, list[Optional[float]]] = None
     return_scores: bool = False
+    # Truncate each document's text to this many characters and return {"id", "title", "text"} only
+    max_chars: Optional[int] = None
+    # Queue lane: interactive, training, validation or bulk (server default when omitted)
+    priority: Optional[str] = None
+    # Optional per-request overrides for IVF / HNSW indexes
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
 
+# config is set by __main__ in single-process mode; with --workers > 1 each uvicorn worker imports
+# this module and reads it from CONFIG_ENV. Either way the retriever is built on startup.
+CONFIG_ENV = "RETRIEVAL_SERVER_CONFIG"
+config: Optional[Config] = None
+retriever: Optional[BaseRetriever] = None
 
 app = FastAPI()
+batcher: Optional[MicroBatcher] = None
+result_cache: Optional[ResultCache] = None
+
+
+def _search_with_scores(query_list: list[str], num: int, **search_kwargs):
+    return retriever.batch_search(query_list=query_list, num=num, return_score=True, **search_kwargs)
+
+
+async def cached_search(
+    query_list: list[str],
+    num: Union[int, list[int]],
+    timings: Optional[dict] = None,
+    min_score: Union[None, float, list[Optional[float]]] = None,
+    priority: Optional[str] = None,
+    **search_kwargs,
+):
+    """
+    Answer what we can from the result cache and send only the unique misses to the batcher.
+    `num` and `min_score` are either one value for the whole request or one per query.
+    """
+    search_kwargs = {k: v for k, v in search_kwargs.items() if v is not None}
+    if result_cache is None:
+        return await batcher.submit(
+            query_list, num, timings=timings, min_score=min_score, priority=priority, **search_kwargs
+        )
+
+    topks = list(num) if isinstance(num, (list, tuple)) else [num] * len(query_list)
+    keys = [ResultCache.make_key(query, search_kwargs) for query in query_list]
+    found = [result_cache.get(key, k) for key, k in zip(keys, topks)]
+    miss_topks = {}
+    for query, k, hit in zip(query_list, topks, found):
+        if hit is None:
+            miss_topks[query] = max(k, miss_topks.get(query, 0))
+    if miss_topks:
+        # cache entries hold unfiltered hits, so min_score is applied below rather than in the search
+        miss_queries = list(miss_topks)
+        miss_results, miss_scores = await batcher.submit(
+            miss_queries, list(miss_topks.values()), timings=timings, priority=priority, **search_kwargs
+        )
+        fresh = {}
+        for query, results, scores in zip(miss_queries, miss_results, miss_scores):
+            result_cache.put(ResultCache.make_key(query, search_kwargs), results, scores, miss_topks[query])
+            fresh[query] = (results, scores)
+        found = [hit if hit is not None else fresh[query] for query, hit in zip(query_list, found)]
+    min_scores = list(min_score) if isinstance(min_score, (list, tuple)) else [min_score] * len(query_list)
+    return filter_hits([hit[0] for hit in found], [hit[1] for hit in found], topks, min_scores)
+
+
+def invalidate_caches():
+    """Hook to call whenever the index or corpus behind `retriever` is swapped."""
+    if result_cache is not None:
+        result_cache.invalidate()
+
+
+def _load_retriever():
+    global retriever
+    try:
+        with load_tracker.track("retriever"):
+            retriever = get_retriever(config)
+    except Exception as e:
+        print(f"Failed to load the retriever: {e!r}")
+
+
+@app.on_event("startup")
+async def start_batcher():
+    global config, batcher, result_cache
+    if config is None:
+        config = Config(**json.loads(os.environ[CONFIG_ENV]))
+    # Serve /health and /ready right away and load the retriever in the background.
+    load_tracker.expect("retriever")
+    threading.Thread(target=_load_retriever, name="retriever-loader", daemon=True).start()
+    batcher = MicroBatcher(
+        _search_with_scores,
+        max_batch_size=config.batch_max_size,
+        max_wait_ms=config.batch_max_wait_ms,
+        max_queue_queries=config.max_queue_queries,
+        default_priority=config.default_priority,
+    )
+    await batcher.start()
+    if config.result_cache_size > 0:
+        result_cache = ResultCache(max_entries=config.result_cache_size, ttl_s=config.result_cache_ttl_s)
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batcher is not None:
+        await batcher.stop()
+    encoder = getattr(retriever, "encoder", None)
+    if encoder is not None and encoder.cache is not None:
+        encoder.cache.flush()
+
+
 # Path to output retrieval metrics
 @app.post("/retrieve")
-def retrieve_endpoint(request: QueryRequest):
+async def retrieve_endpoint(request: QueryRequest, http_request: Request):
     """
     Endpoint that accepts queries and performs retrieval.
+    Queries are answered from the result cache when possible; the misses of concurrent
+    requests are coalesced by the MicroBatcher into a single encoder forward and index search.
 
     Input format:
     {
       "queries": ["What is Python?", "Tell me about neural networks."],
-      "topk": 3,
-      "return_scores": true
+      "topk": 3,  # or one per query, e.g. [3, 10]
+      "min_score": 0.8,  # optional; drops hits scoring below it (one value or one per query)
+      "return_scores": true,
+      "max_chars": 1200,  # optional; compact {"id", "title", "text", "truncated"} snippets without "contents"
+      "priority": "training",  # optional; interactive / training / validation / bulk
+      "nprobe": 64  # optional, IVF indexes only (ef_search for HNSW)
     }
 
     Output format (when return_scores=True, similarity scores are returned):
@@ -318,18 +1125,61 @@ def retrieve_endpoint(request: QueryRequest):
                 # ... more documents
             ],
             # ... results for other queries
-        ]
+        ],
+        "queue_wait_ms": 1.3  # time spent queued before the batch that served this request ran
     }
+
+    Requests are queued in per-priority lanes, in chunks of at most --batch_max_size queries;
+    when a lane is full the request fails fast with 429 and a Retry-After header instead of
+    waiting, and a request larger than --max_queue_queries gets 413.
+
+    The body is msgpack when the request sends "Accept: application/msgpack", JSON otherwise.
+
+    With --timing_headers, or when the request sends "X-Request-Timing: 1", the response carries
+    a Server-Timing header with the queue wait and per-stage times (ms) of the batch that served it.
     """
+    t0 = time.perf_counter()
+    if retriever is None:
+        REQUESTS_TOTAL.inc(status="loading")
+        raise HTTPException(status_code=503, detail="Retriever is still loading", headers={"Retry-After": "10"})
     if not request.topk:
         request.topk = config.retrieval_topk
+    for name, value in (("topk", request.topk), ("min_score", request.min_score)):
+        if isinstance(value, list) and len(value) != len(request.queries):
+            REQUESTS_TOTAL.inc(status="invalid")
+            raise HTTPException(status_code=422, detail=f"{name} must have one entry per query")
+    if request.priority is not None and request.priority not in PRIORITIES:
+        REQUESTS_TOTAL.inc(status="invalid")
+        raise HTTPException(status_code=422, detail=f"priority must be one of {PRIORITIES}")
+    QUERIES_TOTAL.inc(len(request.queries))
 
-    # Perform batch retrieval
-    results, scores = retriever.batch_search(
-        query_list=request.queries, num=request.topk, return_score=request.return_scores
-    )
+    # Perform batch retrieval (cached, and coalesced with other in-flight requests)
+    timings = {}
+    try:
+        results, scores = await cached_search(
+            request.queries,
+            request.topk,
+            timings=timings,
+            min_score=request.min_score,
+            priority=request.priority,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+        )
+    except QueueFullError as e:
+        REQUESTS_TOTAL.inc(status="rejected")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except RequestTooLargeError as e:
+        REQUESTS_TOTAL.inc(status="rejected")
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        REQUESTS_TOTAL.inc(status="error")
+        raise
 
     # Format response
+    max_chars = request.max_chars or config.snippet_max_chars
+    if max_chars:
+        with stage_timer("format"):
+            results = [[compact_doc(doc, max_chars) for doc in single_result] for single_result in results]
     resp = []
     for i, single_result in enumerate(results):
         if request.return_scores:
@@ -339,19 +1189,116 @@ def retrieve_endpoint(request: QueryRequest):
             resp.append(combined)
         else:
             resp.append(single_result)
-    return {"result": resp}
+
+    with stage_timer("serialize"):
+        t_serialize = time.perf_counter()
+        body = {"result": resp, "queue_wait_ms": 1000.0 * timings.get("queue", 0.0)}
+        response = encode_response(body, http_request.headers.get("accept", ""))
+        timings["serialize"] = time.perf_counter() - t_serialize
+    timings["total"] = time.perf_counter() - t0
+    REQUESTS_TOTAL.inc(status="ok")
+    REQUEST_SECONDS.observe(timings["total"])
+
+    if config.timing_headers or http_request.headers.get("x-request-timing") == "1":
+        batch_size = timings.pop("batch_size", 0)
+        response.headers["Server-Timing"] = ", ".join(
+            f"{stage};dur={1000.0 * seconds:.2f}" for stage, seconds in timings.items()
+        )
+        response.headers["X-Retrieval-Batch-Size"] = str(batch_size)
+    return response
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text-format metrics: stage histograms, batch sizes, queue depth, cache hit ratios."""
+    if batcher is not None:
+        for lane, lane_stats in batcher.stats()["lanes"].items():
+            QUEUE_DEPTH.set(lane_stats["queued_requests"], lane=lane)
+    encoder = getattr(retriever, "encoder", None)
+    caches = {
+        "result": result_cache.stats() if result_cache is not None else None,
+        "embedding": encoder.cache.stats() if encoder is not None and encoder.cache is not None else None,
+    }
+    for name, cache_stats in caches.items():
+        if cache_stats is None:
+            continue
+        CACHE_HIT_RATIO.set(cache_stats["hit_rate"], cache=name)
+        CACHE_LOOKUPS.set(cache_stats["hits"] + cache_stats.get("disk_hits", 0), cache=name, outcome="hit")
+        CACHE_LOOKUPS.set(cache_stats["misses"], cache=name, outcome="miss")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+def health_endpoint():
+    # liveness: the process is up and serving, whether or not the retriever has finished loading
+    return {"status": "failed" if load_tracker.failed else "ok", **load_tracker.status()}
+
+
+@app.get("/ready")
+def ready_endpoint():
+    status = load_tracker.status()
+    status["ready"] = status["ready"] and retriever is not None
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/stats")
+def stats_endpoint():
+    encoder = getattr(retriever, "encoder", None)
+    return {
+        "batcher": batcher.stats() if batcher is not None else None,
+        "embedding_cache": encoder.cache.stats() if encoder is not None and encoder.cache is not None else None,
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+    }
+
+
+class AppendRequest(BaseModel):
+    # corpus-format docs, e.g. {"id": "...", "contents": "\"Title\"\ntext"}
+    documents: list[dict]
+
+
+@app.post("/append")
+async def append_endpoint(request: AppendRequest):
+    """
+    Encode new documents and make them searchable right away: they are appended to the corpus
+    store and to the delta index, and get the next doc ids (existing ids never change).
+    Merge the delta into the main index offline with append_docs.py --merge.
+    """
+    if retriever is None:
+        raise HTTPException(status_code=503, detail="Retriever is still loading", headers={"Retry-After": "10"})
+    dense = getattr(retriever, "dense", retriever)
+    if not hasattr(dense, "append_documents"):
+        raise HTTPException(status_code=400, detail="Only dense retrievers support appends")
+    if any("contents" not in doc for doc in request.documents):
+        raise HTTPException(status_code=422, detail='Every document needs a "contents" field')
+    loop = asyncio.get_running_loop()
+    try:
+        ids = await loop.run_in_executor(None, dense.append_documents, request.documents)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    invalidate_caches()
+    return {"ids": ids, "num_docs": len(dense.corpus)}
+
+
+@app.post("/cache/invalidate")
+def invalidate_endpoint():
+    invalidate_caches()
+    return {"result_cache": result_cache.stats() if result_cache is not None else None}
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Launch the local faiss retriever.")
     parser.add_argument(
-        "--index_path", type=str, default="/home/peterjin/mnt/index/wiki-18/e5_Flat.index", help="Corpus indexing file."
+        "--index_path",
+        type=str,
+        default="/home/peterjin/mnt/index/wiki-18/e5_Flat.index",
+        help="Corpus indexing file (Flat, or a variant built by build_index.py); for bm25, a Pyserini or "
+        "bm25_native.py index directory.",
     )
     parser.add_argument(
         "--corpus_path",
         type=str,
         default="/home/peterjin/mnt/data/retrieval-corpus/wiki-18.jsonl",
-        help="Local corpus file.",
+        help="Local corpus file, or a store directory built by corpus_store.py.",
     )
     parser.add_argument("--topk", type=int, default=3, help="Number of retrieved passages for one query.")
     parser.add_argument("--retriever_name", type=str, default="e5", help="Name of the retriever model.")
@@ -359,6 +1306,118 @@ if __name__ == "__main__":
         "--retriever_model", type=str, default="intfloat/e5-base-v2", help="Path of the retriever model."
     )
     parser.add_argument("--faiss_gpu", action="store_true", help="Use GPU for computation")
+    parser.add_argument(
+        "--faiss_mmap", action="store_true", help="Memory-map the index file (shared by all workers, CPU only)."
+    )
+    parser.add_argument(
+        "--snapshot_dir",
+        type=str,
+        default=None,
+        help="Directory for a binary snapshot of the loaded corpus and encoder; restarts load from it.",
+    )
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to bind.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of server processes sharing the port. Use with --faiss_mmap and a corpus store so the "
+        "index and corpus are shared through the page cache instead of copied per worker.",
+    )
+    parser.add_argument(
+        "--retriever_device", type=str, default=None, help="Device for the query encoder (cuda/cpu, default: auto)."
+    )
+    parser.add_argument(
+        "--retriever_int8", action="store_true", help="Dynamic int8 quantization of the encoder (CPU only)."
+    )
+    parser.add_argument(
+        "--retriever_num_threads", type=int, default=None, help="torch intra-op threads for CPU encoding."
+    )
+    parser.add_argument(
+        "--embedding_cache_mb", type=int, default=0, help="In-memory query-embedding cache size in MB (0 disables)."
+    )
+    parser.add_argument(
+        "--embedding_cache_dir", type=str, default=None, help="Directory for the persistent query-embedding cache."
+    )
+    parser.add_argument(
+        "--embedding_cache_disk_rows", type=int, default=1_000_000, help="Max embeddings kept in the disk cache."
+    )
+    parser.add_argument(
+        "--result_cache_size", type=int, default=0, help="Max queries kept in the top-k result cache (0 disables)."
+    )
+    parser.add_argument("--result_cache_ttl_s", type=float, default=3600.0, help="TTL of result cache entries.")
+    parser.add_argument(
+        "--sparse_index_path",
+        type=str,
+        default=None,
+        help="BM25 index (Pyserini or bm25_native.py); when set, serve hybrid sparse+dense retrieval.",
+    )
+    parser.add_argument(
+        "--hybrid_fusion", type=str, default="rrf", choices=["rrf", "weighted"], help="Hybrid rank fusion method."
+    )
+    parser.add_argument(
+        "--hybrid_alpha", type=float, default=0.5, help="Dense weight for weighted fusion (sparse gets 1 - alpha)."
+    )
+    parser.add_argument("--hybrid_rrf_k", type=int, default=60, help="k constant of reciprocal rank fusion.")
+    parser.add_argument(
+        "--hybrid_candidate_multiplier", type=int, default=2, help="Each side retrieves topk * this many candidates."
+    )
+    parser.add_argument(
+        "--timing_headers", action="store_true", help="Add Server-Timing stage breakdowns to every response."
+    )
+    parser.add_argument(
+        "--snippet_max_chars",
+        type=int,
+        default=None,
+        help="Default max_chars for every request: return compact truncated snippets without 'contents' "
+        "(clients that read 'contents' need the full documents).",
+    )
+    parser.add_argument(
+        "--delta_index_path",
+        type=str,
+        default=None,
+        help="Flat index of appended docs, searched alongside --index_path; enables POST /append (needs a "
+        "corpus store and --workers 1).",
+    )
+    parser.add_argument(
+        "--rescore_vectors_path",
+        type=str,
+        default=None,
+        help="fp16/fp32 .npy of the index's vectors (build_index.py --rescore_vectors_path); candidates from "
+        "--index_path are rescored exactly against it.",
+    )
+    parser.add_argument("--rescore_k", type=int, default=100, help="Candidates per query to rescore.")
+    parser.add_argument("--nprobe", type=int, default=None, help="Default nprobe for IVF indexes.")
+    parser.add_argument("--ef_search", type=int, default=None, help="Default efSearch for HNSW indexes.")
+    parser.add_argument(
+        "--encode_token_budget",
+        type=int,
+        default=None,
+        help="Max padded tokens per encoder forward pass; queries are bucketed by length over the whole batch "
+        "instead of retrieval_batch_size chunks (default: fixed chunks).",
+    )
+    parser.add_argument(
+        "--batch_max_size", type=int, default=512, help="Max number of queries coalesced into one retrieval batch."
+    )
+    parser.add_argument(
+        "--batch_max_wait_ms",
+        type=float,
+        default=5.0,
+        help="Max time (ms) to wait for more requests before dispatching a batch.",
+    )
+    parser.add_argument(
+        "--max_queue_queries",
+        type=int,
+        default=4096,
+        help="Max queued queries per priority lane; beyond it 429 with Retry-After, 413 for one larger request.",
+    )
+    parser.add_argument(
+        "--default_priority",
+        type=str,
+        default="training",
+        choices=PRIORITIES,
+        help="Lane for requests that do not set a priority.",
+    )
 
     args = parser.parse_args()
 
@@ -369,15 +1428,45 @@ if __name__ == "__main__":
         corpus_path=args.corpus_path,
         retrieval_topk=args.topk,
         faiss_gpu=args.faiss_gpu,
+        faiss_mmap=args.faiss_mmap,
+        snapshot_dir=args.snapshot_dir,
         retrieval_model_path=args.retriever_model,
         retrieval_pooling_method="mean",
         retrieval_query_max_length=256,
         retrieval_use_fp16=True,
         retrieval_batch_size=512,
+        retrieval_token_budget=args.encode_token_budget,
+        retrieval_device=args.retriever_device,
+        retrieval_use_int8=args.retriever_int8,
+        retrieval_num_threads=args.retriever_num_threads,
+        embedding_cache_bytes=args.embedding_cache_mb * 1024 * 1024,
+        embedding_cache_dir=args.embedding_cache_dir,
+        embedding_cache_disk_rows=args.embedding_cache_disk_rows,
+        result_cache_size=args.result_cache_size,
+        result_cache_ttl_s=args.result_cache_ttl_s,
+        sparse_index_path=args.sparse_index_path,
+        hybrid_fusion=args.hybrid_fusion,
+        hybrid_alpha=args.hybrid_alpha,
+        hybrid_rrf_k=args.hybrid_rrf_k,
+        hybrid_candidate_multiplier=args.hybrid_candidate_multiplier,
+        timing_headers=args.timing_headers,
+        snippet_max_chars=args.snippet_max_chars,
+        batch_max_size=args.batch_max_size,
+        batch_max_wait_ms=args.batch_max_wait_ms,
+        max_queue_queries=args.max_queue_queries,
+        default_priority=args.default_priority,
+        faiss_nprobe=args.nprobe,
+        faiss_ef_search=args.ef_search,
+        delta_index_path=args.delta_index_path,
+        rescore_vectors_path=args.rescore_vectors_path,
+        rescore_k=args.rescore_k,
     )
 
-    # 2) Instantiate a global retriever so it is loaded once and reused.
-    retriever = get_retriever(config)
-
-    # 3) Launch the server.
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # 2) Launch the server. The retriever is loaded in the background on startup (poll /ready);
+    #    with several workers each one builds its own, and the uvicorn master process holds the
+    #    listening socket and spreads incoming connections across them.
+    if args.workers > 1:
+        os.environ[CONFIG_ENV] = json.dumps(vars(config))
+        uvicorn.run("retrieval_server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
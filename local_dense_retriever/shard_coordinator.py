@@ -0,0 +1,174 @@
+"""
+Scatter-gather coordinator in front of several shard retrieval servers.
+
+Every shard runs retrieval_server.py over a contiguous doc-id range (see shard_index.py).
+The coordinator exposes the same /retrieve API: it sends each batch to all shards in
+parallel, asks them for scores, and merges the per-query top-k by score. Shards that error
+or exceed --shard_timeout are skipped; the response then lists them under "failed_shards"
+(or the request fails with 503 when --no_partial is set). When every shard turns the request
+away with 429, the coordinator answers 429 with the longest Retry-After.
+
+    python shard_coordinator.py --shard_urls http://127.0.0.1:8001/retrieve http://127.0.0.1:8002/retrieve
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+
+import requests
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+
+class ShardClient:
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.num_requests = 0
+        self.num_failures = 0
+        self.total_latency = 0.0
+
+    def retrieve(self, payload: dict) -> list:
+        t0 = time.perf_counter()
+        self.num_requests += 1
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()["result"]
+        except Exception:
+            self.num_failures += 1
+            raise
+        finally:
+            self.total_latency += time.perf_counter() - t0
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "num_requests": self.num_requests,
+            "num_failures": self.num_failures,
+            "avg_latency_ms": 1000.0 * self.total_latency / self.num_requests if self.num_requests else 0.0,
+        }
+
+
+def merge_topk(
+    shard_results: list[list], topks: list[int], min_scores: Optional[list[Optional[float]]] = None
+) -> list[list[dict]]:
+    """
+    Merge per-shard [[{"document", "score"}, ...] per query] lists into one top-k per query,
+    using each query's own topk and dropping hits below its min_score (None = no cutoff).
+    """
+    merged = []
+    for i, per_query in enumerate(zip(*shard_results)):
+        hits = [hit for shard_hits in per_query for hit in shard_hits]
+        min_score = min_scores[i] if min_scores is not None else None
+        if min_score is not None:
+            hits = [hit for hit in hits if hit["score"] >= min_score]
+        hits.sort(key=lambda hit: hit["score"], reverse=True)
+        merged.append(hits[: topks[i]])
+    return merged
+
+
+class QueryRequest(BaseModel):
+    # mirrors retrieval_server.QueryRequest; everything but return_scores is forwarded to the shards
+    queries: list[str]
+    # One value for the whole request, or one per query
+    topk: Union[None, int, list[int]] = None
+    min_score: Union[None, float, list[Optional[float]]] = None
+    return_scores: bool = False
+    # Truncate each document's text to this many characters and return {"id", "title", "text"} only
+    max_chars: Optional[int] = None
+    # Queue lane: interactive, training, validation or bulk (shard default when omitted)
+    priority: Optional[str] = None
+    # Optional per-request overrides for IVF / HNSW indexes
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+
+app = FastAPI()
+shards: list[ShardClient] = []
+executor: Optional[ThreadPoolExecutor] = None
+default_topk = 3
+allow_partial = True
+
+
+@app.post("/retrieve")
+async def retrieve_endpoint(request: QueryRequest):
+    topk = request.topk or default_topk
+    for name, value in (("topk", topk), ("min_score", request.min_score)):
+        if isinstance(value, list) and len(value) != len(request.queries):
+            raise HTTPException(status_code=422, detail=f"{name} must have one entry per query")
+    payload = {
+        "queries": request.queries,
+        "topk": topk,
+        "min_score": request.min_score,
+        "return_scores": True,
+        "max_chars": request.max_chars,
+        "priority": request.priority,
+        "nprobe": request.nprobe,
+        "ef_search": request.ef_search,
+    }
+    loop = asyncio.get_running_loop()
+    # wait_for bounds the whole call; the requests timeout alone only bounds each socket read
+    calls = [
+        asyncio.wait_for(loop.run_in_executor(executor, shard.retrieve, payload), shard.timeout) for shard in shards
+    ]
+    outcomes = await asyncio.gather(*calls, return_exceptions=True)
+
+    shard_results, failed_shards = [], []
+    for shard, outcome in zip(shards, outcomes):
+        if isinstance(outcome, Exception):
+            failed_shards.append({"url": shard.url, "error": repr(outcome)})
+        else:
+            shard_results.append(outcome)
+    if not shard_results:
+        retry_after = [
+            int(outcome.response.headers.get("Retry-After", 1))
+            for outcome in outcomes
+            if isinstance(outcome, requests.HTTPError)
+            and outcome.response is not None
+            and outcome.response.status_code == 429
+        ]
+        if len(retry_after) == len(shards):
+            raise HTTPException(
+                status_code=429, detail={"failed_shards": failed_shards}, headers={"Retry-After": str(max(retry_after))}
+            )
+    if not shard_results or (failed_shards and not allow_partial):
+        raise HTTPException(status_code=503, detail={"failed_shards": failed_shards})
+
+    topks = list(topk) if isinstance(topk, list) else [topk] * len(request.queries)
+    min_scores = request.min_score if isinstance(request.min_score, list) else [request.min_score] * len(topks)
+    merged = merge_topk(shard_results, topks, min_scores)
+    if not request.return_scores:
+        merged = [[hit["document"] for hit in hits] for hits in merged]
+    resp = {"result": merged}
+    if failed_shards:
+        resp["failed_shards"] = failed_shards
+    return resp
+
+
+@app.get("/stats")
+def stats_endpoint():
+    return {"shards": [shard.stats() for shard in shards]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Launch the scatter-gather coordinator over shard servers.")
+    parser.add_argument("--shard_urls", type=str, nargs="+", required=True, help="/retrieve URL of every shard.")
+    parser.add_argument("--shard_timeout", type=float, default=30.0, help="Per-shard request timeout in seconds.")
+    parser.add_argument("--no_partial", action="store_true", help="Fail the request if any shard fails.")
+    parser.add_argument("--topk", type=int, default=3, help="Number of retrieved passages for one query.")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to bind.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind.")
+    args = parser.parse_args()
+
+    shards = [ShardClient(url, args.shard_timeout) for url in args.shard_urls]
+    # enough threads for several concurrent fan-outs to every shard
+    executor = ThreadPoolExecutor(max_workers=8 * len(shards))
+    default_topk = args.topk
+    allow_partial = not args.no_partial
+
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,75 @@
+"""
+Split a Flat index and its corpus store into contiguous doc-id shards for scatter-gather serving.
+
+Shard i covers doc ids [start_i, end_i) and gets its own index (Flat, or any variant from
+faiss_index.py) and corpus store slice under <output_dir>/shard_<i>/:
+
+    python corpus_store.py --corpus_path wiki-18.jsonl --output_dir wiki-18.store
+    python shard_index.py --index_path e5_Flat.index --corpus_path wiki-18.store --num_shards 4 --output_dir shards
+
+Each shard is then served by its own retrieval_server.py and fronted by shard_coordinator.py.
+"""
+
+import argparse
+import json
+import os
+
+import faiss
+import numpy as np
+
+from corpus_store import DOCS_FILE, OFFSETS_FILE, CorpusStore, is_corpus_store
+from faiss_index import INDEX_TYPES, build_index, flat_index_vectors
+
+COPY_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def write_corpus_slice(store: CorpusStore, start: int, end: int, output_dir: str):
+    os.makedirs(output_dir, exist_ok=True)
+    offsets = np.asarray(store.offsets[start : end + 1], dtype=np.int64)
+    with open(os.path.join(store.store_dir, DOCS_FILE), "rb") as fin, open(
+        os.path.join(output_dir, DOCS_FILE), "wb"
+    ) as fout:
+        fin.seek(int(offsets[0]))
+        remaining = int(offsets[-1] - offsets[0])
+        while remaining > 0:
+            chunk = fin.read(min(COPY_CHUNK_BYTES, remaining))
+            fout.write(chunk)
+            remaining -= len(chunk)
+    np.save(os.path.join(output_dir, OFFSETS_FILE), offsets - offsets[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split an index and corpus store into contiguous shards.")
+    parser.add_argument("--index_path", type=str, required=True, help="Flat index covering the whole corpus.")
+    parser.add_argument("--corpus_path", type=str, required=True, help="Corpus store built by corpus_store.py.")
+    parser.add_argument("--num_shards", type=int, required=True, help="Number of shards.")
+    parser.add_argument("--output_dir", type=str, required=True, help="Directory to write shard_<i>/ into.")
+    parser.add_argument("--index_type", type=str, default="flat", choices=INDEX_TYPES, help="Index type per shard.")
+    parser.add_argument("--nlist", type=int, default=16384, help="Number of IVF lists per shard.")
+    parser.add_argument("--pq_m", type=int, default=64, help="Number of PQ sub-quantizers.")
+    parser.add_argument("--hnsw_m", type=int, default=32, help="HNSW graph degree.")
+    args = parser.parse_args()
+
+    if not is_corpus_store(args.corpus_path):
+        parser.error("--corpus_path must be a corpus store directory; build one with corpus_store.py first.")
+
+    vectors = flat_index_vectors(faiss.read_index(args.index_path))
+    store = CorpusStore(args.corpus_path)
+    if len(store) != len(vectors):
+        raise ValueError(f"Index has {len(vectors)} vectors but the corpus store has {len(store)} docs")
+
+    bounds = np.linspace(0, len(vectors), args.num_shards + 1).astype(np.int64)
+    manifest = []
+    for shard_id, (start, end) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+        shard_dir = os.path.join(args.output_dir, f"shard_{shard_id}")
+        os.makedirs(shard_dir, exist_ok=True)
+        shard_index = build_index(
+            vectors[start:end], args.index_type, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m
+        )
+        faiss.write_index(shard_index, os.path.join(shard_dir, "index.faiss"))
+        write_corpus_slice(store, start, end, os.path.join(shard_dir, "corpus"))
+        manifest.append({"shard_id": shard_id, "start": start, "end": end, "path": shard_dir})
+        print(f"Wrote shard {shard_id}: docs [{start}, {end})")
+
+    with open(os.path.join(args.output_dir, "manifest.json"), "w") as f:
+        json.dump({"index_type": args.index_type, "num_docs": len(vectors), "shards": manifest}, f, indent=2)
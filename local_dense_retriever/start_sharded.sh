@@ -0,0 +1,30 @@
+# Scatter-gather serving on one machine: split the index once, then run one retrieval server
+# per shard on ports 8001.. and the coordinator on 8000 (same /retrieve API as start.sh).
+index_file=/mnt/workspace/yanwentao/retrieval/e5_Flat.index
+corpus_store=/mnt/workspace/yanwentao/retrieval/wiki-18.store
+shard_dir=/mnt/workspace/yanwentao/retrieval/shards
+retriever_name=e5
+retriever_path=/mnt/workspace/yanwentao/retrieval/e5-base-v2
+num_shards=4
+code_dir=/mnt/workspace/yanwentao/code/multimodal-search-r1/local_dense_retriever
+
+if [ ! -f $shard_dir/manifest.json ]; then
+    python $code_dir/shard_index.py --index_path $index_file \
+                                    --corpus_path $corpus_store \
+                                    --num_shards $num_shards \
+                                    --output_dir $shard_dir
+fi
+
+shard_urls=""
+for ((i = 0; i < num_shards; i++)); do
+    port=$((8001 + i))
+    python $code_dir/retrieval_server.py --index_path $shard_dir/shard_$i/index.faiss \
+                                         --corpus_path $shard_dir/shard_$i/corpus \
+                                         --topk 3 \
+                                         --retriever_name $retriever_name \
+                                         --retriever_model $retriever_path \
+                                         --port $port &
+    shard_urls="$shard_urls http://127.0.0.1:$port/retrieve"
+done
+
+python $code_dir/shard_coordinator.py --shard_urls $shard_urls --topk 3 --port 8000
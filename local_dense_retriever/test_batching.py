@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher, QueueFullError, RequestTooLargeError
+
+
+class FakeSearch:
+    """search_fn that answers query q with hits "q#0", "q#1", ... and records every batch."""
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, query_list, num, topks=None, min_scores=None, **search_kwargs):
+        self.release.wait(5)
+        self.batches.append((list(query_list), num, topks, search_kwargs))
+        time.sleep(self.delay_s)
+        results = [[f"{q}#{i}" for i in range(num)] for q in query_list]
+        scores = [[1.0 - 0.1 * i for i in range(num)] for _ in query_list]
+        return results, scores
+
+
+def run(coro_fn, search, **kwargs):
+    async def main():
+        batcher = MicroBatcher(search, **kwargs)
+        await batcher.start()
+        try:
+            return await coro_fn(batcher)
+        finally:
+            await batcher.stop()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_search():
+    search = FakeSearch()
+
+    async def scenario(batcher):
+        first, second = await asyncio.gather(
+            batcher.submit(["a", "b"], 1),
+            batcher.submit(["c"], 3),
+        )
+        return first, second, batcher.stats()
+
+    (results_1, scores_1), (results_2, _), stats = run(scenario, search, max_batch_size=8, max_wait_ms=50)
+    assert results_1 == [["a#0"], ["b#0"]] and scores_1 == [[1.0], [1.0]]
+    assert results_2 == [["c#0", "c#1", "c#2"]]
+    assert len(search.batches) == 1
+    queries, num, topks, _ = search.batches[0]
+    assert queries == ["a", "b", "c"] and num == 3 and topks == [1, 1, 3]
+    assert stats["num_batches"] == 1 and stats["num_requests"] == 2 and stats["num_queries"] == 3
+
+
+def test_large_request_is_searched_in_max_batch_size_chunks():
+    search = FakeSearch()
+    queries = [f"q{i}" for i in range(10)]
+
+    async def scenario(batcher):
+        timings = {}
+        results, _ = await batcher.submit(queries, 2, timings=timings)
+        return results, timings, batcher.stats()
+
+    results, timings, stats = run(scenario, search, max_batch_size=4, max_wait_ms=1)
+    assert results == [[f"{q}#0", f"{q}#1"] for q in queries]
+    assert [len(batch[0]) for batch in search.batches] == [4, 4, 2]
+    assert stats["num_requests"] == 1 and stats["num_batches"] == 3
+    assert timings["batch_size"] == 4 and timings["queue"] >= 0
+
+
+def test_higher_lane_is_served_between_chunks_of_a_bulk_request():
+    search = FakeSearch(delay_s=0.05)
+
+    async def scenario(batcher):
+        bulk = asyncio.ensure_future(batcher.submit([f"bulk{i}" for i in range(12)], 1, priority="bulk"))
+        await asyncio.sleep(0.02)  # the first bulk chunk is being searched
+        interactive = await batcher.submit(["now"], 1, priority="interactive")
+        assert not bulk.done()
+        await bulk
+        return interactive
+
+    results, _ = run(scenario, search, max_batch_size=4, max_wait_ms=1)
+    assert results == [["now#0"]]
+    batch_queries = [batch[0] for batch in search.batches]
+    assert batch_queries[1] == ["now"]
+    assert all(len(queries) <= 4 for queries in batch_queries)
+
+
+def test_full_lane_is_rejected_with_retry_after():
+    search = FakeSearch()
+    search.release.clear()
+
+    async def scenario(batcher):
+        searching = asyncio.ensure_future(batcher.submit(["a", "b", "c", "d"], 1))
+        await asyncio.sleep(0.02)  # taken from the lane, blocked in search
+        queued = asyncio.ensure_future(batcher.submit(["e", "f", "g", "h"], 1))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as excinfo:
+            await batcher.submit(["i"], 1)
+        # other lanes have their own bound
+        interactive = asyncio.ensure_future(batcher.submit(["j"], 1, priority="interactive"))
+        await asyncio.sleep(0)
+        stats = batcher.stats()
+        search.release.set()
+        await asyncio.gather(searching, queued, interactive)
+        return excinfo.value, stats
+
+    error, stats = run(scenario, search, max_batch_size=4, max_wait_ms=1, max_queue_queries=4)
+    assert error.priority == "training" and error.retry_after >= 1
+    assert stats["lanes"]["training"]["rejected"] == 1
+    assert stats["lanes"]["training"]["queued_queries"] == 4
+
+
+def test_request_larger_than_the_lane_bound_is_too_large():
+    async def scenario(batcher):
+        with pytest.raises(RequestTooLargeError) as excinfo:
+            await batcher.submit([f"q{i}" for i in range(5)], 1)
+        with pytest.raises(ValueError, match="Unknown priority"):
+            await batcher.submit(["q"], 1, priority="urgent")
+        assert await batcher.submit([], 1) == ([], [])
+        return excinfo.value, batcher.stats()
+
+    error, stats = run(scenario, FakeSearch(), max_batch_size=2, max_queue_queries=4)
+    assert isinstance(error, ValueError)
+    assert (error.num_queries, error.max_queue_queries) == (5, 4)
+    assert stats["lanes"]["training"]["rejected"] == 1
+
+
+def test_search_error_reaches_every_request_in_the_batch():
+    def failing_search(query_list, num, **kwargs):
+        raise RuntimeError("index unavailable")
+
+    async def scenario(batcher):
+        return await asyncio.gather(
+            batcher.submit(["a"], 1), batcher.submit(["b"], 1), return_exceptions=True
+        )
+
+    errors = run(scenario, failing_search, max_batch_size=8, max_wait_ms=20)
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_search_kwargs_split_batches():
+    search = FakeSearch()
+
+    async def scenario(batcher):
+        await asyncio.gather(batcher.submit(["a"], 1, nprobe=8), batcher.submit(["b"], 1, nprobe=64))
+
+    run(scenario, search, max_batch_size=8, max_wait_ms=20)
+    assert sorted((batch[0], batch[3]) for batch in search.batches) == [
+        (["a"], {"nprobe": 8}),
+        (["b"], {"nprobe": 64}),
+    ]
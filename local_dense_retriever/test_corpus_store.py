@@ -0,0 +1,70 @@
+import gzip
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tqdm")
+
+from corpus_store import CorpusStore, append_to_corpus_store, build_corpus_store, is_corpus_store
+
+DOCS = [
+    {"id": "0", "contents": '"Schloss Uster"\nA castle in Uster.'},
+    {"id": "1", "contents": '"Zürich"\nThe largest city in Switzerland.'},
+    {"id": "2", "contents": '"Short"\n'},
+]
+
+
+def write_jsonl(path, docs, opener=open):
+    with opener(path, "wt", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+        f.write("\n")  # blank lines are skipped
+
+
+@pytest.fixture
+def store(tmp_path):
+    write_jsonl(tmp_path / "corpus.jsonl", DOCS)
+    assert build_corpus_store(str(tmp_path / "corpus.jsonl"), str(tmp_path / "store")) == len(DOCS)
+    return CorpusStore(str(tmp_path / "store"))
+
+
+def test_offsets_index_every_doc(store):
+    assert is_corpus_store(store.store_dir)
+    assert len(store) == len(DOCS)
+    assert store.offsets[0] == 0 and store.offsets[-1] == len(store.blob)
+    assert np.all(np.diff(store.offsets) > 0)
+    assert store.get_many(range(len(DOCS))) == DOCS
+    assert store[1] == DOCS[1]
+
+
+def test_get_many_keeps_order_and_maps_invalid_ids_to_none(store):
+    assert store.get_many([2, -1, 0, 3, 2]) == [DOCS[2], None, DOCS[0], None, DOCS[2]]
+    assert store.get_many(np.array([[1], [0]])) == [DOCS[1], DOCS[0]]
+    assert store.get_many([]) == []
+    assert store.get_raw_many([-1, 99]) == [None, None]
+
+
+def test_gzipped_corpus(tmp_path):
+    write_jsonl(tmp_path / "corpus.jsonl.gz", DOCS, opener=gzip.open)
+    build_corpus_store(str(tmp_path / "corpus.jsonl.gz"), str(tmp_path / "store"))
+    assert CorpusStore(str(tmp_path / "store")).get_many([0, 1, 2]) == DOCS
+
+
+def test_empty_store(tmp_path):
+    (tmp_path / "corpus.jsonl").write_text("")
+    assert build_corpus_store(str(tmp_path / "corpus.jsonl"), str(tmp_path / "store")) == 0
+    store = CorpusStore(str(tmp_path / "store"))
+    assert len(store) == 0
+    assert store.get_many([0, -1, 5]) == [None, None, None]
+    assert store.get_many([]) == []
+
+
+def test_append_keeps_ids_and_drops_interrupted_bytes(store):
+    extra = [{"id": "3", "contents": '"New"\nAppended doc.'}]
+    with open(f"{store.store_dir}/docs.bin", "ab") as f:
+        f.write(b'{"half": ')  # left over from a crashed append
+    assert append_to_corpus_store(store.store_dir, extra) == len(DOCS)
+    assert len(store) == len(DOCS)  # the open reader keeps its offsets until refresh()
+    store.refresh()
+    assert store.get_many(range(len(DOCS) + 1)) == DOCS + extra
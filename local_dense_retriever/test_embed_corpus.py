@@ -0,0 +1,37 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("tqdm")
+
+from embed_corpus import MANIFEST_FILE, check_manifest, chunk_done, write_json
+
+
+def test_manifest_is_written_then_enforced(tmp_path):
+    progress_dir = str(tmp_path)
+    check_manifest(progress_dir, num_docs=1000, dim=768, chunk_size=100)
+    with open(os.path.join(progress_dir, MANIFEST_FILE)) as f:
+        assert json.load(f) == {"num_docs": 1000, "dim": 768, "chunk_size": 100}
+
+    check_manifest(progress_dir, num_docs=1000, dim=768, chunk_size=100)
+    with pytest.raises(ValueError, match="chunk_size"):
+        check_manifest(progress_dir, num_docs=1000, dim=768, chunk_size=50)
+    with pytest.raises(ValueError):
+        check_manifest(progress_dir, num_docs=1001, dim=768, chunk_size=100)
+
+
+def test_markers_only_count_for_the_rows_they_cover(tmp_path):
+    marker_path = str(tmp_path / "chunk_000001.json")
+    assert not chunk_done(marker_path, 1, 100, 200)
+    write_json(marker_path, {"chunk_id": 1, "start": 100, "end": 200})
+    assert chunk_done(marker_path, 1, 100, 200)
+    # the same file name under another chunk size covers different rows
+    assert not chunk_done(marker_path, 1, 50, 100)
+
+
+def test_runs_from_before_the_manifest_still_resume(tmp_path):
+    write_json(str(tmp_path / "chunk_000000.json"), {"chunk_id": 0, "start": 0, "end": 100})
+    check_manifest(str(tmp_path), num_docs=250, dim=8, chunk_size=100)
+    assert chunk_done(str(tmp_path / "chunk_000000.json"), 0, 0, 100)
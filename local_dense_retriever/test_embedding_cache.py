@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from embedding_cache import DiskEmbeddingStore, EmbeddingCache, cache_key
+
+DIM = 4
+
+
+def vec(i: int) -> np.ndarray:
+    return np.full(DIM, i, dtype=np.float32)
+
+
+def test_cache_key_covers_model_and_length():
+    key = cache_key("model-a", "query: q", 64)
+    assert key == cache_key("model-a", "query: q", 64)
+    assert key != cache_key("model-b", "query: q", 64)
+    assert key != cache_key("model-a", "query: q", 128)
+
+
+def test_memory_lru_is_bounded_by_bytes():
+    cache = EmbeddingCache(max_bytes=2 * vec(0).nbytes)
+    cache.insert(["a", "b"], np.stack([vec(1), vec(2)]))
+    assert cache.lookup(["a"])[0] is not None  # a is now the most recent
+    cache.insert(["c"], np.stack([vec(3)]))
+    found = cache.lookup(["a", "b", "c"])
+    assert found[1] is None
+    np.testing.assert_array_equal(found[0], vec(1))
+    np.testing.assert_array_equal(found[2], vec(3))
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    cache = EmbeddingCache(max_bytes=1 << 20, disk_cache_dir=str(tmp_path), dim=DIM, model_id="m")
+    cache.insert(["a", "b"], np.stack([vec(1), vec(2)]))
+    cache.flush()
+    del cache
+
+    cache = EmbeddingCache(max_bytes=1 << 20, disk_cache_dir=str(tmp_path), dim=DIM, model_id="m")
+    found = cache.lookup(["a", "b", "c"])
+    np.testing.assert_array_equal(found[0], vec(1))
+    np.testing.assert_array_equal(found[1], vec(2))
+    assert found[2] is None
+    assert cache.stats()["disk_hits"] == 2
+
+
+def test_disk_ring_buffer_reuses_oldest_rows(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), DIM, max_rows=3)
+    for i in range(5):
+        store.put(f"k{i}", vec(i))
+    assert len(store) == 3
+    assert store.get("k0") is None and store.get("k1") is None
+    for i in range(2, 5):
+        np.testing.assert_array_equal(store.get(f"k{i}"), vec(i))
+    assert store.next_row == 2
+
+
+def test_reader_sees_flushed_rows_and_misses_recycled_ones(tmp_path):
+    writer = DiskEmbeddingStore(str(tmp_path), DIM, max_rows=2)
+    writer.put("a", vec(1))
+    writer.flush()
+    reader = DiskEmbeddingStore(str(tmp_path), DIM, max_rows=2, refresh_s=0.0)
+    assert writer.writable and not reader.writable
+    np.testing.assert_array_equal(reader.get("a"), vec(1))
+    reader.put("z", vec(9))  # readers never write
+    assert writer.get("z") is None
+
+    # the writer wraps around and recycles a's row before the reader refreshes
+    writer.put("b", vec(2))
+    writer.put("c", vec(3))
+    reader.refresh_s = 3600.0
+    assert reader.get("a") is None
+    writer.flush()
+    reader.refresh()
+    np.testing.assert_array_equal(reader.get("c"), vec(3))
+
+
+def test_tier_of_another_model_is_not_used(tmp_path):
+    writer = DiskEmbeddingStore(str(tmp_path), DIM, max_rows=4, model_id="fp32")
+    writer.put("a", vec(1))
+    writer.flush()
+    with pytest.warns(UserWarning, match="not using it"):
+        reader = DiskEmbeddingStore(str(tmp_path), DIM, max_rows=4, model_id="int8")
+    assert reader.get("a") is None and len(reader) == 0
+
+    writer._writer_lock.close()
+    with pytest.warns(UserWarning, match="starting it over"):
+        writer = DiskEmbeddingStore(str(tmp_path), DIM, max_rows=4, model_id="int8")
+    assert writer.writable and len(writer) == 0
@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+from response_format import compact_doc
+
+DOCS = [
+    {"id": "0", "contents": '"Schloss Uster"\nSchloss Uster is a castle in the municipality of Uster.'},
+    {"id": "1", "contents": '"Zürich"\nZürich is the largest city in Switzerland.\nSecond line.'},
+    {"id": "2", "contents": '"Empty"'},
+    {"id": "3", "title": "Plain title", "text": "A corpus with separate title and text fields."},
+]
+
+
+def test_compact_doc_keeps_title_and_cuts_text_without_marker():
+    compact = compact_doc(DOCS[0], 10)
+    assert compact == {"id": "0", "title": '"Schloss Uster"', "text": "Schloss Us", "truncated": True}
+    assert compact_doc(DOCS[1], 1000) == {
+        "id": "1",
+        "title": '"Zürich"',
+        "text": "Zürich is the largest city in Switzerland.\nSecond line.",
+    }
+    assert compact_doc(DOCS[2], 10) == {"id": "2", "title": '"Empty"', "text": ""}
+    assert compact_doc(DOCS[3], 8)["title"] == "Plain title"
+    assert compact_doc(None, 10) is None
+
+
+@pytest.mark.parametrize("max_chars", [1, 10, 42, 43, 1200])
+def test_compact_output_formats_like_full_documents(max_chars):
+    passages_to_string = pytest.importorskip("mmsearch_r1.utils.tools.text_search_batcher").passages_to_string
+    full = [{"document": doc, "score": 1.0} for doc in DOCS[:3]]
+    compact = [{"document": compact_doc(doc, max_chars), "score": 1.0} for doc in DOCS[:3]]
+    assert passages_to_string(compact, max_chars=max_chars) == passages_to_string(full, max_chars=max_chars)
@@ -38,6 +38,7 @@ from verl.utils.seqlen_balancing import (
 from mmsearch_r1.monkey_patch.monkey_patch import create_colocated_worker_cls_patch
 from mmsearch_r1.trainer.multimodal.core_algos import compute_grpo_outcome_advantage
 from mmsearch_r1.utils.dataset.mm_rl_dataset import RLHFDataset, collate_fn
+from mmsearch_r1.utils.tools.flow_control import reduce_flow_control_stats
 
 WorkerType = Type[Worker]
 import torch
@@ -655,6 +656,7 @@ class RayPPOTrainer:
             test_output_gen_batch_padded = self.actor_rollout_wg.generate_sequences(test_gen_batch_padded)
             # unpad
             test_output_gen_batch = unpad_dataproto(test_output_gen_batch_padded, pad_size=pad_size)
+            test_output_gen_batch.non_tensor_batch.pop('search_flow_control', None)
             print('validation generation end')
 
             # Store generated outputs
@@ -1049,6 +1051,11 @@ class RayPPOTrainer:
                     )
                     with _timer('gen', timing_raw):
                         gen_batch_output = self.actor_rollout_wg.generate_sequences(gen_batch)
+                        # search backend health (flow control state, rejections, fallbacks) across all rollout workers
+                        if 'search_flow_control' in gen_batch_output.non_tensor_batch:
+                            metrics.update(
+                                reduce_flow_control_stats(gen_batch_output.non_tensor_batch.pop('search_flow_control'))
+                            )
                         del gen_batch  # FIXME: cause error when "self.config.algorithm.adv_estimator == AdvantageEstimator.REMAX"
                     print(
                         f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [Global Step: {self.global_steps}] Rollout Ends ..."
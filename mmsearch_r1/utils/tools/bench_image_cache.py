@@ -0,0 +1,135 @@
+"""
+Per-call latency of call_image_search on the folder layout vs. a packed cache, cold and warm.
+
+Builds a synthetic folder cache (or uses --folder_cache), packs it (or uses --pack), then for each
+layout times one call per sampled id right after dropping the page cache (cold) and once more
+with everything cached (warm). Cold runs write /proc/sys/vm/drop_caches when running as root,
+which also drops dentries and inodes; otherwise they fall back to posix_fadvise(DONTNEED) on every
+file, which evicts data pages but not cached metadata, so cold folder numbers are optimistic.
+
+    python -m mmsearch_r1.utils.tools.bench_image_cache --num_entries 2000 --num_calls 500
+    python -m mmsearch_r1.utils.tools.bench_image_cache --folder_cache /nas/.../fvqa_train_cache \\
+        --pack /nas/.../fvqa_train_cache.pack --num_calls 500
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from mmsearch_r1.utils.tools import image_cache_pack
+from mmsearch_r1.utils.tools.image_cache_pack import pack_image_cache
+from mmsearch_r1.utils.tools.image_search import call_image_search
+
+
+def build_synthetic_cache(cache_dir: str, num_entries: int, images_per_entry: int, image_size: int):
+    rng = np.random.default_rng(0)
+    for n in range(num_entries):
+        entry_dir = os.path.join(cache_dir, f"fvqa_train_{n:06d}")
+        os.makedirs(entry_dir, exist_ok=True)
+        with open(os.path.join(entry_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "title_list": [f"synthetic page {n}-{i}" for i in range(images_per_entry)],
+                    "image_urls": [f"https://example.com/{n}/{i}.jpg" for i in range(images_per_entry)],
+                },
+                f,
+            )
+        for i in range(images_per_entry):
+            pixels = rng.integers(0, 256, size=(image_size, image_size, 3), dtype=np.uint8)
+            ext = "jpg" if i % 2 == 0 else "png"
+            Image.fromarray(pixels).save(os.path.join(entry_dir, f"img_{i:03d}.{ext}"))
+
+
+def drop_page_cache(paths: list[str]) -> str:
+    os.sync()
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return "drop_caches"
+    except OSError:
+        pass
+    for root in paths:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                fd = os.open(os.path.join(dirpath, filename), os.O_RDONLY)
+                try:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
+    return "fadvise"
+
+
+def time_calls(cache_ids: list[str], decode: bool) -> dict:
+    latencies = []
+    for cache_id in cache_ids:
+        t0 = time.perf_counter()
+        _, images, tool_stat = call_image_search(image_url="", cache_id=cache_id)
+        if decode:
+            for img in images:
+                img.load()
+        latencies.append(time.perf_counter() - t0)
+        assert tool_stat["success"], tool_stat
+    latencies.sort()
+    stats = {"mean_ms": 1000 * sum(latencies) / len(latencies)}
+    for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        stats[name] = 1000 * latencies[int(q * (len(latencies) - 1))]
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark folder vs packed FVQA image cache lookups.")
+    parser.add_argument("--folder_cache", type=str, default=None, help="Existing folder cache (default: synthetic).")
+    parser.add_argument("--pack", type=str, default=None, help="Existing packed cache (default: pack the folder one).")
+    parser.add_argument("--workdir", type=str, default=None, help="Where to write synthetic assets (default: temp).")
+    parser.add_argument("--num_entries", type=int, default=2000, help="Synthetic cache ids.")
+    parser.add_argument("--images_per_entry", type=int, default=5, help="Synthetic images per id.")
+    parser.add_argument("--image_size", type=int, default=256, help="Synthetic image side in pixels.")
+    parser.add_argument("--num_calls", type=int, default=500, help="Distinct ids timed per phase.")
+    parser.add_argument("--decode", action="store_true", help="Also decode the returned images.")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_image_cache_")
+    folder_cache = args.folder_cache
+    if folder_cache is None:
+        folder_cache = os.path.join(workdir, "fvqa_train_cache")
+        t0 = time.perf_counter()
+        build_synthetic_cache(folder_cache, args.num_entries, args.images_per_entry, args.image_size)
+        print(f"Built synthetic folder cache in {folder_cache} ({time.perf_counter() - t0:.1f}s)")
+    pack_dir = args.pack
+    if pack_dir is None:
+        pack_dir = os.path.join(workdir, "fvqa_train_cache.pack")
+        t0 = time.perf_counter()
+        print(pack_image_cache(folder_cache, pack_dir), f"({time.perf_counter() - t0:.1f}s)")
+
+    cache_ids = sorted(os.listdir(folder_cache))
+    cache_ids = random.Random(0).sample(cache_ids, min(args.num_calls, len(cache_ids)))
+    # call_image_search picks the train/test base from the id prefix
+    os.environ["FVQA_TRAIN_CACHE_PATH"] = folder_cache
+    os.environ["FVQA_TEST_CACHE_PATH"] = folder_cache
+    os.environ.pop("FVQA_TEST_CACHE_PACK", None)
+
+    results = {}
+    for layout in ("folder", "packed"):
+        if layout == "packed":
+            os.environ["FVQA_TRAIN_CACHE_PACK"] = pack_dir
+        else:
+            os.environ.pop("FVQA_TRAIN_CACHE_PACK", None)
+        image_cache_pack._packs.clear()
+        method = drop_page_cache([folder_cache if layout == "folder" else pack_dir])
+        results[layout] = {"cold": time_calls(cache_ids, args.decode), "drop_method": method}
+        if layout == "packed":
+            t0 = time.perf_counter()
+            image_cache_pack.PackedImageCache(pack_dir)
+            results[layout]["index_load_ms"] = 1000 * (time.perf_counter() - t0)
+        results[layout]["warm"] = time_calls(cache_ids, args.decode)
+
+    for phase in ("cold", "warm"):
+        folder_ms, packed_ms = results["folder"][phase]["mean_ms"], results["packed"][phase]["mean_ms"]
+        print(f"{phase}: folder {folder_ms:.2f} ms/call, packed {packed_ms:.2f} ms/call ({folder_ms / packed_ms:.1f}x)")
+    print(json.dumps(results, indent=2))
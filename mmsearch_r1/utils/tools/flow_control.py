@@ -0,0 +1,293 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+BREAKER_STATES = ("closed", "half_open", "open")
+
+_guards: Dict[tuple, "SearchGuard"] = {}
+_guards_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` calls per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_s = (1 - self.tokens) / self.rate
+            if now + wait_s > deadline:
+                return False
+            time.sleep(wait_s)
+
+
+class AIMDLimiter:
+    """
+    Latency-aware concurrency limit shared by all threads of a process (additive increase,
+    multiplicative decrease). Each success under `latency_target_s` grows the limit by about
+    one per round of calls; a failure or a slow call multiplies it by `backoff_ratio`.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        latency_target_s: float = 10.0,
+        backoff_ratio: float = 0.7,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_s = latency_target_s
+        self.backoff_ratio = backoff_ratio
+        self.inflight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.inflight < int(self.limit), timeout=timeout):
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, latency_s: float, ok: bool):
+        with self._cond:
+            self.inflight -= 1
+            if ok and latency_s <= self.latency_target_s:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Opens when at least `error_threshold` of the last `window` calls failed (once `min_calls`
+    were seen), rejects calls for `cooldown_s`, then lets a single probe through (half-open):
+    a successful probe closes it again, a failed one re-opens it.
+    """
+
+    def __init__(self, window: int = 50, min_calls: int = 10, error_threshold: float = 0.5, cooldown_s: float = 30.0):
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.num_opens = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self.state == "half_open":
+                if ok:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(ok)
+            num_errors = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and num_errors / len(self._outcomes) >= self.error_threshold:
+                self._open()
+
+    def cancel(self):
+        """The admitted call never ran (rejected further down); let another one probe."""
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = False
+
+    def _open(self):
+        self.state = "open"
+        self.num_opens += 1
+        self._opened_at = time.monotonic()
+        self._probing = False
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+
+class SearchGuard:
+    """
+    Circuit breaker -> token bucket -> AIMD concurrency limit in front of one search backend.
+    `admit()` returns None when the call may go ahead (the caller must then `release()` it with
+    its latency and outcome) or the rejection reason (circuit_open / rate_limited /
+    concurrency_limited), so callers fall back right away instead of waiting out the backend.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        bucket: TokenBucket,
+        limiter: AIMDLimiter,
+        breaker: CircuitBreaker,
+        acquire_timeout_s: float = 30.0,
+    ):
+        self.name = name
+        self.bucket = bucket
+        self.limiter = limiter
+        self.breaker = breaker
+        self.acquire_timeout_s = acquire_timeout_s
+        self.num_calls = 0
+        self.num_errors = 0
+        self.num_rejected = {"circuit_open": 0, "rate_limited": 0, "concurrency_limited": 0}
+        self._lock = threading.Lock()
+
+    def admit(self) -> Optional[str]:
+        deadline = time.monotonic() + self.acquire_timeout_s
+        reason = None
+        if not self.breaker.allow():
+            reason = "circuit_open"
+        elif not self.bucket.acquire(timeout=self.acquire_timeout_s):
+            reason = "rate_limited"
+        elif not self.limiter.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            reason = "concurrency_limited"
+        if reason is None:
+            return None
+        if reason != "circuit_open":
+            self.breaker.cancel()
+        with self._lock:
+            self.num_rejected[reason] += 1
+        return reason
+
+    def release(self, latency_s: float, ok: bool):
+        self.limiter.release(latency_s, ok)
+        self.breaker.record(ok)
+        with self._lock:
+            self.num_calls += 1
+            self.num_errors += not ok
+
+    def state(self) -> dict:
+        with self._lock:
+            rejected = dict(self.num_rejected)
+            num_calls = self.num_calls
+            num_errors = self.num_errors
+        return {
+            "backend": self.name,
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.num_opens,
+            "error_rate": self.breaker.error_rate(),
+            "concurrency_limit": self.limiter.limit,
+            "inflight": self.limiter.inflight,
+            "num_calls": num_calls,
+            "num_errors": num_errors,
+            "rejected": rejected,
+        }
+
+
+def get_search_guard(name: str) -> Optional[SearchGuard]:
+    """
+    Process-wide guard for backend `name` ("web_search" or "text_search"), or None unless
+    SEARCH_FLOW_CONTROL=1. Tuned per backend with <NAME>_* environment variables, e.g.
+    WEB_SEARCH_RATE (calls/s), WEB_SEARCH_BURST, WEB_SEARCH_MAX_CONCURRENCY,
+    WEB_SEARCH_LATENCY_TARGET_S, WEB_SEARCH_ERROR_THRESHOLD, WEB_SEARCH_COOLDOWN_S.
+    """
+    if os.getenv("SEARCH_FLOW_CONTROL", "0") != "1":
+        return None
+    key = (os.getpid(), name)
+    with _guards_lock:
+        guard = _guards.get(key)
+        if guard is None:
+            prefix = name.upper()
+
+            def env(suffix: str, default: float) -> float:
+                return float(os.getenv(f"{prefix}_{suffix}", str(default)))
+
+            max_concurrency = env("MAX_CONCURRENCY", 64)
+            guard = _guards[key] = SearchGuard(
+                name,
+                TokenBucket(rate=env("RATE", 20.0), burst=env("BURST", 40.0)),
+                AIMDLimiter(
+                    initial_limit=min(8, max_concurrency),
+                    max_limit=max_concurrency,
+                    latency_target_s=env("LATENCY_TARGET_S", 10.0),
+                ),
+                CircuitBreaker(error_threshold=env("ERROR_THRESHOLD", 0.5), cooldown_s=env("COOLDOWN_S", 30.0)),
+                acquire_timeout_s=env("ACQUIRE_TIMEOUT_S", 30.0),
+            )
+        return guard
+
+
+def search_guard_states() -> Dict[str, dict]:
+    """State of every guard created in this process, for rollout metrics."""
+    with _guards_lock:
+        guards = [guard for (pid, _), guard in _guards.items() if pid == os.getpid()]
+    return {guard.name: guard.state() for guard in guards}
+
+
+def flow_control_sample_stats(tool_stats: List[dict]) -> Dict[str, float]:
+    """
+    Flow-control stats for one trajectory: how many of its search calls each guard rejected
+    and which fallback answered them (tool_stat["flow_control"]), plus a snapshot of this
+    process's guard states. Stored per sample so every rollout worker reaches the trainer.
+    """
+    stats = {}
+    for name, state in search_guard_states().items():
+        stats[f"search/{name}/breaker_state"] = BREAKER_STATES.index(state["breaker"])
+        stats[f"search/{name}/breaker_opens"] = state["breaker_opens"]
+        stats[f"search/{name}/error_rate"] = state["error_rate"]
+        stats[f"search/{name}/concurrency_limit"] = state["concurrency_limit"]
+    for tool_stat in tool_stats:
+        flow_control = tool_stat.get("flow_control") if isinstance(tool_stat, dict) else None
+        if not flow_control:
+            continue
+        stats[f"search/{flow_control['backend']}/calls"] = stats.get(f"search/{flow_control['backend']}/calls", 0) + 1
+        if flow_control["rejected"] is None:
+            continue
+        for key in (
+            f"search/{flow_control['backend']}/rejected/{flow_control['rejected']}",
+            f"search/{flow_control['backend']}/fallback/{flow_control['fallback']}",
+        ):
+            stats[key] = stats.get(key, 0) + 1
+    return stats
+
+
+def reduce_flow_control_stats(sample_stats) -> Dict[str, float]:
+    """
+    Step metrics from the per-sample stats of all rollout workers: call, rejection and fallback
+    counts are summed, breaker_state / breaker_opens take the worst worker and error_rate /
+    concurrency_limit are averaged over samples.
+    """
+    totals, maxima, sums, counts = {}, {}, {}, {}
+    for stats in sample_stats:
+        for key, value in stats.items():
+            if key.endswith("/calls") or "/rejected/" in key or "/fallback/" in key:
+                totals[key] = totals.get(key, 0) + value
+            elif key.endswith(("/breaker_state", "/breaker_opens")):
+                maxima[key] = max(maxima.get(key, value), value)
+            else:
+                sums[key] = sums.get(key, 0.0) + value
+                counts[key] = counts.get(key, 0) + 1
+    metrics = {**totals, **maxima}
+    metrics.update({key: sums[key] / counts[key] for key in sums})
+    return metrics
@@ -0,0 +1,179 @@
+"""
+Packed layout for the FVQA image-search caches.
+
+The folder layout keeps one directory per cache id (meta.json + img_000.jpg/png ...), so every
+image search costs a string of stat/open calls, which is slow on a network filesystem. A packed
+cache is a directory with a few large shard files and one index:
+
+    index.json       {"version": 1, "shards": ["shard_000.bin", ...], "entries": {cache_id: [shard, offset, length]}}
+    shard_XXX.bin    records back to back
+
+Each record is a little-endian uint32 header length, a JSON header
+{"title_list": [...], "image_urls": [...], "image_sizes": [n or -1, ...]} and then the encoded
+image bytes in order (-1 marks an image that was missing from the folder). A lookup is one dict
+access plus a slice of an mmap'd shard.
+
+Convert a folder cache (run once per split):
+    python -m mmsearch_r1.utils.tools.image_cache_pack --src fvqa_train_cache --out fvqa_train_cache.pack
+and point FVQA_TRAIN_CACHE_PACK / FVQA_TEST_CACHE_PACK at the output directories.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+
+INDEX_FILE = "index.json"
+PACK_VERSION = 1
+
+_HEADER_LEN = struct.Struct("<I")
+
+_packs: Dict[tuple, "PackedImageCache"] = {}
+_packs_lock = threading.Lock()
+
+
+def read_folder_entry(entry_dir: str) -> Optional[Tuple[List[str], List[str], List[Optional[bytes]]]]:
+    """(title_list, image_urls, image bytes or None per result) of one folder-layout entry, None without meta.json."""
+    meta_file = os.path.join(entry_dir, "meta.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, "r", encoding="utf-8") as f:
+        meta_data = json.load(f)
+    title_list = meta_data.get("title_list", [])
+    image_urls = meta_data.get("image_urls", [])
+
+    images = []
+    for i in range(min(len(title_list), len(image_urls))):
+        data = None
+        for ext in ("jpg", "png"):
+            img_path = os.path.join(entry_dir, f"img_{i:03d}.{ext}")
+            if os.path.exists(img_path):
+                with open(img_path, "rb") as f:
+                    data = f.read()
+                break
+        images.append(data)
+    return title_list, image_urls, images
+
+
+def encode_record(title_list: List[str], image_urls: List[str], images: List[Optional[bytes]]) -> bytes:
+    header = json.dumps(
+        {
+            "title_list": title_list,
+            "image_urls": image_urls,
+            "image_sizes": [-1 if data is None else len(data) for data in images],
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return _HEADER_LEN.pack(len(header)) + header + b"".join(data for data in images if data is not None)
+
+
+def decode_record(buf, offset: int = 0) -> Tuple[List[str], List[str], List[Optional[bytes]]]:
+    (header_len,) = _HEADER_LEN.unpack_from(buf, offset)
+    start = offset + _HEADER_LEN.size
+    header = json.loads(bytes(buf[start : start + header_len]).decode("utf-8"))
+    pos = start + header_len
+    images = []
+    for size in header["image_sizes"]:
+        if size < 0:
+            images.append(None)
+            continue
+        images.append(bytes(buf[pos : pos + size]))
+        pos += size
+    return header["title_list"], header["image_urls"], images
+
+
+def pack_image_cache(src_dir: str, out_dir: str, shard_size_bytes: int = 4 << 30) -> dict:
+    """Pack every <src_dir>/<cache_id>/ entry into shards under `out_dir`; index.json is written last."""
+    cache_ids = sorted(entry.name for entry in os.scandir(src_dir) if entry.is_dir())
+    os.makedirs(out_dir, exist_ok=True)
+
+    shards, entries = [], {}
+    num_skipped = 0
+    shard_file = None
+    try:
+        for cache_id in tqdm(cache_ids, desc="Packing: "):
+            folder_entry = read_folder_entry(os.path.join(src_dir, cache_id))
+            if folder_entry is None:
+                num_skipped += 1
+                continue
+            record = encode_record(*folder_entry)
+            if shard_file is None or (shard_file.tell() > 0 and shard_file.tell() + len(record) > shard_size_bytes):
+                if shard_file is not None:
+                    shard_file.close()
+                shards.append(f"shard_{len(shards):03d}.bin")
+                shard_file = open(os.path.join(out_dir, shards[-1]), "wb")
+            entries[cache_id] = [len(shards) - 1, shard_file.tell(), len(record)]
+            shard_file.write(record)
+    finally:
+        if shard_file is not None:
+            shard_file.close()
+
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": PACK_VERSION, "shards": shards, "entries": entries}, f, ensure_ascii=False)
+    os.replace(index_path + ".tmp", index_path)
+    return {"num_entries": len(entries), "num_skipped": num_skipped, "num_shards": len(shards)}
+
+
+class PackedImageCache:
+    """Read side of a packed cache: the index is loaded once, shards are mmap'd on first use."""
+
+    def __init__(self, pack_dir: str):
+        self.pack_dir = pack_dir
+        with open(os.path.join(pack_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != PACK_VERSION:
+            raise ValueError(f"Unsupported image cache pack version {index.get('version')} in {pack_dir}")
+        self.shards = index["shards"]
+        self.entries = index["entries"]
+        self._mmaps: List[Optional[mmap.mmap]] = [None] * len(self.shards)
+        self._lock = threading.Lock()
+
+    def __contains__(self, cache_id: str) -> bool:
+        return cache_id in self.entries
+
+    def _shard(self, shard_idx: int) -> mmap.mmap:
+        mm = self._mmaps[shard_idx]
+        if mm is None:
+            with self._lock:
+                mm = self._mmaps[shard_idx]
+                if mm is None:
+                    with open(os.path.join(self.pack_dir, self.shards[shard_idx]), "rb") as f:
+                        mm = self._mmaps[shard_idx] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mm
+
+    def get(self, cache_id: str) -> Optional[Tuple[List[str], List[str], List[Optional[bytes]]]]:
+        entry = self.entries.get(cache_id)
+        if entry is None:
+            return None
+        shard_idx, offset, _ = entry
+        return decode_record(self._shard(shard_idx), offset)
+
+
+def get_packed_image_cache(pack_dir: str) -> PackedImageCache:
+    """Shared reader per pack directory; reopened after a fork."""
+    key = (os.getpid(), pack_dir)
+    with _packs_lock:
+        pack = _packs.get(key)
+        if pack is None:
+            pack = _packs[key] = PackedImageCache(pack_dir)
+        return pack
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack a folder-layout FVQA image cache into shard files.")
+    parser.add_argument("--src", type=str, required=True, help="Folder cache, e.g. fvqa_train_cache.")
+    parser.add_argument("--out", type=str, required=True, help="Output directory for index.json + shards.")
+    parser.add_argument("--shard_size_gb", type=float, default=4.0, help="Target size of one shard file.")
+    args = parser.parse_args()
+
+    stats = pack_image_cache(args.src, args.out, shard_size_bytes=int(args.shard_size_gb * (1 << 30)))
+    print(
+        f"Packed {stats['num_entries']} entries into {stats['num_shards']} shards under {args.out}"
+        f" (skipped {stats['num_skipped']} without meta.json)"
+    )
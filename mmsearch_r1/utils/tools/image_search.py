@@ -1,9 +1,102 @@
+import io
 import os
 import json
 from PIL import Image
 import numpy as np
 from typing import List, Tuple, Dict
 
+from mmsearch_r1.utils.tools.image_cache_pack import get_packed_image_cache
+
+# 打不开的打包cache目录：只报一次错，之后直接走文件夹布局
+_broken_packs = set()
+_reported_packs = set()
+
+
+def _report_pack_error(pack_dir: str, e: Exception):
+    if pack_dir not in _reported_packs:
+        _reported_packs.add(pack_dir)
+        print(f"打包cache {pack_dir} 读取出错，回退到文件夹布局: {e!r}")
+
+
+def _lookup_packed(cache_id: str):
+    """
+    在 FVQA_TRAIN_CACHE_PACK / FVQA_TEST_CACHE_PACK 指向的打包cache中查找，未配置或不存在时返回None。
+    打包cache缺失或损坏时同样返回None（每个目录只打印一次错误），由调用方回退到文件夹布局。
+    """
+    pack_envs = ["FVQA_TRAIN_CACHE_PACK", "FVQA_TEST_CACHE_PACK"]
+    if cache_id.startswith("fvqa_test_"):
+        pack_envs.reverse()
+    for env in pack_envs:
+        pack_dir = os.getenv(env)
+        if not pack_dir or pack_dir in _broken_packs:
+            continue
+        try:
+            pack = get_packed_image_cache(pack_dir)
+        except Exception as e:
+            # index.json 缺失、版本不符或无法解析
+            _broken_packs.add(pack_dir)
+            _report_pack_error(pack_dir, e)
+            continue
+        try:
+            record = pack.get(cache_id)
+        except Exception as e:
+            # shard文件缺失或记录损坏：只跳过这一条
+            _report_pack_error(pack_dir, e)
+            continue
+        if record is not None:
+            return f"{pack_dir}#{cache_id}", record
+    return None
+
+
+def _load_folder_entry(cache_id: str, train_cache_base: str, test_cache_base: str):
+    """按文件夹布局读取 meta.json，返回 (cache_path, title_list, image_urls, load_image)。"""
+    # 确定cache类型和路径
+    cache_path = None
+    if cache_id.startswith("fvqa_train_"):
+        cache_path = os.path.join(train_cache_base, cache_id)
+    elif cache_id.startswith("fvqa_test_"):
+        cache_path = os.path.join(test_cache_base, cache_id)
+    else:
+        # 尝试两种cache类型
+        train_path = os.path.join(train_cache_base, cache_id)
+        test_path = os.path.join(test_cache_base, cache_id)
+        
+        if os.path.exists(train_path):
+            cache_path = train_path
+        elif os.path.exists(test_path):
+            cache_path = test_path
+        else:
+            raise FileNotFoundError(f"找不到ID为 {cache_id} 的cache文件夹")
+    
+    # 检查cache文件夹是否存在
+    if not os.path.exists(cache_path):
+        raise FileNotFoundError(f"Cache文件夹 {cache_path} 不存在")
+    
+    # 读取meta.json文件
+    meta_file = os.path.join(cache_path, "meta.json")
+    if not os.path.exists(meta_file):
+        raise FileNotFoundError(f"Meta文件 {meta_file} 不存在")
+    
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        meta_data = json.load(f)
+    
+    # 获取标题列表和图片URL列表
+    title_list = meta_data.get("title_list", [])
+    image_urls = meta_data.get("image_urls", [])
+
+    def load_image(i):
+        # 构建图片文件名
+        img_path = os.path.join(cache_path, f"img_{i:03d}.jpg")
+        
+        # 如果jpg不存在，尝试png
+        if not os.path.exists(img_path):
+            img_path = os.path.join(cache_path, f"img_{i:03d}.png")
+        
+        # 图片文件不存在时返回None
+        return Image.open(img_path) if os.path.exists(img_path) else None
+
+    return cache_path, title_list, image_urls, load_image
+
 
 def call_image_search(image_url: str, cache_id: str):
     """
@@ -16,6 +109,9 @@ def call_image_search(image_url: str, cache_id: str):
         image_url (str): 查询图像的URL或内部标识符（当前版本中未使用）
         cache_id (str): 查询ID，对应cache文件夹中的子文件夹名称
 
+    设置了 FVQA_TRAIN_CACHE_PACK / FVQA_TEST_CACHE_PACK 时优先从打包的shard文件中读取
+    （见 image_cache_pack.py），避免每次调用在NAS上做几十次文件元数据访问。
+
     Returns:
         tool_returned_str (str): 格式化的图像搜索结果字符串
         tool_returned_images (List[PIL.Image.Image]): 搜索结果图片列表
@@ -26,75 +122,50 @@ def call_image_search(image_url: str, cache_id: str):
     tool_returned_images = []
     tool_returned_str = ""
     tool_success = False
+    cache_format = None
     
     try:
         # 从环境变量读取cache路径，如果没有设置则使用默认路径
         train_cache_base = os.getenv("FVQA_TRAIN_CACHE_PATH", "fvqa_train_cache")
         test_cache_base = os.getenv("FVQA_TEST_CACHE_PATH", "fvqa_test_cache")
         
-        # 确定cache类型和路径
-        cache_path = None
-        if cache_id.startswith("fvqa_train_"):
-            cache_path = os.path.join(train_cache_base, cache_id)
-        elif cache_id.startswith("fvqa_test_"):
-            cache_path = os.path.join(test_cache_base, cache_id)
+        # 打包cache优先（一次mmap查找），其中没有的ID回退到文件夹布局
+        packed = _lookup_packed(cache_id)
+        if packed is not None:
+            cache_format = "packed"
+            cache_path, (title_list, image_urls, image_bytes) = packed
+
+            def load_image(i):
+                data = image_bytes[i] if i < len(image_bytes) else None
+                return None if data is None else Image.open(io.BytesIO(data))
+
         else:
-            # 尝试两种cache类型
-            train_path = os.path.join(train_cache_base, cache_id)
-            test_path = os.path.join(test_cache_base, cache_id)
-            
-            if os.path.exists(train_path):
-                cache_path = train_path
-            elif os.path.exists(test_path):
-                cache_path = test_path
-            else:
-                raise FileNotFoundError(f"找不到ID为 {cache_id} 的cache文件夹")
-        
-        # 检查cache文件夹是否存在
-        if not os.path.exists(cache_path):
-            raise FileNotFoundError(f"Cache文件夹 {cache_path} 不存在")
-        
-        # 读取meta.json文件
-        meta_file = os.path.join(cache_path, "meta.json")
-        if not os.path.exists(meta_file):
-            raise FileNotFoundError(f"Meta文件 {meta_file} 不存在")
-        
-        with open(meta_file, 'r', encoding='utf-8') as f:
-            meta_data = json.load(f)
-        
-        # 获取标题列表和图片URL列表
-        title_list = meta_data.get("title_list", [])
-        image_urls = meta_data.get("image_urls", [])
+            cache_format = "folder"
+            cache_path, title_list, image_urls, load_image = _load_folder_entry(
+                cache_id, train_cache_base, test_cache_base
+            )
         
         # 构建返回字符串
         tool_returned_str = "[Image Search Results] The result of the image search consists of web page information related to the image from the user's original question. Each result includes the main image from the web page and its title, ranked in descending order of search relevance, as demonstrated below:\n"
         
         # 读取图片文件并添加到返回列表
         for i, (title, img_url) in enumerate(zip(title_list, image_urls)):
-            # 构建图片文件名
-            img_filename = f"img_{i:03d}.jpg"
-            img_path = os.path.join(cache_path, img_filename)
-            
-            # 如果jpg不存在，尝试png
-            if not os.path.exists(img_path):
-                img_filename = f"img_{i:03d}.png"
-                img_path = os.path.join(cache_path, img_filename)
-            
             # 读取图片
-            if os.path.exists(img_path):
-                try:
-                    img = Image.open(img_path)
-                    tool_returned_images.append(img)
-
-                    
-                    # 添加到返回字符串
-                    tool_returned_str += f"{i+1}. image: <|vision_start|><|image_pad|><|vision_end|>\ntitle: {title}\n"
-                except Exception as e:
-                    print(f"读取图片 {img_path} 时出错: {e}")
-                    # 如果图片读取失败，创建占位符图片
-                    dummy_img = Image.fromarray(np.full((64, 64, 3), fill_value=100 + i * 30, dtype=np.uint8))
-                    tool_returned_images.append(dummy_img)
-                    tool_returned_str += f"{i+1}.title: {title}\n"
+            try:
+                img = load_image(i)
+            except Exception as e:
+                print(f"读取图片 {cache_path} #{i} 时出错: {e}")
+                # 如果图片读取失败，创建占位符图片
+                dummy_img = Image.fromarray(np.full((64, 64, 3), fill_value=100 + i * 30, dtype=np.uint8))
+                tool_returned_images.append(dummy_img)
+                tool_returned_str += f"{i+1}.title: {title}\n"
+                continue
+
+            if img is not None:
+                tool_returned_images.append(img)
+
+                # 添加到返回字符串
+                tool_returned_str += f"{i+1}. image: <|vision_start|><|image_pad|><|vision_end|>\ntitle: {title}\n"
             else:
                 # 如果图片文件不存在，创建占位符图片
                 dummy_img = Image.fromarray(np.full((64, 64, 3), fill_value=100 + i * 30, dtype=np.uint8))
@@ -115,6 +186,7 @@ def call_image_search(image_url: str, cache_id: str):
         "num_images": len(tool_returned_images),
         "cache_id": cache_id,
         "cache_path": cache_path if 'cache_path' in locals() else None,
+        "cache_format": cache_format,
         "train_cache_base": train_cache_base if 'train_cache_base' in locals() else None,
         "test_cache_base": test_cache_base if 'test_cache_base' in locals() else None
     }
@@ -0,0 +1,194 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_clients: Dict[tuple, "RetrievalClient"] = {}
+_clients_lock = threading.Lock()
+
+
+class RetrievalClient:
+    """
+    Shared HTTP client for one or more replicas of the local retrieval service.
+
+    - One pooled keep-alive `requests.Session` per process instead of a new connection per call.
+    - Hedged requests: if the primary replica has not answered after the recent p95 latency
+      (at least `min_hedge_delay_s`), the same request is sent to the next replica and the first
+      successful answer wins.
+    - Connection errors, timeouts and 5xx answers are retried up to `max_retries` times with
+      full-jitter exponential backoff; a 429 waits for its Retry-After instead, other 4xx fail
+      right away. The whole call, retries and waits included, is bounded by `timeout`.
+    - A sliding window of per-attempt latencies is kept for the p95 hedge delay and reported via
+      `latency_stats()`.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        timeout: float,
+        max_retries: int = 2,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 8.0,
+        hedge: bool = True,
+        min_hedge_delay_s: float = 0.05,
+        pool_size: int = 64,
+        window: int = 1000,
+    ):
+        self.urls = urls
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge = hedge and len(urls) > 1
+        self.min_hedge_delay_s = min_hedge_delay_s
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(urls), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # primary + hedge per in-flight call
+        self._pool = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix="retrieval-client")
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._next_replica = 0
+        self.num_calls = 0
+        self.num_retries = 0
+        self.num_hedges = 0
+        self.num_hedge_wins = 0
+        self.num_errors = 0
+
+    def _post_once(self, url: str, payload: dict, timeout: float) -> dict:
+        response = self.session.post(url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _hedge_delay(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < 20:
+                return None
+            latencies = sorted(self._latencies)
+        return max(self.min_hedge_delay_s, latencies[int(0.95 * (len(latencies) - 1))])
+
+    def _pick_replicas(self) -> Tuple[str, str]:
+        with self._lock:
+            primary = self._next_replica
+            self._next_replica = (self._next_replica + 1) % len(self.urls)
+        return self.urls[primary], self.urls[(primary + 1) % len(self.urls)]
+
+    def _hedged_post(self, payload: dict, timeout: float) -> Tuple[dict, dict]:
+        t0 = time.monotonic()
+        primary_url, backup_url = self._pick_replicas()
+        futures = {self._pool.submit(self._post_once, primary_url, payload, timeout): primary_url}
+        hedge_delay = self._hedge_delay() if self.hedge else None
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                with self._lock:
+                    self.num_hedges += 1
+                backup_timeout = timeout - (time.monotonic() - t0)
+                futures[self._pool.submit(self._post_once, backup_url, payload, backup_timeout)] = backup_url
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # the losing request finishes in the background; its answer is dropped
+                    winner = futures[future]
+                    latency = time.monotonic() - t0
+                    with self._lock:
+                        self._latencies.append(latency)
+                        if winner != primary_url:
+                            self.num_hedge_wins += 1
+                    return future.result(), {"replica": winner, "hedged": len(futures) > 1}
+                error = future.exception()
+        raise error
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after `error`, or None if it is not worth retrying."""
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            if status == 429:
+                # the server's backpressure estimate of when the lane has room again
+                try:
+                    return float(error.response.headers["Retry-After"])
+                except (KeyError, ValueError):
+                    pass
+            elif status < 500:
+                return None
+        elif not isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return None
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2**attempt))
+
+    def post(self, payload: dict) -> Tuple[dict, dict]:
+        """
+        POST `payload` to /retrieve; returns (response json, call info). Raises once the error is
+        not retryable, the retries are used up, or the next attempt would not start before the
+        call's `timeout` deadline.
+        """
+        t0 = time.monotonic()
+        deadline = t0 + self.timeout
+        attempt = 0
+        while True:
+            try:
+                result, info = self._hedged_post(payload, deadline - time.monotonic())
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if attempt == self.max_retries or delay is None or time.monotonic() + delay >= deadline:
+                    with self._lock:
+                        self.num_calls += 1
+                        self.num_errors += 1
+                    # reported in the search error text, like verl's "on attempt n/N"
+                    e.attempts = attempt + 1
+                    raise
+                with self._lock:
+                    self.num_retries += 1
+                time.sleep(delay)
+                attempt += 1
+                continue
+            with self._lock:
+                self.num_calls += 1
+            info.update({"attempts": attempt + 1, "latency_ms": int((time.monotonic() - t0) * 1000)})
+            return result, info
+
+    def latency_stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "num_calls": self.num_calls,
+                "num_retries": self.num_retries,
+                "num_hedges": self.num_hedges,
+                "num_hedge_wins": self.num_hedge_wins,
+                "num_errors": self.num_errors,
+            }
+        if latencies:
+            for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+                stats[name] = int(1000 * latencies[int(q * (len(latencies) - 1))])
+        return stats
+
+
+def get_retrieval_client(retrieval_service_url: str, timeout: float) -> RetrievalClient:
+    """
+    Shared client per (url list, timeout). `retrieval_service_url` may list several replicas
+    separated by commas. Recreated after a fork since sessions and threads do not survive it.
+    """
+    urls = [url.strip() for url in retrieval_service_url.split(",") if url.strip()]
+    key = (os.getpid(), tuple(urls), timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = RetrievalClient(
+                urls,
+                timeout,
+                max_retries=int(os.getenv("TEXT_SEARCH_MAX_RETRIES", "2")),
+                hedge=os.getenv("TEXT_SEARCH_HEDGE", "1") == "1",
+            )
+        return client
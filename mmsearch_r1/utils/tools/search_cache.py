@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+CACHE_MODES = ("off", "record", "replay", "read_through")
+
+_caches: Dict[str, "SearchCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def cache_key(query: str, params: dict) -> str:
+    payload = json.dumps([normalize_query(query), params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """
+    Persistent web-search result cache in a single SQLite file, shared by all rollout threads
+    and processes on a host (WAL mode). Entries are keyed by the normalized query and the
+    backend parameters and store the raw result list, so formatting stays with the caller.
+
+    Entries older than `ttl_s` are treated as misses (0 disables expiry; replay mode ignores it
+    so offline reruns stay deterministic). Past `max_entries` the least recently used entries
+    are dropped. A `read_only` cache (replay mode) opens the file with mode=ro and never writes,
+    so it works on a read-only artifact.
+
+    The cache never fails a search: SQLite errors (missing or locked file, read-only
+    filesystem) count as misses in `get` and are dropped in `put`.
+    """
+
+    def __init__(
+        self, path: str, ttl_s: float = 7 * 24 * 3600, max_entries: int = 1_000_000, read_only: bool = False
+    ):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._puts = 0
+
+        self._lock = threading.Lock()
+        self._conn = None
+        try:
+            if read_only:
+                uri = f"file:{os.path.abspath(path)}?mode=ro"
+                self._conn = sqlite3.connect(uri, uri=True, timeout=30.0, check_same_thread=False)
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS search_cache ("
+                    "key TEXT PRIMARY KEY, query TEXT, params TEXT, results TEXT, created_at REAL, last_access REAL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS search_cache_last_access ON search_cache (last_access)")
+        except (sqlite3.Error, OSError) as e:
+            print(f"Search cache {path} unavailable, every lookup is a miss: {e}")
+            self._conn = None
+            self.errors += 1
+
+    def get(self, query: str, params: dict, ignore_ttl: bool = False) -> Optional[List[dict]]:
+        key = cache_key(query, params)
+        now = time.time()
+        row = None
+        with self._lock:
+            try:
+                if self._conn is not None:
+                    row = self._conn.execute(
+                        "SELECT results, created_at FROM search_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                if row is not None and not self.read_only:
+                    self._conn.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+            except sqlite3.Error:
+                # a failed access-time update keeps the row it just read
+                self.errors += 1
+            if row is None or (not ignore_ttl and self.ttl_s and now - row[1] > self.ttl_s):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, query: str, params: dict, results: List[dict]):
+        if self.read_only or self._conn is None:
+            return
+        now = time.time()
+        row = (
+            cache_key(query, params),
+            query,
+            json.dumps(params, sort_keys=True),
+            json.dumps(results, ensure_ascii=False),
+            now,
+            now,
+        )
+        with self._lock:
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?, ?)", row)
+                self._puts += 1
+                if self._puts % 1000 == 0:
+                    self._evict()
+            except sqlite3.Error:
+                self.errors += 1
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE key IN "
+                "(SELECT key FROM search_cache ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    Process-wide cache configured from the environment, or None when WEB_SEARCH_CACHE_MODE is off:
+
+        WEB_SEARCH_CACHE_MODE         off | record | replay | read_through (default off)
+        WEB_SEARCH_CACHE_PATH         SQLite file (default ~/.cache/mmsearch_r1/web_search.sqlite)
+        WEB_SEARCH_CACHE_TTL_S        entry lifetime in seconds, 0 = never expire (default 7 days)
+        WEB_SEARCH_CACHE_MAX_ENTRIES  LRU bound (default 1,000,000)
+    """
+    if search_cache_mode() == "off":
+        return None
+    path = os.getenv(
+        "WEB_SEARCH_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "mmsearch_r1", "web_search.sqlite")
+    )
+    read_only = search_cache_mode() == "replay"
+    key = f"{os.getpid()}:{path}:{read_only}"
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = SearchCache(
+                path,
+                ttl_s=float(os.getenv("WEB_SEARCH_CACHE_TTL_S", str(7 * 24 * 3600))),
+                max_entries=int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "1000000")),
+                read_only=read_only,
+            )
+        return cache
+
+
+def search_cache_mode() -> str:
+    mode = os.getenv("WEB_SEARCH_CACHE_MODE", "off")
+    if mode not in CACHE_MODES:
+        raise ValueError(f"WEB_SEARCH_CACHE_MODE must be one of {CACHE_MODES}, got {mode!r}")
+    return mode
@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from mmsearch_r1.utils.tools import flow_control
+from mmsearch_r1.utils.tools.flow_control import (
+    AIMDLimiter,
+    CircuitBreaker,
+    SearchGuard,
+    TokenBucket,
+    flow_control_sample_stats,
+    get_search_guard,
+    reduce_flow_control_stats,
+)
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=100.0, burst=3)
+    assert all(bucket.acquire(timeout=0) for _ in range(3))
+    assert not bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=0.5)  # refilled at 100/s
+
+
+def test_aimd_grows_on_fast_successes_and_backs_off_on_failures():
+    limiter = AIMDLimiter(initial_limit=2, min_limit=1, max_limit=4, latency_target_s=1.0, backoff_ratio=0.5)
+    assert limiter.acquire(timeout=0) and limiter.acquire(timeout=0)
+    assert not limiter.acquire(timeout=0)  # at the limit
+    limiter.release(0.1, ok=True)
+    assert limiter.limit == pytest.approx(2.5)
+    limiter.release(5.0, ok=True)  # too slow counts as congestion
+    assert limiter.limit == pytest.approx(1.25)
+    assert limiter.inflight == 0
+    for _ in range(10):
+        limiter.acquire(timeout=0)
+        limiter.release(0.0, ok=False)
+    assert limiter.limit == 1
+    for _ in range(100):
+        limiter.acquire(timeout=0)
+        limiter.release(0.0, ok=True)
+    assert limiter.limit == 4
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker(window=10, min_calls=4, error_threshold=0.5, cooldown_s=0.05)
+    for ok in (True, False, True):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.state == "closed"  # under min_calls
+    breaker.record(False)
+    assert breaker.state == "open" and breaker.num_opens == 1
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # one probe at a time
+    breaker.record(False)
+    assert breaker.state == "open" and breaker.num_opens == 2
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.cancel()  # the probe never ran
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.error_rate() == 0.0
+
+
+def make_guard(rate=1000.0, burst=1000.0, limit=4):
+    return SearchGuard(
+        "text_search",
+        TokenBucket(rate=rate, burst=burst),
+        AIMDLimiter(initial_limit=limit, max_limit=limit),
+        CircuitBreaker(min_calls=2, error_threshold=0.5, cooldown_s=60.0),
+        acquire_timeout_s=0.01,
+    )
+
+
+def test_guard_reports_why_it_rejected():
+    guard = make_guard(limit=1)
+    assert guard.admit() is None
+    assert guard.admit() == "concurrency_limited"
+    guard.release(0.01, ok=False)
+    assert guard.admit() is None
+    guard.release(0.01, ok=False)
+    assert guard.admit() == "circuit_open"
+
+    guard = make_guard(rate=0.001, burst=1)
+    assert guard.admit() is None
+    guard.release(0.01, ok=True)
+    assert guard.admit() == "rate_limited"
+    state = guard.state()
+    assert state["num_calls"] == 1 and state["rejected"]["rate_limited"] == 1
+
+
+def test_guards_are_off_unless_enabled(monkeypatch):
+    monkeypatch.setattr(flow_control, "_guards", {})
+    monkeypatch.setenv("SEARCH_FLOW_CONTROL", "0")
+    assert get_search_guard("web_search") is None
+    monkeypatch.setenv("SEARCH_FLOW_CONTROL", "1")
+    monkeypatch.setenv("WEB_SEARCH_MAX_CONCURRENCY", "2")
+    guard = get_search_guard("web_search")
+    assert guard is get_search_guard("web_search")
+    assert guard.limiter.max_limit == 2 and guard.limiter.limit == 2
+
+
+def test_sample_stats_reduce_across_workers(monkeypatch):
+    monkeypatch.setattr(flow_control, "search_guard_states", lambda: {})
+    tool_stats = [
+        {"flow_control": {"backend": "web_search", "rejected": None, "fallback": None}},
+        {"flow_control": {"backend": "web_search", "rejected": "circuit_open", "fallback": "cache"}},
+        {"success": True},
+        None,
+    ]
+    sample = flow_control_sample_stats(tool_stats)
+    assert sample == {
+        "search/web_search/calls": 2,
+        "search/web_search/rejected/circuit_open": 1,
+        "search/web_search/fallback/cache": 1,
+    }
+    worker_a = dict(sample, **{"search/web_search/breaker_state": 0, "search/web_search/error_rate": 0.2})
+    worker_b = {"search/web_search/calls": 1, "search/web_search/breaker_state": 2, "search/web_search/error_rate": 0.6}
+    metrics = reduce_flow_control_stats([worker_a, worker_b])
+    assert metrics["search/web_search/calls"] == 3
+    assert metrics["search/web_search/rejected/circuit_open"] == 1
+    assert metrics["search/web_search/breaker_state"] == 2
+    assert metrics["search/web_search/error_rate"] == pytest.approx(0.4)
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+
+import pytest
+
+from mmsearch_r1.utils.tools import search_cache
+from mmsearch_r1.utils.tools.search_cache import SearchCache, cache_key, get_search_cache
+
+PARAMS = {"engine": "duckduckgo", "max_results": 5}
+RESULTS = [{"title": "Schloss Uster", "body": "A castle in Uster, Zürich.", "href": "https://example.com"}]
+
+
+def test_key_normalizes_query_and_covers_params():
+    assert cache_key("  Schloss   USTER ", PARAMS) == cache_key("schloss uster", PARAMS)
+    assert cache_key("schloss uster", PARAMS) != cache_key("schloss uster", dict(PARAMS, max_results=10))
+
+
+def test_record_then_replay_read_only(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    recorder = SearchCache(path)
+    recorder.put("Schloss Uster", PARAMS, RESULTS)
+    assert recorder.get("schloss  uster", PARAMS) == RESULTS
+    recorder._conn.close()
+    os.chmod(path, 0o444)
+
+    replay = SearchCache(path, ttl_s=1, read_only=True)
+    replay.put("other", PARAMS, RESULTS)  # never writes
+    assert replay.get("Schloss Uster", PARAMS, ignore_ttl=True) == RESULTS
+    assert replay.get("other", PARAMS, ignore_ttl=True) is None
+    assert replay.stats() == {"hits": 1, "misses": 1, "errors": 0, "hit_rate": 0.5}
+
+
+def test_ttl_expires_entries_unless_ignored(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), ttl_s=60)
+    cache.put("q", PARAMS, RESULTS)
+    cache._conn.execute("UPDATE search_cache SET created_at = created_at - 120")
+    assert cache.get("q", PARAMS) is None
+    assert cache.get("q", PARAMS, ignore_ttl=True) == RESULTS
+
+
+def test_missing_replay_file_is_a_miss_not_an_error(tmp_path):
+    cache = SearchCache(str(tmp_path / "missing.sqlite"), read_only=True)
+    assert cache.get("q", PARAMS, ignore_ttl=True) is None
+    cache.put("q", PARAMS, RESULTS)
+    assert cache.stats()["errors"] == 1 and not (tmp_path / "missing.sqlite").exists()
+
+
+def test_sqlite_errors_count_as_misses(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"))
+    cache._conn.execute("DROP TABLE search_cache")
+    assert cache.get("q", PARAMS) is None
+    cache.put("q", PARAMS, RESULTS)
+    assert cache.stats()["errors"] == 2
+
+
+def test_lru_eviction(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for i in range(3):
+        cache.put(f"q{i}", PARAMS, RESULTS)
+        cache._conn.execute("UPDATE search_cache SET last_access = ? WHERE query = ?", (i, f"q{i}"))
+    cache._evict()
+    assert [cache.get(f"q{i}", PARAMS) is not None for i in range(3)] == [False, True, True]
+
+
+def test_replay_mode_shares_one_read_only_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    SearchCache(path).put("q", PARAMS, RESULTS)
+    monkeypatch.setattr(search_cache, "_caches", {})
+    monkeypatch.setenv("WEB_SEARCH_CACHE_PATH", path)
+    monkeypatch.setenv("WEB_SEARCH_CACHE_MODE", "replay")
+    cache = get_search_cache()
+    assert cache.read_only and get_search_cache() is cache
+    assert cache.get("q", PARAMS, ignore_ttl=True) == RESULTS
+    with pytest.raises(sqlite3.Error):
+        cache._conn.execute("DELETE FROM search_cache")
+
+    monkeypatch.setenv("WEB_SEARCH_CACHE_MODE", "off")
+    assert get_search_cache() is None
+    monkeypatch.setenv("WEB_SEARCH_CACHE_MODE", "bogus")
+    with pytest.raises(ValueError):
+        get_search_cache()
@@ -0,0 +1,134 @@
+import json
+import threading
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from mmsearch_r1.utils.tools import text_search_batcher
+from mmsearch_r1.utils.tools.text_search_batcher import TextSearchBatcher, passages_to_string, text_search
+
+WIKI_DOCS = [
+    {"id": "1", "contents": '"Schloss Uster"\nSchloss Uster is a castle in the municipality of Uster.'},
+    {"id": "2", "contents": '"Zürich"\nZürich is the largest city in Switzerland.\nSecond line.'},
+]
+
+
+def hits(docs):
+    return [{"document": doc, "score": 1.0 - 0.1 * i} for i, doc in enumerate(docs)]
+
+
+def verl_passages2string(retrieval_result):
+    # verl.tools.utils.search_r1_like_utils._passages2string, the baseline observation format
+    format_reference = ""
+    for idx, doc_item in enumerate(retrieval_result):
+        content = doc_item["document"]["contents"]
+        title = content.split("\n")[0]
+        text = "\n".join(content.split("\n")[1:])
+        format_reference += f"Doc {idx + 1} (Title: {title})\n{text}\n\n"
+    return format_reference.strip()
+
+
+class FakeClient:
+    max_retries = 2
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.payloads = []
+        self._lock = threading.Lock()
+
+    def post(self, payload):
+        with self._lock:
+            self.payloads.append(payload)
+        return self.respond(payload), {"replica": "fake", "hedged": False, "attempts": 1, "latency_ms": 0}
+
+    def latency_stats(self):
+        return {}
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    def install(respond):
+        client = FakeClient(respond)
+        monkeypatch.setattr(text_search_batcher, "get_retrieval_client", lambda url, timeout: client)
+        return client
+
+    return install
+
+
+def test_passages_to_string_matches_verl():
+    assert passages_to_string(hits(WIKI_DOCS)) == verl_passages2string(hits(WIKI_DOCS))
+    assert passages_to_string(hits(WIKI_DOCS)).startswith('Doc 1 (Title: "Schloss Uster")\n')
+
+
+def test_passages_to_string_truncates_text_only():
+    formatted = passages_to_string(hits(WIKI_DOCS[:1]), max_chars=10)
+    assert formatted == 'Doc 1 (Title: "Schloss Uster")\nSchloss Us...'
+    # text that already fits is left alone
+    assert passages_to_string(hits(WIKI_DOCS[:1]), max_chars=1000) == verl_passages2string(hits(WIKI_DOCS[:1]))
+
+
+def test_passages_to_string_compact_snippets():
+    compact = [
+        {"id": "1", "title": '"Schloss Uster"', "text": "Schloss Us", "truncated": True},
+        {"id": "2", "title": '"Zürich"', "text": "Zürich is the largest city in Switzerland.\nSecond line."},
+    ]
+    assert passages_to_string(hits(compact), max_chars=10) == passages_to_string(hits(WIKI_DOCS), max_chars=10)
+    # a missing document (e.g. a deleted row) is skipped but keeps its rank number
+    assert passages_to_string(hits([None, WIKI_DOCS[0]])) == (
+        'Doc 2 (Title: "Schloss Uster")\nSchloss Uster is a castle in the municipality of Uster.'
+    )
+
+
+def test_text_search_keeps_verl_result_text(fake_client):
+    client = fake_client(lambda payload: {"result": [hits(WIKI_DOCS)]})
+    result_text, metadata = text_search("uster", "http://fake/retrieve", topk=2, timeout=5)
+    assert result_text == json.dumps({"result": verl_passages2string(hits(WIKI_DOCS))})
+    assert "\\u00fc" in result_text
+    assert metadata["status"] == "success" and metadata["total_results"] == 2
+    assert "max_chars" not in client.payloads[0]
+
+
+def test_text_search_sends_max_chars_only_for_snippets(fake_client):
+    client = fake_client(lambda payload: {"result": [[]]})
+    text_search("uster", "http://fake/retrieve", topk=2, timeout=5, max_chars=1200)
+    text_search("uster", "http://fake/retrieve", topk=2, timeout=5, max_chars=1200, snippets=True)
+    assert "max_chars" not in client.payloads[0]
+    assert client.payloads[1]["max_chars"] == 1200
+
+
+def test_text_search_empty_and_error_results(fake_client):
+    fake_client(lambda payload: {"result": [[]]})
+    result_text, metadata = text_search("uster", "http://fake/retrieve", topk=2, timeout=5)
+    assert result_text == json.dumps({"result": ""})
+    assert metadata["status"] == "success" and metadata["total_results"] == 0
+
+    def refuse(payload):
+        raise requests.ConnectionError("refused")
+
+    fake_client(refuse)
+    result_text, metadata = text_search("uster", "http://fake/retrieve", topk=2, timeout=5)
+    assert metadata["status"] == "api_error"
+    assert result_text == json.dumps({"result": "Search error: API Call Failed: Connection Error: refused"})
+
+
+def test_batcher_coalesces_and_dedupes_queries():
+    client = FakeClient(lambda payload: {"result": [hits([{"contents": f'"{q}"\n{q}'}]) for q in payload["queries"]]})
+    batcher = TextSearchBatcher(client, topk=1, max_batch_size=8, max_wait_ms=200)
+    futures = [batcher.submit(query) for query in ["a", "b", "a", "c"]]
+    answers = [future.result(timeout=5) for future in futures]
+    assert [retrieval[0]["document"]["contents"] for retrieval, _ in answers] == ['"a"\na', '"b"\nb', '"a"\na', '"c"\nc']
+    assert client.payloads == [{"queries": ["a", "b", "c"], "topk": 1, "return_scores": True}]
+    assert answers[0][1]["batch_size"] == 4
+    assert batcher.stats()["num_batches"] == 1
+
+
+def test_batcher_fails_every_caller_on_error():
+    def fail(payload):
+        raise requests.ConnectionError("down")
+
+    batcher = TextSearchBatcher(FakeClient(fail), topk=1, max_wait_ms=50)
+    futures = [batcher.submit(query) for query in ["a", "b"]]
+    for future in futures:
+        with pytest.raises(requests.ConnectionError):
+            future.result(timeout=5)
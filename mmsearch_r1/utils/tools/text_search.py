@@ -1,15 +1,21 @@
 from typing import Optional, Tuple
+import json
 import os
-from verl.tools.utils.search_r1_like_utils import perform_single_search_batch
 from typing import Tuple, Dict
 from ddgs import DDGS
 import time
 
+from mmsearch_r1.utils.tools.flow_control import get_search_guard
+from mmsearch_r1.utils.tools.search_cache import get_search_cache, search_cache_mode
+from mmsearch_r1.utils.tools.text_search_batcher import text_search
+
 def call_text_search(
     text_query: str,
     retrieval_service_url: Optional[str] = None,
     topk: Optional[int] = None,
-    timeout: Optional[int] = None
+    timeout: Optional[int] = None,
+    batched: Optional[bool] = None,
+    snippets: Optional[bool] = None,
 ) -> Tuple[str, dict]:
     """
     Performs a text-based search using the configured retrieval service and returns the
@@ -17,24 +23,38 @@ def call_text_search(
 
     Args:
         text_query (str): The input query string for the text search.
-        retrieval_service_url (str, optional): URL of the retrieval service API. If not provided,
+        retrieval_service_url (str, optional): URL of the retrieval service API, or several replica
+            URLs separated by commas (slow calls are hedged to the next replica). If not provided,
             fetched from the 'RETRIEVAL_SERVICE_URL' environment variable.
         topk (int, optional): Number of top results to return. If not provided, fetched from the
             'TOPK' environment variable (defaults to 3).
         timeout (int, optional): Request timeout in seconds. If not provided, fetched from the
             'TIMEOUT' environment variable (defaults to 30).
+        batched (bool, optional): Coalesce this query with concurrent calls from other threads into
+            one multi-query request (see text_search_batcher.py). If not provided, enabled when the
+            'TEXT_SEARCH_BATCHING' environment variable is '1'.
+        snippets (bool, optional): Ask the server for passages already cut to 1200 characters
+            (compact snippets, much smaller responses); the observation text is identical either
+            way. If not provided, enabled when the 'TEXT_SEARCH_SNIPPETS' environment variable is '1'.
+
+    With SEARCH_FLOW_CONTROL=1 the call first passes the process-wide "text_search" guard
+    (circuit breaker, token bucket, adaptive concurrency limit; see flow_control.py). A rejected
+    call returns an error right away with status 'rejected' instead of queueing on a struggling
+    service.
 
     Returns:
         result_text (str): JSON-encoded string containing the search results under the 'result' key.
         metadata (dict): Metadata dictionary including keys such as 'query_count', 'status', 
-            'total_results', 'api_request_error', and 'formatted_result'.
+            'total_results', 'api_request_error', 'formatted_result', the per-call 'latency_ms',
+            'attempts', 'replica' and 'hedged', the client's 'latency' distribution and, when flow
+            control is on, 'flow_control' (backend, rejection reason, fallback).
 
     Raises:
         ValueError: If 'retrieval_service_url' is not provided and not set in the environment.
     """
     # Determine retrieval service URL
     if retrieval_service_url is None:
-        retrieval_service_url = "http://0.0.0.0:8000/retrieve"
+        retrieval_service_url = os.getenv("RETRIEVAL_SERVICE_URL", "http://0.0.0.0:8000/retrieve")
     if not retrieval_service_url:
         raise ValueError(
             "Retrieval service URL must be provided via argument or set in 'RETRIEVAL_SERVICE_URL' environment variable."
@@ -50,15 +70,50 @@ def call_text_search(
         timeout_env = os.getenv("TIMEOUT")
         timeout = int(timeout_env) if timeout_env is not None and timeout_env.isdigit() else 120
 
-    # Execute search batch for the single query
-    result_text, metadata = perform_single_search_batch(
-        retrieval_service_url=retrieval_service_url,
-        query_list=[text_query],
-        topk=topk,
-        concurrent_semaphore=None,
-        timeout=timeout,
-        max_chars=1200
-    )
+    if batched is None:
+        batched = os.getenv("TEXT_SEARCH_BATCHING", "0") == "1"
+
+    if snippets is None:
+        snippets = os.getenv("TEXT_SEARCH_SNIPPETS", "0") == "1"
+
+    guard = get_search_guard("text_search")
+    if guard is not None:
+        rejected = guard.admit()
+        if rejected is not None:
+            error = f"Text search rejected by flow control: {rejected}"
+            metadata = {
+                "query_count": 1,
+                "queries": [text_query],
+                "api_request_error": error,
+                "status": "rejected",
+                "total_results": 0,
+                "formatted_result": None,
+                "flow_control": {"backend": "text_search", "rejected": rejected, "fallback": "none"},
+            }
+            result_text = json.dumps({"result": f"Search error: {error}"})
+            return "[Text Search Results]" + result_text, metadata
+
+    # Pooled keep-alive session with hedging across replicas and jittered retries; when batched,
+    # the query shares one /retrieve call with the other rollout threads' queries
+    t0 = time.time()
+    ok = False
+    try:
+        result_text, metadata = text_search(
+            text_query,
+            retrieval_service_url,
+            topk=topk,
+            timeout=timeout,
+            max_chars=1200,
+            batched=batched,
+            snippets=snippets,
+        )
+        ok = metadata["status"] in ("success", "no_results")
+    finally:
+        # also on exceptions, so the concurrency slot (or the half-open probe) is never leaked
+        if guard is not None:
+            guard.release(time.time() - t0, ok)
+    if guard is not None:
+        metadata["flow_control"] = {"backend": "text_search", "rejected": None, "fallback": None}
     header = (
         "[Text Search Results]"
     )
@@ -68,10 +123,80 @@ def call_text_search(
 
 
 
+def _format_web_results(results: list) -> str:
+    if not results:
+        return "[Text Search Results] No results were found for your query."
+    lines = []
+    lines.append("[Text Search Results] Below are the text summaries of the most relevant webpages related to your query, ranked in descending order of relevance:")
+    for i, r in enumerate(results, start=1):
+        title = r.get("title") or "No title"
+        body = (r.get("body") or "").strip()
+        if len(body) > 400:  # 避免太长
+            body = body[:400].rstrip() + "..."
+        lines.append(f"{i}. {title}\n   {body}")
+    return "\n".join(lines)
+
+
+def _web_search_fallback(text_query: str, params: dict, cache, rejected: str, t0: float) -> Tuple[str, Dict]:
+    """
+    Answer for a web search the flow-control guard rejected, without waiting on DuckDuckGo:
+    a cached result of any age, else the local retriever (WEB_SEARCH_FALLBACK_LOCAL=1), else
+    the usual search error.
+    """
+    flow_control = {"backend": "web_search", "rejected": rejected, "fallback": "none"}
+    results = cache.get(text_query, params, ignore_ttl=True) if cache is not None else None
+    if results is not None:
+        flow_control["fallback"] = "cache"
+        tool_stat = {
+            "success": True,
+            "engine": "duckduckgo",
+            "num_results": len(results),
+            "latency_ms": int((time.time() - t0) * 1000),
+            "cache": "hit",
+            "flow_control": flow_control,
+        }
+        return _format_web_results(results), tool_stat
+
+    if os.getenv("WEB_SEARCH_FALLBACK_LOCAL", "0") == "1":
+        tool_returned_str, metadata = call_text_search(text_query)
+        if metadata["status"] == "success":
+            flow_control["fallback"] = "local"
+            tool_stat = {
+                "success": True,
+                "engine": "local_retriever",
+                "num_results": metadata["total_results"],
+                "latency_ms": int((time.time() - t0) * 1000),
+                "flow_control": flow_control,
+            }
+            return tool_returned_str, tool_stat
+
+    tool_returned_str = (
+        "[Text Search Results] There was an error performing the search. "
+        "Please reason with your own capabilities or try again later."
+    )
+    tool_stat = {
+        "success": False,
+        "engine": "duckduckgo",
+        "error": f"web search rejected by flow control: {rejected}",
+        "latency_ms": int((time.time() - t0) * 1000),
+        "flow_control": flow_control,
+    }
+    return tool_returned_str, tool_stat
+
+
 def call_web_text_search(text_query: str) -> Tuple[str, Dict]:
     """
     Perform a real text-based web search using DuckDuckGo (DDGS).
     Returns only title + snippet (no href) for easier LLM input.
+
+    Results can go through a persistent SQLite cache (see search_cache.py), selected with
+    WEB_SEARCH_CACHE_MODE: 'record' always searches and writes through, 'read_through' serves
+    hits locally and searches on misses, 'replay' never touches the network (deterministic
+    offline runs; a miss is reported as a failed search). tool_stat["cache"] is hit/miss/replay_miss.
+
+    With SEARCH_FLOW_CONTROL=1 network searches pass the process-wide "web_search" guard
+    (circuit breaker, token bucket, adaptive concurrency limit; see flow_control.py). Rejected
+    calls are answered by _web_search_fallback and tool_stat["flow_control"] records why.
     """
 
     max_results = 5
@@ -79,8 +204,50 @@ def call_web_text_search(text_query: str) -> Tuple[str, Dict]:
     safesearch = "moderate"
     timelimit = 120
     backend = "auto"
+    params = {
+        "engine": "duckduckgo",
+        "max_results": max_results,
+        "region": region,
+        "safesearch": safesearch,
+        "timelimit": timelimit,
+        "backend": backend,
+    }
 
     t0 = time.time()
+    mode = search_cache_mode()
+    cache = get_search_cache()
+    if cache is not None and mode in ("replay", "read_through"):
+        results = cache.get(text_query, params, ignore_ttl=mode == "replay")
+        if results is not None:
+            tool_stat = {
+                "success": True,
+                "engine": "duckduckgo",
+                "num_results": len(results),
+                "latency_ms": int((time.time() - t0) * 1000),
+                "cache": "hit",
+            }
+            return _format_web_results(results), tool_stat
+        if mode == "replay":
+            tool_returned_str = (
+                "[Text Search Results] There was an error performing the search. "
+                "Please reason with your own capabilities or try again later."
+            )
+            tool_stat = {
+                "success": False,
+                "engine": "duckduckgo",
+                "error": "query not in replay cache",
+                "latency_ms": int((time.time() - t0) * 1000),
+                "cache": "replay_miss",
+            }
+            return tool_returned_str, tool_stat
+
+    guard = get_search_guard("web_search")
+    if guard is not None:
+        rejected = guard.admit()
+        if rejected is not None:
+            return _web_search_fallback(text_query, params, cache, rejected, t0)
+
+    ok = False
     try:
         with DDGS() as ddgs:
             results = list(ddgs.text(
@@ -92,26 +259,22 @@ def call_web_text_search(text_query: str) -> Tuple[str, Dict]:
                 backend=backend,
             ))
         latency_ms = int((time.time() - t0) * 1000)
+        # empty answers are often throttling, so only real results are recorded
+        ok = bool(results)
+        if cache is not None and results:
+            cache.put(text_query, params, results)
 
-        if results:
-            lines = []
-            lines.append("[Text Search Results] Below are the text summaries of the most relevant webpages related to your query, ranked in descending order of relevance:")
-            for i, r in enumerate(results, start=1):
-                title = r.get("title") or "No title"
-                body = (r.get("body") or "").strip()
-                if len(body) > 400:  # 避免太长
-                    body = body[:400].rstrip() + "..."
-                lines.append(f"{i}. {title}\n   {body}")
-            tool_returned_str = "\n".join(lines)
-        else:
-            tool_returned_str = "[Text Search Results] No results were found for your query."
-
+        tool_returned_str = _format_web_results(results)
         tool_stat = {
             "success": True,
             "engine": "duckduckgo",
             "num_results": len(results),
             "latency_ms": latency_ms,
         }
+        if cache is not None:
+            tool_stat["cache"] = "miss" if mode == "read_through" else "record"
+        if guard is not None:
+            tool_stat["flow_control"] = {"backend": "web_search", "rejected": None, "fallback": None}
         return tool_returned_str, tool_stat
 
     except Exception as e:
@@ -126,4 +289,10 @@ def call_web_text_search(text_query: str) -> Tuple[str, Dict]:
             "error": str(e),
             "latency_ms": latency_ms,
         }
-        return tool_returned_str, tool_stat
\ No newline at end of file
+        if guard is not None:
+            tool_stat["flow_control"] = {"backend": "web_search", "rejected": None, "fallback": None}
+        return tool_returned_str, tool_stat
+
+    finally:
+        if guard is not None:
+            guard.release(time.time() - t0, ok)
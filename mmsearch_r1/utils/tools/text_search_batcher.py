@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from mmsearch_r1.utils.tools.retrieval_client import RetrievalClient, get_retrieval_client
+
+_batchers: Dict[tuple, "TextSearchBatcher"] = {}
+_batchers_lock = threading.Lock()
+
+
+class TextSearchBatcher:
+    """
+    Process-wide query coalescing for the local retrieval service.
+
+    Rollout threads call `submit(query)` and get a Future back. A background dispatcher thread
+    collects queries until `max_batch_size` are pending or `max_wait_ms` has passed since the
+    first one, sends them as a single multi-query /retrieve request, and resolves each Future
+    with that query's list of {"document", "score"} hits. Up to `max_inflight` batches can be
+    in flight at once, so a slow request does not hold up collection of the next batch.
+    Requests go through the shared RetrievalClient (pooled session, hedging, retries) and ask
+    for compact `max_chars` snippets when it is set (see text_search's `snippets`).
+    """
+
+    def __init__(
+        self,
+        client: RetrievalClient,
+        topk: int,
+        max_chars: Optional[int] = None,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 20.0,
+        max_inflight: int = 4,
+    ):
+        self.client = client
+        self.topk = topk
+        self.max_chars = max_chars
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.num_batches = 0
+        self.num_queries = 0
+
+        self._pending: List[Tuple[str, Future]] = []
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="text-search-batch")
+        self._dispatcher = threading.Thread(target=self._run, name="text-search-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, query: str) -> Future:
+        future = Future()
+        with self._cond:
+            self._pending.append((query, future))
+            self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[: self.max_batch_size]
+                del self._pending[: self.max_batch_size]
+            self._pool.submit(self._flush, batch)
+
+    def _flush(self, batch: List[Tuple[str, Future]]):
+        # identical queries from different trajectories are searched once
+        queries = list(dict.fromkeys(query for query, _ in batch))
+        try:
+            response, info = self.client.post(retrieve_payload(queries, self.topk, self.max_chars))
+            results = dict(zip(queries, response["result"]))
+            info["batch_size"] = len(batch)
+            answers = [(results[query], info) for query, _ in batch]
+        except Exception as e:
+            # every caller must hear back, whatever went wrong
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        with self._cond:
+            self.num_batches += 1
+            self.num_queries += len(batch)
+        for (_, future), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(answer)
+
+    def stats(self) -> dict:
+        return {
+            "num_batches": self.num_batches,
+            "num_queries": self.num_queries,
+            "avg_batch_size": self.num_queries / self.num_batches if self.num_batches else 0.0,
+        }
+
+
+def get_text_search_batcher(
+    retrieval_service_url: str, topk: int, timeout: int, max_chars: Optional[int] = None
+) -> TextSearchBatcher:
+    """Shared batcher per (url, topk, timeout, max_chars); recreated after a fork since threads do not survive it."""
+    key = (os.getpid(), retrieval_service_url, topk, timeout, max_chars)
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            batcher = _batchers[key] = TextSearchBatcher(
+                get_retrieval_client(retrieval_service_url, timeout),
+                topk,
+                max_chars=max_chars,
+                max_batch_size=int(os.getenv("TEXT_SEARCH_BATCH_SIZE", "64")),
+                max_wait_ms=float(os.getenv("TEXT_SEARCH_BATCH_WAIT_MS", "20")),
+            )
+        return batcher
+
+
+def retrieve_payload(queries: List[str], topk: int, max_chars: Optional[int] = None) -> dict:
+    payload = {"queries": queries, "topk": topk, "return_scores": True}
+    if max_chars is not None:
+        # the server then returns compact {"title", "text", "truncated"} snippets instead of full documents
+        payload["max_chars"] = max_chars
+    return payload
+
+
+def api_error_message(error: Exception, max_attempts: int) -> str:
+    """The error text verl's call_search_api reports for `error`, so failed calls read the same to the model."""
+    if isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code >= 500:
+        attempts = getattr(error, "attempts", max_attempts)
+        reason = f"API Request Error: Server Error ({error.response.status_code}) on attempt {attempts}/{max_attempts}"
+    elif isinstance(error, requests.ConnectionError):
+        reason = f"Connection Error: {error}"
+    elif isinstance(error, (requests.Timeout, TimeoutError)):
+        reason = f"Timeout Error: {error}"
+    elif isinstance(error, json.JSONDecodeError):
+        reason = f"API Response JSON Decode Error: {error}"
+    elif isinstance(error, requests.RequestException):
+        reason = f"API Request Error: {error}"
+    else:
+        reason = f"Unexpected Error: {error}"
+    return f"API Call Failed: {reason}"
+
+
+def passages_to_string(retrieval: list, max_chars: Optional[int] = None) -> str:
+    """
+    Same layout as verl's search_r1_like_utils: "Doc i (Title: ...)" followed by the passage text.
+    Accepts full documents ("contents") as well as the server's compact {"title", "text"} snippets;
+    a snippet cut to the same `max_chars` renders byte-for-byte like the full document.
+    """
+    format_reference = ""
+    for idx, doc_item in enumerate(retrieval):
+        document = doc_item["document"]
+        if document is None:
+            continue
+        if "contents" in document:
+            content = document["contents"]
+            title = content.split("\n")[0]
+            text = "\n".join(content.split("\n")[1:])
+            truncated = False
+        else:
+            title = document.get("title", "")
+            text = document.get("text", "")
+            truncated = document.get("truncated", False)
+        if max_chars is not None and (truncated or len(text) > max_chars):
+            text = text[:max_chars] + "..."
+        format_reference += f"Doc {idx + 1} (Title: {title})\n{text}\n\n"
+    return format_reference.strip()
+
+
+def text_search(
+    text_query: str,
+    retrieval_service_url: str,
+    topk: int,
+    timeout: int,
+    max_chars: Optional[int] = None,
+    batched: bool = False,
+    snippets: bool = False,
+) -> Tuple[str, dict]:
+    """
+    Single-query search through the shared RetrievalClient, either on its own or coalesced with
+    other threads' queries by the shared batcher. Returns the same (result_text, metadata) as
+    verl's perform_single_search_batch, byte-for-byte in result_text, plus the call info
+    (replica, hedged, attempts, latency_ms, batch_size when batched) and the client's latency
+    distribution under "latency". Passages are cut to `max_chars` here; with `snippets` the server
+    already returns them cut (compact {"title", "text"} snippets, smaller responses), which
+    formats identically.
+    """
+    metadata = {
+        "query_count": 1,
+        "queries": [text_query],
+        "api_request_error": None,
+        "status": "unknown",
+        "total_results": 0,
+        "formatted_result": None,
+    }
+    server_max_chars = max_chars if snippets else None
+    client = get_retrieval_client(retrieval_service_url, timeout)
+    try:
+        if batched:
+            batcher = get_text_search_batcher(retrieval_service_url, topk, timeout, max_chars=server_max_chars)
+            try:
+                # the batch's client call has its own deadline; this also bounds time queued behind other batches
+                retrieval, info = batcher.submit(text_query).result(timeout=timeout)
+            except FutureTimeoutError:
+                raise TimeoutError(f"no batched answer within {timeout}s")
+            raw_results = [retrieval]
+        else:
+            response, info = client.post(retrieve_payload([text_query], topk, server_max_chars))
+            raw_results = response.get("result", [])
+    except Exception as e:
+        metadata["status"] = "api_error"
+        metadata["api_request_error"] = api_error_message(e, client.max_retries + 1)
+        metadata["latency"] = client.latency_stats()
+        return json.dumps({"result": f"Search error: {metadata['api_request_error']}"}), metadata
+
+    metadata.update(info)
+    metadata["latency"] = client.latency_stats()
+    if not raw_results:
+        metadata["status"] = "no_results"
+        return json.dumps({"result": "No search results found."}), metadata
+    try:
+        formatted = "\n---\n".join(passages_to_string(retrieval, max_chars=max_chars) for retrieval in raw_results)
+    except Exception as e:
+        metadata["status"] = "processing_error"
+        return json.dumps({"result": f"Error processing search results: {e}"}), metadata
+    metadata["status"] = "success"
+    metadata["total_results"] = sum(len(retrieval) if isinstance(retrieval, list) else 1 for retrieval in raw_results)
+    metadata["formatted_result"] = formatted
+    return json.dumps({"result": formatted}), metadata
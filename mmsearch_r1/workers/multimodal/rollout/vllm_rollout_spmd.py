@@ -37,6 +37,7 @@ from verl.workers.rollout.vllm_rollout.vllm_rollout_spmd import (
     vLLMRollout,
 )
 
+from mmsearch_r1.utils.tools.flow_control import flow_control_sample_stats
 from mmsearch_r1.utils.tools.image_search import call_image_search
 from mmsearch_r1.utils.tools.text_search import call_text_search
 from mmsearch_r1.utils.tools.text_search import call_web_text_search
@@ -174,6 +175,8 @@ class vLLMRollout_MultiTurn_MMSearch_R1(vLLMRollout):
         max_image_gen_round = self.config.search.image_search_limit # Image Search Constraint
         id_text_gen_cnt = [0] * (batch_size * n)
         max_text_gen_round = self.config.search.text_search_limit # Text Search Constraint
+        # tool_stats of every search call per trajectory, summarized into non_tensor_batch['search_flow_control']
+        sample_tool_stats = [[] for _ in range(batch_size * n)]
         # Add pbar for better monitoring
         with tqdm(total=worker_trajs_count, desc="Worker Rollout Progress", unit="task") as pbar:
             current_iteration = 0
@@ -344,6 +347,9 @@ class vLLMRollout_MultiTurn_MMSearch_R1(vLLMRollout):
                     search_result = [f.result() for f in search_call_futures]
                     ############################################## parallel implementation #############################################
 
+                for i_todo, (_, _, tool_stat) in zip(to_generate, search_result):
+                    sample_tool_stats[i_todo].append(tool_stat)
+
                 # [Process Search Results]
                 to_generate_ = to_generate.copy()  # make a copy since we will be modifying to_generate
                 assert len(to_generate_) == len(
@@ -557,4 +563,8 @@ class vLLMRollout_MultiTurn_MMSearch_R1(vLLMRollout):
             self.inference_engine.free_cache_engine()
 
         print(f">>> vllm_rollout_spmd Rollout Ends ...")
+        # per sample rather than in meta_info, which keeps only the first worker's copy when gathered
+        non_tensor_batch['search_flow_control'] = np.array(
+            [flow_control_sample_stats(tool_stats) for tool_stats in sample_tool_stats], dtype=object
+        )
         return DataProto(batch=batch, non_tensor_batch=non_tensor_batch)